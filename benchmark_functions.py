@@ -0,0 +1,1003 @@
+# The functions in this file implement a small benchmark suite for the
+# functions which are executed for every page and whose running time depends
+# on the contents of the page (the so-called hot paths of the algorithm). The
+# suite is run with run_benchmarks.py.
+
+# The benchmarked functions are not run on synthetic data, but on the actual
+# intermediate results of the algorithm for real pages. These so-called
+# benchmark inputs are computed from the page images by running the first
+# steps of the algorithm (see compute_benchmark_inputs). Since this includes
+# the line segment detection, which is slow, the benchmark inputs can be
+# recorded into .npz files and loaded from there in later runs, which also
+# guarantees that the benchmarks are always run on exactly the same inputs.
+
+# Each benchmark is represented by a list [benchmark_name, benchmark_function],
+# where benchmark_function takes the benchmark inputs of a page and calls the
+# benchmarked function once. A benchmark is run by calling it for every page a
+# few times (see run_benchmark). The time per call and the peak amount of
+# memory allocated during a call are reported. The memory is measured with
+# tracemalloc, which sees the memory allocated by Python and numpy, but not the
+# memory allocated internally by cv2.
+
+# The results of a benchmark run are represented by a dictionary mapping
+# benchmark names to dictionaries of the form
+# {'calls': number_of_calls,
+#  'time_per_call': median_time_per_call,
+#  'min_time_per_call': minimum_time_per_call,
+#  'peak_memory': peak_memory}.
+# The results can be saved as a baseline file (a JSON file) and later runs can
+# be compared with the baseline (see compare_benchmark_results).
+
+import numpy as np
+import cv2 as cv
+import statistics
+import tracemalloc
+import json
+import time
+import os
+
+import analysis_functions
+import general_computer_vision_functions
+import geometric_array_operations
+import geometric_operations
+import instrumentation_functions
+import lsd_line_functions
+import main_computer_vision_functions
+import main_test_functions
+import numpy_array_operations
+import utilities
+
+# The attributes of an lsd_line that are recorded in the benchmark inputs.
+
+LSD_LINE_ATTRIBUTES = ['startPointX',
+                       'startPointY',
+                       'endPointX',
+                       'endPointY',
+                       'angle',
+                       'octave']
+
+# The following two functions convert a list of lsd_lines into a numpy array
+# and back, so that lsd_lines can be recorded into an .npz file. Only the
+# attributes used by the algorithm are recorded.
+
+def convert_lsd_lines_to_array(lsd_lines):
+    lsd_line_array = np.array(
+        [[getattr(lsd_line, attribute) for attribute in LSD_LINE_ATTRIBUTES]
+         for lsd_line in lsd_lines],
+        np.float32
+    ).reshape(-1, len(LSD_LINE_ATTRIBUTES))
+    return lsd_line_array
+
+def convert_array_to_lsd_lines(lsd_line_array):
+    lsd_lines = []
+    for row in lsd_line_array:
+        lsd_line = cv.line_descriptor.KeyLine()
+        for attribute, value in zip(LSD_LINE_ATTRIBUTES, row):
+            if attribute == 'octave':
+                value = int(value)
+            setattr(lsd_line, attribute, value)
+        lsd_lines.append(lsd_line)
+    return lsd_lines
+
+# The function below computes the benchmark inputs of a page, i.e., a
+# dictionary of numpy arrays containing the intermediate results needed by the
+# benchmarks. The steps of the algorithm are repeated here in the same way as
+# in detect_horizontal_or_vertical_table_lines, detect_table_structure and
+# detect_table_elements (see main_computer_vision_functions.py).
+
+# The arguments are the same as those of detect_table_structure_and_elements.
+
+def compute_benchmark_inputs(image,
+                             table_structure_detection_arguments,
+                             table_element_detection_arguments):
+    (num_octaves,
+     horizontal_line_length_lower_bound,
+     vertical_line_length_lower_bound,
+     sin_upper_bound,
+     cos_upper_bound,
+     right_extra_length,
+     bottom_extra_length,
+     horizontal_rectangle_length_lower_bound,
+     vertical_rectangle_length_lower_bound) = (
+        table_structure_detection_arguments[:9]
+    )
+    lsd_line_detector = main_computer_vision_functions.get_lsd_line_detector()
+    lsd_lines = lsd_line_detector.detect(
+        image,
+        main_computer_vision_functions.LSD_LINE_DETECTOR_SCALE,
+        num_octaves,
+        np.ones_like(image)
+    )
+    lsd_line_arrays = lsd_line_functions.create_lsd_line_arrays(lsd_lines)
+    benchmark_inputs = {
+        'image_shape': np.array(image.shape),
+        'lsd_lines': convert_lsd_lines_to_array(lsd_lines)
+    }
+    direction_arguments = [
+        ['horizontal',
+         True,
+         dict(length_lower_bound=horizontal_line_length_lower_bound,
+              sin_upper_bound=sin_upper_bound),
+         dict(right_extra_length=right_extra_length),
+         dict(horizontal_length_lower_bound
+              =horizontal_rectangle_length_lower_bound)],
+        ['vertical',
+         False,
+         dict(length_lower_bound=vertical_line_length_lower_bound,
+              cos_upper_bound=cos_upper_bound),
+         dict(bottom_extra_length=bottom_extra_length),
+         dict(vertical_length_lower_bound
+              =vertical_rectangle_length_lower_bound)]
+    ]
+    table_line_lists = []
+    for (direction,
+         detect_horizontal_lines,
+         filter_arguments,
+         extra_length_arguments,
+         rectangle_filter_arguments) in direction_arguments:
+        filtered_lsd_line_arrays = lsd_line_functions.filter_lsd_line_arrays(
+            lsd_line_arrays,
+            **filter_arguments
+        )
+        lsd_lines_image = np.zeros_like(image)
+        lsd_line_functions.draw_lsd_line_arrays(
+            lsd_lines_image,
+            filtered_lsd_line_arrays,
+            main_computer_vision_functions.LSD_LINES_IMAGE_COLOR,
+            main_computer_vision_functions.LSD_LINES_IMAGE_THICKNESS
+        )
+        lsd_lines_component_parameters = (
+            general_computer_vision_functions
+            .compute_connected_component_parameters(lsd_lines_image)
+        )
+        lsd_lines_component_rectangles = (
+            general_computer_vision_functions
+            .compute_connected_component_rectangles(
+                image,
+                lsd_lines_component_parameters,
+                **extra_length_arguments
+            )
+        )
+        lsd_lines_component_rectangles_image = np.zeros_like(image)
+        utilities.draw_rectangles(
+            lsd_lines_component_rectangles_image,
+            lsd_lines_component_rectangles,
+            main_computer_vision_functions
+            .LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
+            main_computer_vision_functions
+            .LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+        )
+        rectangle_component_parameters = (
+            general_computer_vision_functions
+            .compute_connected_component_parameters(
+                lsd_lines_component_rectangles_image
+            )
+        )
+        rectangle_component_rectangles = (
+            general_computer_vision_functions
+            .compute_connected_component_rectangles(
+                image,
+                rectangle_component_parameters
+            )
+        )
+        rectangle_component_rectangles = geometric_operations.filter_rectangles(
+            rectangle_component_rectangles,
+            **rectangle_filter_arguments
+        )
+        table_lines = (
+            geometric_operations
+            .compute_horizontal_or_vertical_lines_using_rectangles(
+                lsd_lines_image,
+                rectangle_component_rectangles,
+                detect_horizontal_lines
+            )
+        )
+        table_line_lists.append(table_lines)
+        benchmark_inputs.update({
+            direction + '_lsd_lines_image': lsd_lines_image,
+            direction + '_component_rectangle_descriptions':
+                lsd_lines_component_parameters[2],
+            direction + '_rectangles':
+                np.array(rectangle_component_rectangles).reshape(-1, 2, 2),
+            direction + '_table_lines':
+                np.array(table_lines).reshape(-1, 2, 2)
+        })
+    table_lines = table_line_lists[0] + table_line_lists[1]
+    table_element_component_parameters = (
+        main_computer_vision_functions.detect_table_elements(
+            image,
+            table_lines,
+            *table_element_detection_arguments[:2]
+        )[0]
+    )
+    benchmark_inputs.update({
+        'element_label_array': table_element_component_parameters[1],
+        'element_rectangle_descriptions': table_element_component_parameters[2]
+    })
+    return benchmark_inputs
+
+# The following two functions save and load the benchmark inputs of a page.
+
+def save_benchmark_inputs(benchmark_inputs, path):
+    np.savez_compressed(path, **benchmark_inputs)
+
+def load_benchmark_inputs(path):
+    with np.load(path) as benchmark_input_file:
+        benchmark_inputs = {name: benchmark_input_file[name]
+                            for name in benchmark_input_file.files}
+    return benchmark_inputs
+
+# The function below converts the arrays of the benchmark inputs into the data
+# structures expected by the benchmarked functions (lists of lsd_lines, lists
+# and arrays of rectangles, lists of lines etc.). The conversions are done
+# before the benchmarks are run, so that they are not included in the
+# measurements.
+
+def prepare_benchmark_inputs(benchmark_inputs):
+    height, width = benchmark_inputs['image_shape'][:2]
+    prepared_inputs = {
+        'image': np.zeros([height, width], np.uint8),
+        'lsd_lines': convert_array_to_lsd_lines(benchmark_inputs['lsd_lines']),
+        'element_label_array': benchmark_inputs['element_label_array'],
+        'element_component_parameters': [
+            None,
+            None,
+            benchmark_inputs['element_rectangle_descriptions'],
+            None
+        ]
+    }
+    prepared_inputs['lsd_line_arrays'] = (
+        lsd_line_functions.create_lsd_line_arrays(prepared_inputs['lsd_lines'])
+    )
+    for direction in ['horizontal', 'vertical']:
+        prepared_inputs.update({
+            direction + '_lsd_lines_image':
+                benchmark_inputs[direction + '_lsd_lines_image'],
+            direction + '_component_parameters': [
+                None,
+                None,
+                benchmark_inputs[direction + '_component_rectangle_descriptions'],
+                None
+            ],
+            direction + '_rectangles':
+                benchmark_inputs[direction + '_rectangles'].tolist(),
+            direction + '_rectangle_array':
+                benchmark_inputs[direction + '_rectangles'].astype(np.int32),
+            direction + '_table_lines':
+                benchmark_inputs[direction + '_table_lines'].tolist()
+        })
+    image = prepared_inputs['image']
+    prepared_inputs['element_rectangles'] = (
+        general_computer_vision_functions
+        .compute_connected_component_rectangles(
+            image,
+            prepared_inputs['element_component_parameters']
+        )
+    )
+    prepared_inputs['y_means'] = (
+        analysis_functions.compute_sorted_mean_coordinates(
+            prepared_inputs['horizontal_table_lines'],
+            lines_are_horizontal=True
+        )
+    )
+    prepared_inputs['x_means'] = (
+        analysis_functions.compute_sorted_mean_coordinates(
+            prepared_inputs['vertical_table_lines'],
+            lines_are_horizontal=False
+        )
+    )
+    return prepared_inputs
+
+# The function below constructs the list of benchmarks. The arguments are the
+# same as those of detect_table_structure_and_elements, and they give the
+# parameter values used by the benchmarked functions.
+
+def construct_benchmarks(table_structure_detection_arguments):
+    (_,
+     horizontal_line_length_lower_bound,
+     vertical_line_length_lower_bound,
+     sin_upper_bound,
+     cos_upper_bound,
+     right_extra_length,
+     bottom_extra_length) = table_structure_detection_arguments[:7]
+    benchmarks = [
+        ['filter_lsd_lines/horizontal',
+         lambda inputs: lsd_line_functions.filter_lsd_lines(
+             inputs['lsd_lines'],
+             length_lower_bound=horizontal_line_length_lower_bound,
+             sin_upper_bound=sin_upper_bound
+         )],
+        ['filter_lsd_lines/vertical',
+         lambda inputs: lsd_line_functions.filter_lsd_lines(
+             inputs['lsd_lines'],
+             length_lower_bound=vertical_line_length_lower_bound,
+             cos_upper_bound=cos_upper_bound
+         )],
+        ['create_lsd_line_arrays',
+         lambda inputs: lsd_line_functions.create_lsd_line_arrays(
+             inputs['lsd_lines']
+         )],
+        ['filter_lsd_line_arrays/horizontal',
+         lambda inputs: lsd_line_functions.filter_lsd_line_arrays(
+             inputs['lsd_line_arrays'],
+             length_lower_bound=horizontal_line_length_lower_bound,
+             sin_upper_bound=sin_upper_bound
+         )],
+        ['filter_lsd_line_arrays/vertical',
+         lambda inputs: lsd_line_functions.filter_lsd_line_arrays(
+             inputs['lsd_line_arrays'],
+             length_lower_bound=vertical_line_length_lower_bound,
+             cos_upper_bound=cos_upper_bound
+         )],
+        ['compute_connected_component_rectangles/horizontal',
+         lambda inputs: general_computer_vision_functions
+         .compute_connected_component_rectangles(
+             inputs['image'],
+             inputs['horizontal_component_parameters'],
+             right_extra_length=right_extra_length
+         )],
+        ['compute_connected_component_rectangles/vertical',
+         lambda inputs: general_computer_vision_functions
+         .compute_connected_component_rectangles(
+             inputs['image'],
+             inputs['vertical_component_parameters'],
+             bottom_extra_length=bottom_extra_length
+         )],
+        ['compute_connected_component_rectangle_array/horizontal',
+         lambda inputs: geometric_array_operations
+         .compute_connected_component_rectangle_array(
+             inputs['image'].shape,
+             inputs['horizontal_component_parameters'],
+             right_extra_length=right_extra_length
+         )],
+        ['compute_connected_component_rectangle_array/vertical',
+         lambda inputs: geometric_array_operations
+         .compute_connected_component_rectangle_array(
+             inputs['image'].shape,
+             inputs['vertical_component_parameters'],
+             bottom_extra_length=bottom_extra_length
+         )],
+        ['merge_rectangle_array/horizontal',
+         lambda inputs: geometric_array_operations.merge_rectangle_array(
+             geometric_array_operations
+             .compute_connected_component_rectangle_array(
+                 inputs['image'].shape,
+                 inputs['horizontal_component_parameters'],
+                 right_extra_length=right_extra_length
+             ),
+             inputs['image'].shape
+         )],
+        ['merge_rectangle_array/vertical',
+         lambda inputs: geometric_array_operations.merge_rectangle_array(
+             geometric_array_operations
+             .compute_connected_component_rectangle_array(
+                 inputs['image'].shape,
+                 inputs['vertical_component_parameters'],
+                 bottom_extra_length=bottom_extra_length
+             ),
+             inputs['image'].shape
+         )],
+        ['merge_rectangle_array_by_drawing/horizontal',
+         lambda inputs: main_computer_vision_functions
+         .merge_rectangle_array_by_drawing(
+             geometric_array_operations
+             .compute_connected_component_rectangle_array(
+                 inputs['image'].shape,
+                 inputs['horizontal_component_parameters'],
+                 right_extra_length=right_extra_length
+             ),
+             inputs['image'].shape
+         )],
+        ['merge_rectangle_array_by_drawing/vertical',
+         lambda inputs: main_computer_vision_functions
+         .merge_rectangle_array_by_drawing(
+             geometric_array_operations
+             .compute_connected_component_rectangle_array(
+                 inputs['image'].shape,
+                 inputs['vertical_component_parameters'],
+                 bottom_extra_length=bottom_extra_length
+             ),
+             inputs['image'].shape
+         )],
+        # The chaining benchmarks include the filtering of the lsd_lines,
+        # which is measured separately above.
+        ['chain_lsd_line_arrays/horizontal',
+         lambda inputs: main_computer_vision_functions.chain_lsd_line_arrays(
+             inputs['image'].shape,
+             lsd_line_functions.filter_lsd_line_arrays(
+                 inputs['lsd_line_arrays'],
+                 length_lower_bound=horizontal_line_length_lower_bound,
+                 sin_upper_bound=sin_upper_bound
+             ),
+             True,
+             right_extra_length=right_extra_length
+         )],
+        ['chain_lsd_line_arrays/vertical',
+         lambda inputs: main_computer_vision_functions.chain_lsd_line_arrays(
+             inputs['image'].shape,
+             lsd_line_functions.filter_lsd_line_arrays(
+                 inputs['lsd_line_arrays'],
+                 length_lower_bound=vertical_line_length_lower_bound,
+                 cos_upper_bound=cos_upper_bound
+             ),
+             False,
+             bottom_extra_length=bottom_extra_length
+         )],
+        ['compute_connected_component_rectangles/elements',
+         lambda inputs: general_computer_vision_functions
+         .compute_connected_component_rectangles(
+             inputs['image'],
+             inputs['element_component_parameters']
+         )],
+        ['compute_horizontal_or_vertical_lines_using_rectangles/horizontal',
+         lambda inputs: geometric_operations
+         .compute_horizontal_or_vertical_lines_using_rectangles(
+             inputs['horizontal_lsd_lines_image'],
+             inputs['horizontal_rectangles'],
+             True
+         )],
+        ['compute_horizontal_or_vertical_lines_using_rectangles/vertical',
+         lambda inputs: geometric_operations
+         .compute_horizontal_or_vertical_lines_using_rectangles(
+             inputs['vertical_lsd_lines_image'],
+             inputs['vertical_rectangles'],
+             False
+         )],
+        ['compute_horizontal_or_vertical_lines_using_rectangle_array/'
+         'horizontal',
+         lambda inputs: geometric_operations
+         .compute_horizontal_or_vertical_lines_using_rectangle_array(
+             inputs['horizontal_lsd_lines_image'],
+             inputs['horizontal_rectangle_array'],
+             True
+         )],
+        ['compute_horizontal_or_vertical_lines_using_rectangle_array/'
+         'vertical',
+         lambda inputs: geometric_operations
+         .compute_horizontal_or_vertical_lines_using_rectangle_array(
+             inputs['vertical_lsd_lines_image'],
+             inputs['vertical_rectangle_array'],
+             False
+         )],
+        ['compute_horizontal_or_vertical_lines_using_line_segment_array/'
+         'horizontal',
+         lambda inputs: geometric_operations
+         .compute_horizontal_or_vertical_lines_using_line_segment_array(
+             inputs['horizontal_rectangle_array'],
+             lsd_line_functions.compute_lsd_line_array_points(
+                 lsd_line_functions.filter_lsd_line_arrays(
+                     inputs['lsd_line_arrays'],
+                     length_lower_bound=horizontal_line_length_lower_bound,
+                     sin_upper_bound=sin_upper_bound
+                 )
+             ),
+             True
+         )],
+        ['compute_horizontal_or_vertical_lines_using_line_segment_array/'
+         'vertical',
+         lambda inputs: geometric_operations
+         .compute_horizontal_or_vertical_lines_using_line_segment_array(
+             inputs['vertical_rectangle_array'],
+             lsd_line_functions.compute_lsd_line_array_points(
+                 lsd_line_functions.filter_lsd_line_arrays(
+                     inputs['lsd_line_arrays'],
+                     length_lower_bound=vertical_line_length_lower_bound,
+                     cos_upper_bound=cos_upper_bound
+                 )
+             ),
+             False
+         )],
+        ['construct_compressed_array',
+         lambda inputs: numpy_array_operations.construct_compressed_array(
+             inputs['element_label_array']
+         )],
+        ['determine_table_element_cell_positions',
+         lambda inputs: analysis_functions
+         .determine_table_element_cell_positions(
+             inputs['element_rectangles'],
+             inputs['y_means'],
+             inputs['x_means']
+         )]
+    ]
+    return benchmarks
+
+# The following function runs a single benchmark. The benchmark is first
+# called once for every page without measurements (a warm-up round), and then
+# number_of_repeats times for every page with time measurements. Finally, the
+# benchmark is called once more for every page with tracemalloc running, so
+# that the time measurements are not disturbed by the memory tracing.
+
+def run_benchmark(benchmark_function, page_inputs, number_of_repeats):
+    for inputs in page_inputs:
+        benchmark_function(inputs)
+    times_per_call = []
+    for _ in range(number_of_repeats):
+        start_time = time.perf_counter()
+        for inputs in page_inputs:
+            benchmark_function(inputs)
+        total_time = time.perf_counter() - start_time
+        times_per_call.append(total_time / len(page_inputs))
+    peak_memory = 0
+    tracemalloc.start()
+    try:
+        for inputs in page_inputs:
+            tracemalloc.reset_peak()
+            memory_before_call = tracemalloc.get_traced_memory()[0]
+            benchmark_function(inputs)
+            peak_memory = max(peak_memory,
+                              tracemalloc.get_traced_memory()[1]
+                              - memory_before_call)
+    finally:
+        tracemalloc.stop()
+    benchmark_result = {'calls': len(page_inputs),
+                        'time_per_call': statistics.median(times_per_call),
+                        'min_time_per_call': min(times_per_call),
+                        'peak_memory': peak_memory}
+    return benchmark_result
+
+# The function below runs the given benchmarks and prints the results. If
+# benchmark_names is not None, only the benchmarks whose names start with one
+# of the given names are run.
+
+def run_benchmarks(benchmarks,
+                   page_inputs,
+                   number_of_repeats,
+                   benchmark_names=None):
+    benchmark_results = {}
+    for benchmark_name, benchmark_function in benchmarks:
+        if benchmark_names is not None:
+            if not benchmark_name.startswith(tuple(benchmark_names)):
+                continue
+        benchmark_result = run_benchmark(benchmark_function,
+                                         page_inputs,
+                                         number_of_repeats)
+        benchmark_results[benchmark_name] = benchmark_result
+        print('{}: {:.3f}ms per call (min {:.3f}ms), peak memory {:.1f}kB'
+              .format(benchmark_name,
+                      benchmark_result['time_per_call'] * 1000,
+                      benchmark_result['min_time_per_call'] * 1000,
+                      benchmark_result['peak_memory'] / 1024))
+    print()
+    return benchmark_results
+
+# The function below collects the benchmark inputs of the pages in data_dir. If
+# recorded_inputs_dir is not None, the benchmark inputs recorded there are
+# used, and the inputs of pages that have not been recorded yet are computed
+# and recorded. The pages are listed in the same way as in
+# multiple_logbooks_test. If max_pages_per_logbook is not None, only the given
+# number of pages of each logbook are used.
+
+def collect_page_inputs(data_dir,
+                        recorded_inputs_dir,
+                        table_structure_detection_arguments,
+                        table_element_detection_arguments,
+                        max_pages_per_logbook=None):
+    page_inputs = []
+    if recorded_inputs_dir is not None:
+        os.makedirs(recorded_inputs_dir, exist_ok=True)
+    for logbook in sorted(main_test_functions.construct_document_list(data_dir)):
+        page_file_list = main_test_functions.construct_page_file_list(logbook,
+                                                                      data_dir)
+        if max_pages_per_logbook is not None:
+            page_file_list = page_file_list[:max_pages_per_logbook]
+        for image_file in page_file_list:
+            if recorded_inputs_dir is not None:
+                recorded_inputs_path = os.path.join(
+                    recorded_inputs_dir,
+                    '{}_{}.npz'.format(logbook,
+                                       os.path.splitext(image_file)[0])
+                )
+            else:
+                recorded_inputs_path = None
+            if (recorded_inputs_path is not None
+                    and os.path.isfile(recorded_inputs_path)):
+                benchmark_inputs = load_benchmark_inputs(recorded_inputs_path)
+            else:
+                print('Computing benchmark inputs: {}/{}'.format(logbook,
+                                                                 image_file))
+                image = utilities.load_image(
+                    os.path.join(data_dir, logbook, image_file),
+                    grayscale=True
+                )
+                benchmark_inputs = compute_benchmark_inputs(
+                    image,
+                    table_structure_detection_arguments,
+                    table_element_detection_arguments
+                )
+                if recorded_inputs_path is not None:
+                    save_benchmark_inputs(benchmark_inputs,
+                                          recorded_inputs_path)
+            page_inputs.append(prepare_benchmark_inputs(benchmark_inputs))
+    return page_inputs
+
+# The following three functions save, load and compare the benchmark results.
+# A benchmark has regressed if its time per call or its peak memory exceeds the
+# baseline value by more than the fraction regression_threshold. The
+# comparison is printed, and the return value is the list of the names of the
+# regressed benchmarks. Benchmarks missing from the baseline are only printed.
+
+def save_benchmark_results(benchmark_results, path):
+    with open(path, 'w') as baseline_file:
+        json.dump(benchmark_results, baseline_file, indent=1, sort_keys=True)
+
+def load_benchmark_results(path):
+    with open(path) as baseline_file:
+        benchmark_results = json.load(baseline_file)
+    return benchmark_results
+
+def compare_benchmark_results(benchmark_results,
+                              baseline_results,
+                              regression_threshold):
+    regressed_benchmarks = []
+    for benchmark_name, benchmark_result in benchmark_results.items():
+        if benchmark_name not in baseline_results:
+            print('{}: not in the baseline'.format(benchmark_name))
+            continue
+        baseline_result = baseline_results[benchmark_name]
+        comparison_strings = []
+        regressed = False
+        for key in ['time_per_call', 'peak_memory']:
+            value = benchmark_result[key]
+            baseline_value = baseline_result[key]
+            if baseline_value > 0:
+                ratio = value / baseline_value
+            else:
+                ratio = 1.0 if value == 0 else float('inf')
+            comparison_strings.append('{} {:.2f}x'.format(key, ratio))
+            if ratio > 1 + regression_threshold:
+                regressed = True
+        status = 'REGRESSION' if regressed else 'ok'
+        print('{}: {} ({})'.format(benchmark_name,
+                                   status,
+                                   ', '.join(comparison_strings)))
+        if regressed:
+            regressed_benchmarks.append(benchmark_name)
+    print()
+    return regressed_benchmarks
+
+# The functions below implement a separate benchmark for the tiled line
+# segment detection (see detect_lsd_lines in main_computer_vision_functions.py),
+# which is run with run_lsd_tiling_benchmark.py. For each page and each tile
+# size, the benchmark measures the speed-up of the tiled detection compared
+# with the detection in the whole page, and the agreement of the results of
+# the two detections. Since the tiled detection is faster only if the tiles
+# are processed in parallel, the page thread pool should be used (see
+# set_num_page_threads).
+
+# The agreement of two sets of lines is measured in the way the algorithm uses
+# the lines: the lines are drawn with the given thickness, and the recall is
+# the fraction of the pixels of the reference lines (drawn with thickness 1)
+# covered by the thick lines, and the precision is the fraction of the pixels
+# of the lines covered by the thick reference lines. The agreement is measured
+# both for the lsd_lines which pass the filters of
+# detect_horizontal_or_vertical_table_lines and for the resulting table lines.
+
+def compute_line_set_agreement(image_shape, lines, reference_lines, thickness):
+    def compute_coverage(covered_lines, covering_lines):
+        covered_lines_image = np.zeros(image_shape, dtype=np.uint8)
+        utilities.draw_lines(covered_lines_image, covered_lines, 255, 1)
+        covering_lines_image = np.zeros(image_shape, dtype=np.uint8)
+        utilities.draw_lines(covering_lines_image,
+                             covering_lines,
+                             255,
+                             thickness)
+        num_covered_pixels = np.count_nonzero(covered_lines_image)
+        if num_covered_pixels == 0:
+            return 1.0
+        num_covering_pixels = np.count_nonzero(covered_lines_image
+                                               & covering_lines_image)
+        return num_covering_pixels / num_covered_pixels
+    recall = compute_coverage(reference_lines, lines)
+    precision = compute_coverage(lines, reference_lines)
+    return [recall, precision]
+
+# The following function computes the lsd_lines which pass the filters and the
+# table lines from the lsd_lines of a page. The arguments are the same as
+# those of detect_table_structure_and_elements.
+
+def compute_filtered_lines_and_table_lines(image,
+                                           lsd_lines,
+                                           table_structure_detection_arguments):
+    (_,
+     horizontal_line_length_lower_bound,
+     vertical_line_length_lower_bound,
+     sin_upper_bound,
+     cos_upper_bound,
+     right_extra_length,
+     bottom_extra_length,
+     horizontal_rectangle_length_lower_bound,
+     vertical_rectangle_length_lower_bound) = (
+        table_structure_detection_arguments[:9]
+    )
+    lsd_line_arrays = lsd_line_functions.create_lsd_line_arrays(lsd_lines)
+    filtered_lines = []
+    for filter_arguments in [
+            dict(length_lower_bound=horizontal_line_length_lower_bound,
+                 sin_upper_bound=sin_upper_bound),
+            dict(length_lower_bound=vertical_line_length_lower_bound,
+                 cos_upper_bound=cos_upper_bound)]:
+        filtered_lsd_line_arrays = lsd_line_functions.filter_lsd_line_arrays(
+            lsd_line_arrays,
+            **filter_arguments
+        )
+        filtered_lines.extend(
+            lsd_line_functions.compute_lsd_line_array_points(
+                filtered_lsd_line_arrays
+            ).tolist()
+        )
+    horizontal_table_lines = (
+        main_computer_vision_functions
+        .detect_horizontal_or_vertical_table_lines(
+            image,
+            lsd_line_arrays,
+            detect_horizontal_lines=True,
+            line_length_lower_bound=horizontal_line_length_lower_bound,
+            sin_upper_bound=sin_upper_bound,
+            right_extra_length=right_extra_length,
+            rectangle_length_lower_bound=horizontal_rectangle_length_lower_bound
+        )[0]
+    )
+    vertical_table_lines = (
+        main_computer_vision_functions
+        .detect_horizontal_or_vertical_table_lines(
+            image,
+            lsd_line_arrays,
+            detect_horizontal_lines=False,
+            line_length_lower_bound=vertical_line_length_lower_bound,
+            cos_upper_bound=cos_upper_bound,
+            bottom_extra_length=bottom_extra_length,
+            rectangle_length_lower_bound=vertical_rectangle_length_lower_bound
+        )[0]
+    )
+    table_lines = horizontal_table_lines + vertical_table_lines
+    return filtered_lines, table_lines
+
+# The function below runs the tiled detection benchmark for the pages in
+# data_dir (listed in the same way as in collect_page_inputs) and prints the
+# results of each page and the averages over the pages. Each detection is run
+# number_of_repeats times, and the median time is used.
+
+def run_lsd_tiling_benchmark(data_dir,
+                             table_structure_detection_arguments,
+                             tile_sizes,
+                             tile_overlap,
+                             number_of_repeats,
+                             max_pages_per_logbook=None):
+    num_octaves = table_structure_detection_arguments[0]
+    def measure_detection(image, tile_size):
+        detection_times = []
+        for _ in range(number_of_repeats):
+            start_time = time.perf_counter()
+            lsd_lines = main_computer_vision_functions.detect_lsd_lines(
+                image,
+                num_octaves,
+                tile_size,
+                tile_overlap
+            )
+            detection_times.append(time.perf_counter() - start_time)
+        return statistics.median(detection_times), lsd_lines
+    thickness = main_computer_vision_functions.LSD_LINES_IMAGE_THICKNESS
+    tile_size_results = {tile_size: [] for tile_size in tile_sizes}
+    for logbook in sorted(main_test_functions.construct_document_list(data_dir)):
+        page_file_list = main_test_functions.construct_page_file_list(logbook,
+                                                                      data_dir)
+        if max_pages_per_logbook is not None:
+            page_file_list = page_file_list[:max_pages_per_logbook]
+        for image_file in page_file_list:
+            image = utilities.load_image(
+                os.path.join(data_dir, logbook, image_file),
+                grayscale=True
+            )
+            whole_page_time, lsd_lines = measure_detection(image, 0)
+            reference_filtered_lines, reference_table_lines = (
+                compute_filtered_lines_and_table_lines(
+                    image,
+                    lsd_lines,
+                    table_structure_detection_arguments
+                )
+            )
+            print('{}/{}: whole page {:.3f}s'.format(logbook,
+                                                     image_file,
+                                                     whole_page_time))
+            for tile_size in tile_sizes:
+                tiled_time, lsd_lines = measure_detection(image, tile_size)
+                filtered_lines, table_lines = (
+                    compute_filtered_lines_and_table_lines(
+                        image,
+                        lsd_lines,
+                        table_structure_detection_arguments
+                    )
+                )
+                page_result = [
+                    whole_page_time / tiled_time,
+                    *compute_line_set_agreement(image.shape,
+                                                filtered_lines,
+                                                reference_filtered_lines,
+                                                thickness),
+                    *compute_line_set_agreement(image.shape,
+                                                table_lines,
+                                                reference_table_lines,
+                                                thickness)
+                ]
+                tile_size_results[tile_size].append(page_result)
+                print('    tile size {}: '.format(tile_size)
+                      + format_lsd_tiling_result(tiled_time, page_result))
+    print()
+    print('Averages over the pages:')
+    for tile_size, page_results in tile_size_results.items():
+        if not page_results:
+            continue
+        average_result = np.mean(page_results, axis=0)
+        print('    tile size {}: '.format(tile_size)
+              + format_lsd_tiling_result(None, average_result))
+    print()
+    return tile_size_results
+
+def format_lsd_tiling_result(tiled_time, lsd_tiling_result):
+    (speed_up,
+     lsd_line_recall,
+     lsd_line_precision,
+     table_line_recall,
+     table_line_precision) = lsd_tiling_result
+    result_string = ''
+    if tiled_time is not None:
+        result_string += '{:.3f}s, '.format(tiled_time)
+    result_string += (
+        'speed-up {:.2f}x, '.format(speed_up)
+        + 'lsd_lines recall {:.3f} precision {:.3f}, '.format(
+            lsd_line_recall,
+            lsd_line_precision
+        )
+        + 'table lines recall {:.3f} precision {:.3f}'.format(
+            table_line_recall,
+            table_line_precision
+        )
+    )
+    return result_string
+
+# The function below compares the line engines (see LINE_ENGINES in
+# main_computer_vision_functions.py) for the pages in data_dir (listed in the
+# same way as in collect_page_inputs) and prints the results of each page, the
+# averages over the pages of each document and the averages over all pages.
+# The table structure of each page is detected with each line engine
+# number_of_repeats times, and the median time is used. The time spent on
+# finding the line-like structures (i.e., the spans in LINE_STRUCTURE_SPANS)
+# is reported separately, so that the instrumentation is enabled (see
+# instrumentation_functions.py). The table lines detected with the default
+# line segment detector are used as the reference, i.e., the recall and
+# precision of the other line engines are computed with respect to them (see
+# compute_line_set_agreement). If line_assembly is given, the compared line
+# engines assemble the table lines with it (see LINE_ASSEMBLY_METHODS in
+# main_computer_vision_functions.py), and if line_fit is given, they fit the
+# table lines with it (see LINE_FIT_METHODS), while the reference uses the
+# methods of table_structure_detection_arguments.
+
+LINE_STRUCTURE_SPANS = ['lsd', 'binarize', 'line_pixels']
+
+def run_line_engine_comparison(data_dir,
+                               table_structure_detection_arguments,
+                               number_of_repeats,
+                               max_pages_per_logbook=None,
+                               line_assembly=None,
+                               line_fit=None):
+    instrumentation_functions.enable_instrumentation()
+    line_engines = main_computer_vision_functions.LINE_ENGINES
+    reference_line_engine = line_engines[0]
+    reference_line_assembly = table_structure_detection_arguments[16]
+    reference_line_fit = table_structure_detection_arguments[17]
+    if line_assembly is None:
+        line_assembly = reference_line_assembly
+    if line_fit is None:
+        line_fit = reference_line_fit
+    def measure_detection(image, line_engine, line_assembly, line_fit):
+        detection_arguments = list(table_structure_detection_arguments)
+        detection_arguments[15] = line_engine
+        detection_arguments[16] = line_assembly
+        detection_arguments[17] = line_fit
+        detection_times = []
+        line_structure_times = []
+        for _ in range(number_of_repeats):
+            with instrumentation_functions.collect_timing_events() as (
+                    timing_events):
+                start_time = time.perf_counter()
+                table_line_lists, _, _ = (
+                    main_computer_vision_functions.detect_table_structure(
+                        image,
+                        *detection_arguments
+                    )
+                )
+                detection_times.append(time.perf_counter() - start_time)
+            line_structure_times.append(sum(
+                timing_event['duration'] for timing_event in timing_events
+                if timing_event['span'].split('/')[-1] in LINE_STRUCTURE_SPANS
+            ))
+        return [statistics.median(detection_times),
+                statistics.median(line_structure_times),
+                table_line_lists[2]]
+    thickness = main_computer_vision_functions.LSD_LINES_IMAGE_THICKNESS
+    logbook_results = {}
+    for logbook in sorted(main_test_functions.construct_document_list(data_dir)):
+        page_file_list = main_test_functions.construct_page_file_list(logbook,
+                                                                      data_dir)
+        if max_pages_per_logbook is not None:
+            page_file_list = page_file_list[:max_pages_per_logbook]
+        line_engine_results = {line_engine: [] for line_engine in line_engines}
+        for image_file in page_file_list:
+            image = utilities.load_image(
+                os.path.join(data_dir, logbook, image_file),
+                grayscale=True
+            )
+            reference_result = measure_detection(image,
+                                                 reference_line_engine,
+                                                 reference_line_assembly,
+                                                 reference_line_fit)
+            (reference_time,
+             reference_line_structure_time,
+             reference_table_lines) = reference_result
+            print('{}/{}:'.format(logbook, image_file))
+            for line_engine in line_engines:
+                if (line_engine == reference_line_engine
+                        and line_assembly == reference_line_assembly
+                        and line_fit == reference_line_fit):
+                    engine_time = reference_time
+                    line_structure_time = reference_line_structure_time
+                    table_lines = reference_table_lines
+                else:
+                    engine_time, line_structure_time, table_lines = (
+                        measure_detection(image,
+                                          line_engine,
+                                          line_assembly,
+                                          line_fit)
+                    )
+                page_result = [
+                    engine_time,
+                    line_structure_time,
+                    reference_time / engine_time,
+                    len(table_lines),
+                    *compute_line_set_agreement(image.shape,
+                                                table_lines,
+                                                reference_table_lines,
+                                                thickness)
+                ]
+                line_engine_results[line_engine].append(page_result)
+                print('    {}: '.format(line_engine)
+                      + format_line_engine_result(page_result))
+        logbook_results[logbook] = line_engine_results
+    print()
+    for logbook, line_engine_results in logbook_results.items():
+        print('Averages over the pages of document {}:'.format(logbook))
+        print_average_line_engine_results(line_engine_results)
+    print('Averages over all pages:')
+    print_average_line_engine_results({
+        line_engine: [page_result
+                      for line_engine_results in logbook_results.values()
+                      for page_result in line_engine_results[line_engine]]
+        for line_engine in line_engines
+    })
+    return logbook_results
+
+def print_average_line_engine_results(line_engine_results):
+    for line_engine, page_results in line_engine_results.items():
+        if not page_results:
+            continue
+        average_result = np.mean(page_results, axis=0)
+        print('    {}: '.format(line_engine)
+              + format_line_engine_result(average_result))
+    print()
+
+def format_line_engine_result(line_engine_result):
+    (engine_time,
+     line_structure_time,
+     speed_up,
+     number_of_table_lines,
+     table_line_recall,
+     table_line_precision) = line_engine_result
+    result_string = (
+        '{:.3f}s ({:.3f}s line structures), '.format(engine_time,
+                                                     line_structure_time)
+        + 'speed-up {:.2f}x, '.format(speed_up)
+        + '{:.1f} table lines, '.format(number_of_table_lines)
+        + 'recall {:.3f} precision {:.3f}'.format(table_line_recall,
+                                                   table_line_precision)
+    )
+    return result_string
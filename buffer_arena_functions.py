@@ -0,0 +1,134 @@
+# The functions in this file implement an arena of scratch buffers, i.e., of
+# numpy arrays of the size of a page which are needed only while a page is
+# processed (e.g. the image in which the lsd_lines are drawn in
+# detect_horizontal_or_vertical_table_lines, or the Otsu image and the blob
+# image of detect_table_elements). Allocating such an array for every page is
+# not free: a page of a typical scan has tens of millions of pixels, and the
+# memory of a fresh array has to be mapped and zeroed by the operating system
+# page by page when it is first written. Since consecutive pages of a document
+# usually have about the same size, the buffers of the previous page can be
+# used instead.
+
+# A buffer is borrowed from the arena with borrow_buffer and given back with
+# release_buffer once it is no longer needed (see also
+# release_scratch_buffers). The arena keeps the free buffers
+# as one-dimensional arrays, and a borrowed buffer is a view of the beginning
+# of a free array of the requested data type that is large enough, reshaped to
+# the requested shape. This is because the scanned pages of a document rarely
+# have exactly the same shape; they typically differ by a few pixels. A new
+# array is allocated only if there is no large enough free array, and it is
+# made BUFFER_SIZE_HEADROOM times larger than requested, so that it can also be
+# used for slightly larger pages.
+
+# The arena belongs to the process, so each worker process (see
+# multiple_logbooks_test in main_test_functions.py) has its own arena, and the
+# arena is protected by a lock, since the horizontal and vertical table lines
+# of a page may be detected by different threads at the same time (see
+# run_page_tasks in main_computer_vision_functions.py).
+
+# A released buffer must not be used by the releasing function any more, and a
+# buffer which is returned to the caller of the borrowing function (e.g. a
+# result image) must not be released at all.
+
+# The statistics of the arena are represented by a list [borrows, allocations,
+# allocated_bytes], where borrows is the number of buffers borrowed, and
+# allocations is the number of those borrows for which a new array had to be
+# allocated. Without the arena, every borrow would be an allocation.
+
+import numpy as np
+import functools
+import threading
+
+BUFFER_SIZE_HEADROOM = 1.05
+
+# The arena keeps at most MAX_FREE_BUFFERS free arrays. If there are more, the
+# smallest ones are dropped.
+
+MAX_FREE_BUFFERS = 8
+
+FREE_BUFFERS = []
+BUFFER_ARENA_LOCK = threading.Lock()
+BUFFER_ARENA_STATISTICS = [0, 0, 0]
+
+# The function below borrows a buffer of the given shape and data type from the
+# arena. If zero_buffer is True, the buffer is filled with zeros (which
+# corresponds to np.zeros), and otherwise its contents are arbitrary (which
+# corresponds to np.empty). The smallest large enough free array is used.
+
+def borrow_buffer(shape, dtype, zero_buffer=False):
+    dtype = np.dtype(dtype)
+    size = int(np.prod(shape))
+    with BUFFER_ARENA_LOCK:
+        BUFFER_ARENA_STATISTICS[0] += 1
+        fitting_indices = [k for k, free_buffer in enumerate(FREE_BUFFERS)
+                           if free_buffer.dtype == dtype
+                           and free_buffer.size >= size]
+        if fitting_indices:
+            k = min(fitting_indices, key=lambda k: FREE_BUFFERS[k].size)
+            flat_buffer = FREE_BUFFERS.pop(k)
+        else:
+            flat_buffer = None
+            buffer_size = int(size * BUFFER_SIZE_HEADROOM)
+            BUFFER_ARENA_STATISTICS[1] += 1
+            BUFFER_ARENA_STATISTICS[2] += buffer_size * dtype.itemsize
+    if flat_buffer is None:
+        flat_buffer = np.empty(buffer_size, dtype)
+    buffer = flat_buffer[:size].reshape(shape)
+    if zero_buffer:
+        buffer.fill(0)
+    return buffer
+
+# The following function gives a buffer borrowed by borrow_buffer back to the
+# arena.
+
+def release_buffer(buffer):
+    flat_buffer = buffer.base
+    with BUFFER_ARENA_LOCK:
+        FREE_BUFFERS.append(flat_buffer)
+        if len(FREE_BUFFERS) > MAX_FREE_BUFFERS:
+            FREE_BUFFERS.remove(min(FREE_BUFFERS,
+                                    key=lambda free_buffer: free_buffer.size))
+
+# The decorator below is used for functions which borrow buffers that are
+# needed only inside the function. The decorated function receives an empty
+# list as the keyword argument scratch_buffers, and it appends each buffer it
+# borrows to the list. The buffers in the list are released when the function
+# returns or raises an exception, so that the buffers of a failed page are not
+# lost from the arena.
+
+def release_scratch_buffers(function):
+    @functools.wraps(function)
+    def function_releasing_scratch_buffers(*args, **kwargs):
+        scratch_buffers = []
+        try:
+            return function(*args, scratch_buffers=scratch_buffers, **kwargs)
+        finally:
+            for scratch_buffer in scratch_buffers:
+                release_buffer(scratch_buffer)
+    return function_releasing_scratch_buffers
+
+# The function below returns a copy of the statistics of the arena of the
+# current process. The statistics of a page are obtained as the difference of
+# the statistics after and before the page was processed (see
+# process_page_image in main_test_functions.py).
+
+def get_buffer_arena_statistics():
+    with BUFFER_ARENA_LOCK:
+        buffer_arena_statistics = list(BUFFER_ARENA_STATISTICS)
+    return buffer_arena_statistics
+
+# The following function prints the statistics of the arena, e.g. summed over
+# the pages of a document.
+
+def print_buffer_arena_statistics(buffer_arena_statistics):
+    borrows, allocations, allocated_bytes = buffer_arena_statistics
+    reuse_rate = 1 - allocations / borrows if borrows > 0 else 0.0
+    buffer_arena_statistics_string = (
+        'Scratch buffer borrows: {} \n'.format(borrows)
+        + 'Scratch buffer allocations: {} ({:.1f} MB) \n'.format(
+            allocations,
+            allocated_bytes / 1024 ** 2
+        )
+        + 'Scratch buffer reuse rate: {:.2f} \n'.format(reuse_rate)
+    )
+    print(buffer_arena_statistics_string)
@@ -5,13 +5,18 @@
 import numpy as np
 import cv2 as cv
 
+import geometric_array_operations
+
 # PARAMETER_DICT contains parameter names and values used by different functions
-# provided by cv2. In the current version of this file, only compute_canny_image
-# uses PARAMETER_DICT, but this may change in future versions.
+# provided by cv2. In the current version of this file, only
+# compute_canny_image, adaptive_binarization and compute_hough_line_segments
+# use PARAMETER_DICT, but this may change in future versions.
 
 PARAMETER_DICT = {'inverted_binary_threshold': 220,
                   'histogram_binary_ratio': 0.1,
                   'gamma_coefficient': 1.0,
+                  'adaptive_block_size': 15,
+                  'adaptive_constant': 10,
                   'canny_hysterisis_threshold_min': 50,
                   'canny_hysterisis_threshold_max': 200,
                   'canny_aperture_size': 3,
@@ -40,16 +45,36 @@ PARAMETER_DICT = {'inverted_binary_threshold': 220,
 # prefer to use them. According to tests, the Otsu method works well in the
 # logbook case.
 
-def triangle_or_otsu_binarization(image, otsu_mode):
+# If binary_image is given, the result is written into it instead of a new
+# image (see buffer_arena_functions.py).
+
+def triangle_or_otsu_binarization(image, otsu_mode, binary_image=None):
     mode = cv.THRESH_OTSU if otsu_mode else cv.THRESH_TRIANGLE
-    binary_image = cv.threshold(image, 255, 255, mode)[1]
-    binary_image = np.invert(binary_image)
+    binary_image = cv.threshold(image, 255, 255, mode, dst=binary_image)[1]
+    np.invert(binary_image, out=binary_image)
+    return binary_image
+
+# The following function binarizes the input image by using an adaptive
+# threshold, i.e., a pixel is regarded as dark if it is darker than the mean of
+# its neighbourhood by more than a constant. Unlike the Otsu method, the
+# adaptive threshold also finds faint thin lines on an unevenly lit page, but
+# it only finds the edges of large dark regions. As above, the dark pixels are
+# the non-zero pixels of the return value.
+
+def adaptive_binarization(image):
+    block_size = PARAMETER_DICT['adaptive_block_size']
+    constant = PARAMETER_DICT['adaptive_constant']
+    binary_image = cv.adaptiveThreshold(image,
+                                        255,
+                                        cv.ADAPTIVE_THRESH_MEAN_C,
+                                        cv.THRESH_BINARY_INV,
+                                        block_size,
+                                        constant)
     return binary_image
 
 # The Canny algorithm is a classical method for detecting edges in an image.
-# This algorithm is not used in the current version of the main algorithm, but
-# we still include it in this file in order to give yet another example of a
-# relevant function provided by cv2.
+# This algorithm is not used by the main algorithm by default, but it is used
+# by the Hough line segment detector (see compute_hough_line_segments below).
 
 def compute_canny_image(image):
     threshold_min = PARAMETER_DICT['canny_hysterisis_threshold_min']
@@ -64,6 +89,54 @@ def compute_canny_image(image):
                            l2_gradient)
     return canny_image
 
+# The following function detects line segments in the input image by using the
+# probabilistic Hough transform of the Canny edge image (see above). The
+# return value is a numpy array of shape (N, 4), whose rows are of the form
+# [x_1, y_1, x_2, y_2]. Note that both edges of a thick line are detected as
+# separate line segments.
+
+def compute_hough_line_segments(image):
+    distance_resolution = PARAMETER_DICT['hough_distance_resolution']
+    angle_resolution = PARAMETER_DICT['hough_angle_resolution']
+    threshold = PARAMETER_DICT['hough_threshold']
+    minimum_line_length = PARAMETER_DICT['hough_minimum_line_length']
+    maximum_gap_size = PARAMETER_DICT['hough_maximum_gap_size']
+    canny_image = compute_canny_image(image)
+    line_segments = cv.HoughLinesP(canny_image,
+                                   distance_resolution,
+                                   np.deg2rad(angle_resolution),
+                                   threshold,
+                                   minLineLength=minimum_line_length,
+                                   maxLineGap=maximum_gap_size)
+    if line_segments is None:
+        return np.zeros((0, 4), dtype=np.float32)
+    return line_segments.reshape(-1, 4).astype(np.float32)
+
+# The following function extracts the horizontal or vertical line-like pixels
+# of a binarized image (whose non-zero pixels are the dark pixels of the
+# original image). A pixel is line-like if it belongs to a horizontal or
+# vertical run of at least run_length_lower_bound non-zero pixels,
+# respectively. The line-like pixels are determined by a morphological opening
+# with a kernel that is a single row or column of run_length_lower_bound
+# pixels. Short strokes (e.g. handwriting) are removed, while the table lines
+# and other long lines remain.
+
+# Note that a slanted line remains only if its runs of pixels are long enough,
+# i.e., the slope of the line must be less than about 1 / run_length_lower_bound
+# times the thickness of the line.
+
+def extract_horizontal_or_vertical_line_pixels(binary_image,
+                                               extract_horizontal,
+                                               run_length_lower_bound):
+    run_length_lower_bound = max(1, int(run_length_lower_bound))
+    if extract_horizontal:
+        kernel_size = (run_length_lower_bound, 1)
+    else:
+        kernel_size = (1, run_length_lower_bound)
+    kernel = cv.getStructuringElement(cv.MORPH_RECT, kernel_size)
+    line_pixels_image = cv.morphologyEx(binary_image, cv.MORPH_OPEN, kernel)
+    return line_pixels_image
+
 # The following function detects the connected components in a binarized input
 # image. We employ a basic implementation provided by cv2.
 
@@ -87,12 +160,17 @@ def compute_canny_image(image):
 # The objects 3) and 4) are lists of length N such that the first item of
 # each list corresponds to the background.
 
-def compute_connected_component_parameters(image):
+# If labels is given, the label image 2) is written into it (see
+# buffer_arena_functions.py). It has to be a uint16 array of the same shape as
+# the input image.
+
+def compute_connected_component_parameters(image, labels=None):
     connected_component_parameters = (
         cv.connectedComponentsWithStatsWithAlgorithm(image,
                                                      8,
                                                      cv.CV_16U,
-                                                     cv.CCL_DEFAULT)
+                                                     cv.CCL_DEFAULT,
+                                                     labels=labels)
     )
     return connected_component_parameters
 
@@ -136,31 +214,19 @@ def compute_connected_component_rectangles(image,
                                            right_extra_length=0,
                                            top_extra_length=0,
                                            bottom_extra_length=0):
-    height = image.shape[0]
-    width = image.shape[1]
-    # The list of rectangle descriptions is the third item in the argument
-    # connected_component_parameters, and the first item of the description
-    # list corresponds to the background of the input image and should,
-    # therefore, be omitted. This explains the [2][1:]-part of the following
-    # expression.
-    connected_component_rectangle_descriptions = (
-        connected_component_parameters[2][1:]
+    # The rectangles are computed for all connected components at once (see
+    # compute_connected_component_rectangle_array in
+    # geometric_array_operations.py) and converted into a list.
+    connected_component_rectangles = (
+        geometric_array_operations.compute_connected_component_rectangle_array(
+            image.shape,
+            connected_component_parameters,
+            left_extra_length,
+            right_extra_length,
+            top_extra_length,
+            bottom_extra_length
+        ).tolist()
     )
-    connected_component_rectangles = []
-    for description in connected_component_rectangle_descriptions:
-        x_top_left = description[0]
-        y_top_left = description[1]
-        rectangle_width = description[2]
-        rectangle_height = description[3]
-        x_1 = x_top_left - left_extra_length
-        y_1 = y_top_left - top_extra_length
-        x_2 = x_top_left + rectangle_width + right_extra_length
-        y_2 = y_top_left + rectangle_height + bottom_extra_length
-        x_1 = max(0, x_1)
-        y_1 = max(0, y_1)
-        x_2 = min(width - 1, x_2)
-        y_2 = min(height - 1, y_2)
-        connected_component_rectangles.append([[x_1, y_1], [x_2, y_2]])
     return connected_component_rectangles
 
 # The function below detects so-called contours in a binarized input image.
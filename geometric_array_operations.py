@@ -0,0 +1,406 @@
+import numpy as np
+
+# The functions in this file process sets of rectangles and line segments as
+# numpy arrays instead of lists. A rectangle [[x_1, y_1], [x_2, y_2]] and a line
+# segment [[x_1, y_1], [x_2, y_2]] are both pairs of points, so a set of N
+# rectangles or line segments is represented by an int32 array of shape
+# (N, 2, 2), called a point pair array. The element [k, i] of the array is the
+# i-th point of the k-th rectangle or line segment, and the element [k, i, 0]
+# ([k, i, 1]) is the x-coordinate (y-coordinate) of that point.
+
+# Each function below processes all rectangles or line segments of the set at
+# once, which is much faster than processing them one at a time in Python when
+# there are thousands of them (e.g. the minimal rectangles of the connected
+# components in detect_horizontal_or_vertical_table_lines). The drawing
+# functions in utilities.py accept point pair arrays directly, and so does
+# np.array, which is used when the result arrays are saved.
+
+# The function below converts a list of rectangles or line segments (or any
+# other sequence of pairs of points) into a point pair array. An empty list is
+# converted into an array of shape (0, 2, 2).
+
+def construct_point_pair_array(point_pairs):
+    point_pair_array = np.asarray(point_pairs, dtype=np.int32).reshape(-1, 2, 2)
+    return point_pair_array
+
+# The following function constructs the minimal rectangles containing the
+# connected components computed by compute_connected_component_parameters in
+# general_computer_vision_functions.py, extended by the given extra lengths and
+# clamped to an image of shape image_shape. The first row of the statistics
+# corresponds to the background and is omitted.
+
+# Note that the bottom right corner of a minimal rectangle is given by the sums
+# x + width and y + height of the statistics, i.e., the rectangle extends one
+# pixel beyond the component to the right and downwards (before clamping).
+
+def compute_connected_component_rectangle_array(image_shape,
+                                                connected_component_parameters,
+                                                left_extra_length=0,
+                                                right_extra_length=0,
+                                                top_extra_length=0,
+                                                bottom_extra_length=0):
+    rectangle_descriptions = np.asarray(connected_component_parameters[2])
+    rectangle_descriptions = rectangle_descriptions[1:, :4].astype(np.int32)
+    x_top_left, y_top_left, rectangle_width, rectangle_height = (
+        rectangle_descriptions.T
+    )
+    rectangle_array = np.empty((len(rectangle_descriptions), 2, 2),
+                               dtype=np.int32)
+    rectangle_array[:, 0, 0] = x_top_left
+    rectangle_array[:, 0, 1] = y_top_left
+    rectangle_array[:, 1, 0] = x_top_left + rectangle_width
+    rectangle_array[:, 1, 1] = y_top_left + rectangle_height
+    rectangle_array = extend_rectangle_array(rectangle_array,
+                                             left_extra_length,
+                                             right_extra_length,
+                                             top_extra_length,
+                                             bottom_extra_length)
+    rectangle_array = clamp_point_pair_array(rectangle_array, image_shape)
+    return rectangle_array
+
+# The function below stretches each rectangle of a rectangle array leftwards,
+# rightwards, upwards and downwards by the given extra lengths. The first point
+# of each rectangle is assumed to be its top left corner.
+
+def extend_rectangle_array(rectangle_array,
+                           left_extra_length=0,
+                           right_extra_length=0,
+                           top_extra_length=0,
+                           bottom_extra_length=0):
+    extra_lengths = np.array([[-left_extra_length, -top_extra_length],
+                              [right_extra_length, bottom_extra_length]],
+                             dtype=np.int32)
+    extended_rectangle_array = rectangle_array + extra_lengths
+    return extended_rectangle_array
+
+# The following function clamps the points of a point pair array to an image of
+# shape image_shape, i.e., each x-coordinate (y-coordinate) is clamped to the
+# interval [0, width - 1] ([0, height - 1]).
+
+def clamp_point_pair_array(point_pair_array, image_shape):
+    height, width = image_shape[:2]
+    clamped_point_pair_array = np.clip(point_pair_array,
+                                       0,
+                                       np.array([width - 1, height - 1],
+                                                dtype=np.int32))
+    return clamped_point_pair_array
+
+# The function below is the counterpart of filter_rectangles in
+# geometric_operations.py for rectangle arrays. The rectangles are filtered
+# based on the lengths of their sides, and the remaining rectangles are
+# returned in the original order.
+
+def filter_rectangle_array(rectangle_array,
+                           horizontal_length_upper_bound=-1,
+                           horizontal_length_lower_bound=-1,
+                           vertical_length_upper_bound=-1,
+                           vertical_length_lower_bound=-1):
+    horizontal_lengths = np.abs(rectangle_array[:, 1, 0]
+                                - rectangle_array[:, 0, 0])
+    vertical_lengths = np.abs(rectangle_array[:, 1, 1]
+                              - rectangle_array[:, 0, 1])
+    mask = np.ones(len(rectangle_array), dtype=bool)
+    if horizontal_length_upper_bound > 0:
+        mask &= horizontal_lengths <= horizontal_length_upper_bound
+    if horizontal_length_lower_bound > 0:
+        mask &= horizontal_lengths >= horizontal_length_lower_bound
+    if vertical_length_upper_bound > 0:
+        mask &= vertical_lengths <= vertical_length_upper_bound
+    if vertical_length_lower_bound > 0:
+        mask &= vertical_lengths >= vertical_length_lower_bound
+    return rectangle_array[mask]
+
+# The following function computes the corner points of each rectangle of a
+# rectangle array in the order in which cv2 draws them. The return value is
+# an int32 array of shape (N, 4, 2), which can be passed to the function
+# polylines of cv2 (see draw_rectangles in utilities.py).
+
+def compute_rectangle_array_corners(rectangle_array):
+    (x_1, y_1), (x_2, y_2) = np.moveaxis(rectangle_array, [1, 2], [0, 1])
+    corner_array = np.stack([np.stack([x_1, y_1], axis=1),
+                             np.stack([x_2, y_1], axis=1),
+                             np.stack([x_2, y_2], axis=1),
+                             np.stack([x_1, y_2], axis=1)],
+                            axis=1)
+    return corner_array
+
+# The functions below merge the rectangles of a rectangle array in the same way
+# as drawing their outlines with cv2 (with the thickness 1 and the line type
+# LINE_AA) in a zero-initialized image and computing the minimal rectangles of
+# the connected components of the image with
+# compute_connected_component_parameters in general_computer_vision_functions.py
+# and compute_connected_component_rectangle_array above. The result is computed
+# directly from the coordinates, so that neither the image nor the connected
+# components have to be computed.
+
+# The pixels drawn by cv2 for the outline of a rectangle [[x_1, y_1], [x_2,
+# y_2]] with x_1 <= x_2 and y_1 <= y_2 can be described by at most six boxes
+# of pixels. A box [x_a, y_a, x_b, y_b] consists of the pixels (x, y) with
+# x_a <= x <= x_b and y_a <= y <= y_b. If x_1 < x_2 and y_1 < y_2, the outline
+# is a band of width three around the sides of the rectangle extending one
+# pixel outside the rectangle, but the four outermost corner pixels are not
+# drawn. The outline of a rectangle with x_1 = x_2 or y_1 = y_2 (or both) is a
+# line of width three (or two pixels) whose end is extended by a single pixel
+# to the right or downwards. The boxes outside the image are empty after the
+# clamping, which is expressed by x_a > x_b or y_a > y_b.
+
+def compute_rectangle_array_outline_boxes(rectangle_array, image_shape):
+    height, width = image_shape[:2]
+    (x_1, y_1), (x_2, y_2) = np.moveaxis(rectangle_array, [1, 2], [0, 1])
+    boxes = np.stack([
+        np.stack([x_1 - 1, y_1, x_2 + 1, np.minimum(y_1 + 1, y_2)], axis=1),
+        np.stack([x_1 - 1, np.maximum(y_2 - 1, y_1), x_2 + 1, y_2], axis=1),
+        np.stack([x_1 - 1, y_1, x_1 + 1, y_2], axis=1),
+        np.stack([x_2 - 1, y_1, x_2 + 1, y_2], axis=1),
+        np.stack([x_1, y_1 - 1, x_2, y_1 - 1], axis=1),
+        np.stack([x_1, y_2 + 1, x_2, y_2 + 1], axis=1)
+    ], axis=1)
+    vertical_line_mask = (x_1 == x_2) & (y_1 < y_2)
+    boxes[vertical_line_mask, 4] = boxes[vertical_line_mask, 5]
+    horizontal_line_mask = (x_1 < x_2) & (y_1 == y_2)
+    boxes[horizontal_line_mask, :4] = np.stack(
+        [x_1, y_1 - 1, x_2, y_1 + 1],
+        axis=1
+    )[horizontal_line_mask, np.newaxis]
+    boxes[horizontal_line_mask, 4:] = np.stack(
+        [x_2 + 1, y_1, x_2 + 1, y_1],
+        axis=1
+    )[horizontal_line_mask, np.newaxis]
+    point_mask = (x_1 == x_2) & (y_1 == y_2)
+    boxes[point_mask] = np.stack([x_1, y_1, x_1, y_1 + 1],
+                                 axis=1)[point_mask, np.newaxis]
+    outside_mask = ((boxes[:, :, 2] < 0)
+                    | (boxes[:, :, 3] < 0)
+                    | (boxes[:, :, 0] > width - 1)
+                    | (boxes[:, :, 1] > height - 1))
+    boxes = np.clip(boxes, 0, np.array([width - 1, height - 1] * 2,
+                                       dtype=np.int32))
+    boxes[outside_mask] = [1, 1, 0, 0]
+    return boxes
+
+# The following function merges the rectangles of a rectangle array whose
+# outlines (see compute_rectangle_array_outline_boxes above) touch each other,
+# i.e., whose outlines belong to the same 8-connected component when drawn in
+# an image of shape image_shape. The result is the array of the minimal
+# rectangles of the merged outlines in the same form and order as the one
+# returned by compute_connected_component_rectangle_array for the drawn image.
+
+# The pairs of rectangles whose outlines might touch are found with
+# compute_close_box_pairs below, i.e., by sweeping over the minimal rectangles
+# of the outlines. For each such pair, it is checked whether some box of the
+# first outline touches some box of the second outline, and the touching
+# rectangles are merged with compute_disjoint_set_representatives below.
+
+# The connected components of compute_connected_component_parameters are
+# ordered by the blocks of 2x2 pixels in which they first appear when the
+# blocks are scanned row by row, and so are the merged rectangles. Two outlines
+# cannot appear first in the same block, since all pixels of a block are
+# 8-connected to each other.
+
+def merge_rectangle_array(rectangle_array, image_shape):
+    boxes = compute_rectangle_array_outline_boxes(rectangle_array, image_shape)
+    valid_box_mask = ((boxes[:, :, 0] <= boxes[:, :, 2])
+                      & (boxes[:, :, 1] <= boxes[:, :, 3]))
+    maximum_coordinate = np.iinfo(np.int32).max
+    outline_array = np.stack([
+        np.where(valid_box_mask, boxes[:, :, 0], maximum_coordinate).min(1),
+        np.where(valid_box_mask, boxes[:, :, 1], maximum_coordinate).min(1),
+        np.where(valid_box_mask, boxes[:, :, 2], -1).max(1),
+        np.where(valid_box_mask, boxes[:, :, 3], -1).max(1)
+    ], axis=1)
+    # Find the pairs of outlines whose minimal rectangles touch, and check the
+    # boxes of these pairs.
+    first_indices, second_indices = compute_close_box_pairs(outline_array, 1, 1)
+    first_boxes = boxes[first_indices, :, np.newaxis]
+    second_boxes = boxes[second_indices, np.newaxis]
+    touching_box_mask = (
+        (first_boxes[..., :2] <= second_boxes[..., 2:] + 1).all(-1)
+        & (second_boxes[..., :2] <= first_boxes[..., 2:] + 1).all(-1)
+        & valid_box_mask[first_indices, :, np.newaxis]
+        & valid_box_mask[second_indices, np.newaxis]
+    )
+    touching_pair_mask = touching_box_mask.any((1, 2))
+    representatives = compute_disjoint_set_representatives(
+        len(rectangle_array),
+        np.stack([first_indices[touching_pair_mask],
+                  second_indices[touching_pair_mask]], axis=1)
+    )
+    # Compute the minimal rectangle of each merged outline and the block in
+    # which the merged outline first appears.
+    _, group_indices = np.unique(representatives, return_inverse=True)
+    group_count = group_indices.max(initial=-1) + 1
+    group_array = np.full((group_count, 4), maximum_coordinate, dtype=np.int32)
+    group_array[:, 2:] = -1
+    np.minimum.at(group_array[:, 0], group_indices, outline_array[:, 0])
+    np.minimum.at(group_array[:, 1], group_indices, outline_array[:, 1])
+    np.maximum.at(group_array[:, 2], group_indices, outline_array[:, 2])
+    np.maximum.at(group_array[:, 3], group_indices, outline_array[:, 3])
+    first_block_rows = group_array[:, 1] // 2
+    box_group_indices = np.repeat(group_indices, boxes.shape[1])
+    first_row_box_mask = (
+        valid_box_mask.ravel()
+        & (boxes[:, :, 1].ravel() // 2 == first_block_rows[box_group_indices])
+    )
+    first_block_columns = np.full(group_count, maximum_coordinate,
+                                  dtype=np.int32)
+    np.minimum.at(first_block_columns,
+                  box_group_indices[first_row_box_mask],
+                  boxes[:, :, 0].ravel()[first_row_box_mask] // 2)
+    group_order = np.lexsort((first_block_columns, first_block_rows))
+    group_array = group_array[group_order]
+    merged_rectangle_array = construct_point_pair_array(group_array)
+    merged_rectangle_array[:, 1] += 1
+    merged_rectangle_array = clamp_point_pair_array(merged_rectangle_array,
+                                                    image_shape)
+    return merged_rectangle_array
+
+# The functions below are used for assembling table lines by chaining line
+# segments (see detect_horizontal_or_vertical_table_lines in
+# main_computer_vision_functions.py). The following function constructs the
+# minimal rectangles containing the line segments of a point pair array,
+# widened by margin pixels on each side and clamped to an image of shape
+# image_shape. The bottom right corners extend one pixel further in the same
+# way as in compute_connected_component_rectangle_array, so that the rectangle
+# of a line segment drawn with the thickness 2 * margin + 1 resembles the
+# minimal rectangle of the drawn line segment.
+
+def compute_line_segment_rectangle_array(image_shape,
+                                         line_segment_array,
+                                         margin=0):
+    rectangle_array = np.stack([line_segment_array.min(axis=1),
+                                line_segment_array.max(axis=1) + 1],
+                               axis=1)
+    rectangle_array = extend_rectangle_array(rectangle_array,
+                                             margin,
+                                             margin,
+                                             margin,
+                                             margin)
+    rectangle_array = clamp_point_pair_array(rectangle_array, image_shape)
+    return rectangle_array
+
+# The following function chains the rectangles of a rectangle array, i.e., two
+# rectangles belong to the same chain if they are connected by a sequence of
+# rectangles in which the gap between consecutive rectangles is at most
+# x_gap_tolerance in the x-direction and at most y_gap_tolerance in the
+# y-direction (see compute_close_box_pairs below). The close pairs of
+# rectangles are found by a sweep and joined with
+# compute_disjoint_set_representatives below, so the running time depends on
+# the number of rectangles and not on the size of the image.
+
+# The return value is the list [chain_rectangle_array, chain_indices], where
+# chain_rectangle_array contains the minimal rectangles containing the chains,
+# sorted by their top left corners (row by row), and chain_indices[k] is the
+# index of the chain of the k-th rectangle in chain_rectangle_array.
+
+def chain_rectangle_array(rectangle_array, x_gap_tolerance, y_gap_tolerance):
+    box_array = rectangle_array.reshape(-1, 4)
+    first_indices, second_indices = compute_close_box_pairs(box_array,
+                                                            x_gap_tolerance,
+                                                            y_gap_tolerance)
+    representatives = compute_disjoint_set_representatives(
+        len(rectangle_array),
+        np.stack([first_indices, second_indices], axis=1)
+    )
+    _, chain_indices = np.unique(representatives, return_inverse=True)
+    chain_count = chain_indices.max(initial=-1) + 1
+    chain_box_array = np.full((chain_count, 4),
+                              np.iinfo(np.int32).max,
+                              dtype=np.int32)
+    chain_box_array[:, 2:] = -1
+    for coordinate_index in range(2):
+        np.minimum.at(chain_box_array[:, coordinate_index],
+                      chain_indices,
+                      box_array[:, coordinate_index])
+        np.maximum.at(chain_box_array[:, coordinate_index + 2],
+                      chain_indices,
+                      box_array[:, coordinate_index + 2])
+    chain_order = np.lexsort((chain_box_array[:, 0], chain_box_array[:, 1]))
+    chain_ranks = np.empty_like(chain_order)
+    chain_ranks[chain_order] = np.arange(chain_count)
+    chain_rectangle_array = construct_point_pair_array(
+        chain_box_array[chain_order]
+    )
+    return [chain_rectangle_array, chain_ranks[chain_indices]]
+
+# The following function finds the pairs of boxes of a box array (an int32
+# array of shape (N, 4) whose rows are boxes [x_a, y_a, x_b, y_b] as above)
+# which are close to each other. Two boxes are close if the gap between their
+# x-intervals [x_a, x_b] is at most x_distance and the gap between their
+# y-intervals is at most y_distance. The gap between two intervals is the
+# difference between the larger start and the smaller end, i.e., the gap is
+# 1 for adjacent intervals and non-positive for overlapping intervals. For
+# example, two boxes of pixels touch each other in the sense of 8-connectivity
+# if and only if they are close with the distances 1 and 1.
+
+# The boxes are sorted with respect to their starts in one direction, and for
+# each box, the boxes whose starts lie between its start and its end plus the
+# distance are found by a binary search (a so-called sweep). The sweep is done
+# in the direction in which the boxes are shorter on average, since then fewer
+# pairs of boxes have to be checked in the other direction. The return value
+# is a pair of index arrays, the indices of the first boxes and the indices of
+# the second boxes of the close pairs.
+
+def compute_close_box_pairs(box_array, x_distance, y_distance):
+    distances = [x_distance, y_distance]
+    box_lengths = box_array[:, 2:] - box_array[:, :2]
+    if box_lengths[:, 0].sum() <= box_lengths[:, 1].sum():
+        sweep_axis, other_axis = 0, 1
+    else:
+        sweep_axis, other_axis = 1, 0
+    sorted_indices = np.argsort(box_array[:, sweep_axis], kind='stable')
+    sorted_starts = box_array[sorted_indices, sweep_axis]
+    sorted_ends = box_array[sorted_indices, sweep_axis + 2]
+    sweep_ends = np.searchsorted(sorted_starts,
+                                 sorted_ends + distances[sweep_axis],
+                                 side='right')
+    sweep_starts = np.arange(1, len(sorted_indices) + 1)
+    pair_counts = np.maximum(sweep_ends - sweep_starts, 0)
+    first_positions = np.repeat(np.arange(len(sorted_indices)), pair_counts)
+    second_positions = (np.arange(pair_counts.sum())
+                        - np.repeat(np.cumsum(pair_counts) - pair_counts,
+                                    pair_counts)
+                        + np.repeat(sweep_starts, pair_counts))
+    first_indices = sorted_indices[first_positions]
+    second_indices = sorted_indices[second_positions]
+    pair_mask = (
+        (box_array[first_indices, other_axis]
+         <= box_array[second_indices, other_axis + 2] + distances[other_axis])
+        & (box_array[second_indices, other_axis]
+           <= box_array[first_indices, other_axis + 2] + distances[other_axis])
+    )
+    return first_indices[pair_mask], second_indices[pair_mask]
+
+# The function below partitions the elements 0, 1, ..., element_count - 1 into
+# disjoint sets by joining the two elements of each given index pair into the
+# same set, and returns for each element the representative of its set. The
+# sets are maintained in a union-find structure, i.e., each element points to
+# another element of its set and the representative of the set points to
+# itself. All pairs are processed at once: in each round, the representative
+# of the two sets of each pair which is larger is made to point to the smaller
+# one, and then the pointers are followed until every element points to a
+# representative. The rounds are repeated until the two elements of each pair
+# have the same representative, which usually takes only a few rounds.
+
+def compute_disjoint_set_representatives(element_count, index_pairs):
+    representatives = np.arange(element_count)
+    first_indices, second_indices = np.asarray(index_pairs).reshape(-1, 2).T
+    while True:
+        first_representatives = representatives[first_indices]
+        second_representatives = representatives[second_indices]
+        joined_mask = first_representatives != second_representatives
+        if not joined_mask.any():
+            return representatives
+        np.minimum.at(
+            representatives,
+            np.maximum(first_representatives, second_representatives)[
+                joined_mask
+            ],
+            np.minimum(first_representatives, second_representatives)[
+                joined_mask
+            ]
+        )
+        while True:
+            next_representatives = representatives[representatives]
+            if np.array_equal(next_representatives, representatives):
+                break
+            representatives = next_representatives
@@ -14,6 +14,14 @@ FIT_LINE_DISTANCE_PARAMETER = 0
 FIT_LINE_RADIUS_EPS = 0.01
 FIT_LINE_ANGLE_EPS = 0.01
 
+# The batched version of compute_horizontal_or_vertical_lines_using_rectangles
+# (see compute_horizontal_or_vertical_lines_using_rectangle_array below) can
+# fit each line to a subsample of at most FIT_LINE_MAX_POINTS line-like pixels.
+# The value 0 means that all pixels are used, which gives exactly the same
+# lines as the original function.
+
+FIT_LINE_MAX_POINTS = 0
+
 # This is a simple function that filters rectangles based on the lengths of the
 # sides of the rectangles.
 
@@ -156,3 +164,227 @@ def compute_horizontal_or_vertical_lines_using_rectangles(image,
         y_2 = int(y_2 + y_1_rect)
         horizontal_or_vertical_lines.append([[x_1, y_1], [x_2, y_2]])
     return horizontal_or_vertical_lines
+
+# The function below is a batched version of the function above. The
+# rectangles are given as a rectangle array (see geometric_array_operations.py),
+# and all of the lines are computed at once, which avoids most of the work done
+# in Python for each rectangle. Each rectangle must contain at least one
+# line-like pixel; otherwise a ValueError is raised. The return value is the
+# same as that of the function above, except that a fitted line perpendicular
+# to the requested direction (which the function above cannot handle) yields a
+# line through the centroid of the pixels, as a fitted line parallel to the
+# requested direction does.
+
+# 1) The coordinates of the line-like pixels of all rectangles are gathered
+#    into a single array by using the function findNonZero of cv2 for each
+#    cropped image. The pixels of the k-th rectangle are the k-th segment of
+#    the array, and the coordinates are relative to the top left corner of the
+#    rectangle as above. (A pixel contained in several rectangles belongs to
+#    each of them, which is why the image is not labeled by the rectangles.)
+# 2) The extremal coordinates and the sums needed for the least-squares fit
+#    are computed for every segment at once by the reduceat methods of numpy.
+#    If max_points_per_line is positive, the sums of a segment with more
+#    pixels are computed from every n-th pixel only, where n is the smallest
+#    step giving at most max_points_per_line pixels. The extremal coordinates
+#    are always computed from all pixels.
+# 3) The line elements are computed from the sums in the same way and with the
+#    same precision as fitLine of cv2 computes them with cv.DIST_L2 (the
+#    direction of the line is the principal axis of the pixels and the line
+#    goes through their centroid), and the endpoints are computed with the
+#    same float32 operations as above.
+
+def compute_horizontal_or_vertical_lines_using_rectangle_array(
+        image,
+        rectangle_array,
+        compute_horizontal,
+        max_points_per_line=FIT_LINE_MAX_POINTS):
+    if len(rectangle_array) == 0:
+        return []
+    # 1)
+    point_arrays = []
+    for (x_1_rect, y_1_rect), (x_2_rect, y_2_rect) in rectangle_array.tolist():
+        cropped_image = image[y_1_rect:y_2_rect + 1, x_1_rect:x_2_rect + 1]
+        point_array = cv.findNonZero(cropped_image)
+        if point_array is None:
+            raise ValueError(
+                'No line-like pixels in rectangle {}'.format(
+                    [[x_1_rect, y_1_rect], [x_2_rect, y_2_rect]]
+                )
+            )
+        point_arrays.append(point_array.reshape(-1, 2))
+    point_counts = np.array([len(point_array) for point_array in point_arrays])
+    segment_starts = np.cumsum(point_counts) - point_counts
+    points = np.concatenate(point_arrays)
+    # 2)
+    minimum_points = np.minimum.reduceat(points, segment_starts)
+    maximum_points = np.maximum.reduceat(points, segment_starts)
+    if max_points_per_line > 0:
+        point_steps = -(-point_counts // max_points_per_line)
+        point_indices = (np.arange(len(points))
+                         - np.repeat(segment_starts, point_counts))
+        fit_mask = point_indices % np.repeat(point_steps, point_counts) == 0
+        points = points[fit_mask]
+        point_counts = -(-point_counts // point_steps)
+        segment_starts = np.cumsum(point_counts) - point_counts
+    x = points[:, 0].astype(np.float32)
+    y = points[:, 1].astype(np.float32)
+    x_means, y_means, x_squared_means, y_squared_means, xy_means = [
+        np.add.reduceat(summands, segment_starts, dtype=np.float64)
+        / point_counts
+        for summands in [x, y, x * x, y * y, x * y]
+    ]
+    # 3)
+    dx_2 = x_squared_means - x_means * x_means
+    dy_2 = y_squared_means - y_means * y_means
+    dxy = xy_means - x_means * y_means
+    angles = np.arctan2(2 * dxy, dx_2 - dy_2).astype(np.float32) / 2
+    delta_x = np.cos(angles.astype(np.float64)).astype(np.float32)
+    delta_y = np.sin(angles.astype(np.float64)).astype(np.float32)
+    x_0 = x_means.astype(np.float32)
+    y_0 = y_means.astype(np.float32)
+    x_rect, y_rect = rectangle_array[:, 0].T
+    # If the fitted line is parallel or perpendicular to the requested
+    # direction, the slope is zero or infinite, and the line is taken to go
+    # through the centroid (an infinite slope would otherwise overflow when
+    # the coordinates are cast to integers).
+    if compute_horizontal:
+        x_1 = minimum_points[:, 0]
+        x_2 = maximum_points[:, 0]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = delta_y / delta_x
+            y_1 = slopes * (x_1.astype(np.float32) - x_0) + y_0
+            y_2 = slopes * (x_2.astype(np.float32) - x_0) + y_0
+        centroid_mask = (delta_y == 0) | (delta_x == 0)
+        y_1 = np.where(centroid_mask, y_0, y_1)
+        y_2 = np.where(centroid_mask, y_0, y_2)
+        x_1 = x_1 + x_rect
+        x_2 = x_2 + x_rect
+        y_1 = (y_1 + y_rect.astype(np.float32)).astype(np.int64)
+        y_2 = (y_2 + y_rect.astype(np.float32)).astype(np.int64)
+    else:
+        y_1 = minimum_points[:, 1]
+        y_2 = maximum_points[:, 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = delta_x / delta_y
+            x_1 = slopes * (y_1.astype(np.float32) - y_0) + x_0
+            x_2 = slopes * (y_2.astype(np.float32) - y_0) + x_0
+        centroid_mask = (delta_x == 0) | (delta_y == 0)
+        x_1 = np.where(centroid_mask, x_0, x_1)
+        x_2 = np.where(centroid_mask, x_0, x_2)
+        x_1 = (x_1 + x_rect.astype(np.float32)).astype(np.int64)
+        x_2 = (x_2 + x_rect.astype(np.float32)).astype(np.int64)
+        y_1 = y_1 + y_rect
+        y_2 = y_2 + y_rect
+    horizontal_or_vertical_lines = (
+        np.stack([x_1, y_1, x_2, y_2], axis=1).reshape(-1, 2, 2).tolist()
+    )
+    return horizontal_or_vertical_lines
+
+# The function below computes the same lines as the functions above without
+# the image of line-like pixels: each line is fitted directly to the line
+# segments (e.g. the lsd_lines drawn into the image) whose midpoints are
+# contained in the rectangle. The line segments are given as a point pair array
+# line_segment_array, and each rectangle is assumed to contain the midpoint of
+# at least one line segment. The return value is the same as that of the
+# functions above.
+
+# 1) Each line segment is replaced with its endpoints and its midpoint, which
+#    are weighted by 1/6, 4/6 and 1/6 times the length of the line segment.
+#    (The length of a line segment is counted in pixels, i.e., a line segment
+#    whose endpoints coincide has the length 1.) By Simpson's rule, the
+#    weighted means and second moments of these points are exactly those of
+#    the points of the line segments, so the least-squares fit below is the
+#    same as a fit to the line segments drawn with the thickness 1.
+# 2) The line of each rectangle goes through the weighted centroid of the
+#    points of its line segments, and its direction is the principal axis of
+#    the points, as with cv.DIST_L2 above.
+# 3) In the case of a horizontal (vertical) table line, the x-coordinates
+#    (y-coordinates) of the endpoints of the line are the extremal
+#    x-coordinates (y-coordinates) of the endpoints of the line segments,
+#    extended by extent_margin and clamped to the rectangle, and the other
+#    coordinates are computed from the line as above. (The extremal
+#    coordinates of the pixels of a line segment drawn with a large thickness
+#    lie a few pixels beyond its endpoints, which can be taken into account
+#    with extent_margin.)
+
+def compute_horizontal_or_vertical_lines_using_line_segment_array(
+        rectangle_array,
+        line_segment_array,
+        compute_horizontal,
+        extent_margin=0):
+    if len(rectangle_array) == 0:
+        return []
+    line_segments = line_segment_array.astype(np.float64)
+    midpoints = line_segments.mean(axis=1)
+    # The pairs of rectangles and line segments are found by comparing the
+    # midpoints of all line segments with all rectangles, since there are only
+    # a few rectangles left at this point.
+    rectangle_mins = rectangle_array[:, np.newaxis, 0]
+    rectangle_maxs = rectangle_array[:, np.newaxis, 1]
+    rectangle_indices, segment_indices = np.nonzero(
+        np.all((rectangle_mins <= midpoints) & (midpoints <= rectangle_maxs),
+               axis=2)
+    )
+    # 1)
+    first_points = line_segments[segment_indices, 0]
+    second_points = line_segments[segment_indices, 1]
+    midpoints = midpoints[segment_indices]
+    segment_weights = np.hypot(*(second_points - first_points).T) + 1
+    x_1, y_1 = first_points.T
+    x_2, y_2 = second_points.T
+    x_m, y_m = midpoints.T
+    rectangle_count = len(rectangle_array)
+    weight_sums, x_sums, y_sums, x_squared_sums, y_squared_sums, xy_sums = [
+        np.bincount(rectangle_indices, summands, rectangle_count)
+        for summands in [
+            segment_weights,
+            segment_weights * x_m,
+            segment_weights * y_m,
+            segment_weights * (x_1 * x_1 + 4 * x_m * x_m + x_2 * x_2) / 6,
+            segment_weights * (y_1 * y_1 + 4 * y_m * y_m + y_2 * y_2) / 6,
+            segment_weights * (x_1 * y_1 + 4 * x_m * y_m + x_2 * y_2) / 6
+        ]
+    ]
+    # 2)
+    x_0 = x_sums / weight_sums
+    y_0 = y_sums / weight_sums
+    dx_2 = x_squared_sums / weight_sums - x_0 * x_0
+    dy_2 = y_squared_sums / weight_sums - y_0 * y_0
+    dxy = xy_sums / weight_sums - x_0 * y_0
+    angles = np.arctan2(2 * dxy, dx_2 - dy_2) / 2
+    delta_x = np.cos(angles)
+    delta_y = np.sin(angles)
+    # 3)
+    coordinate_index = 0 if compute_horizontal else 1
+    segment_coordinates = line_segments[segment_indices, :, coordinate_index]
+    coordinates_1 = np.full(rectangle_count, np.inf)
+    coordinates_2 = np.full(rectangle_count, -np.inf)
+    np.minimum.at(coordinates_1,
+                  rectangle_indices,
+                  segment_coordinates.min(axis=1))
+    np.maximum.at(coordinates_2,
+                  rectangle_indices,
+                  segment_coordinates.max(axis=1))
+    coordinates_1 = np.maximum(coordinates_1 - extent_margin,
+                               rectangle_array[:, 0, coordinate_index])
+    coordinates_2 = np.minimum(coordinates_2 + extent_margin,
+                               rectangle_array[:, 1, coordinate_index])
+    if compute_horizontal:
+        x_1 = coordinates_1
+        x_2 = coordinates_2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = delta_y / delta_x
+            y_1 = np.where(delta_y == 0, y_0, slopes * (x_1 - x_0) + y_0)
+            y_2 = np.where(delta_y == 0, y_0, slopes * (x_2 - x_0) + y_0)
+    else:
+        y_1 = coordinates_1
+        y_2 = coordinates_2
+        with np.errstate(divide='ignore', invalid='ignore'):
+            slopes = delta_x / delta_y
+            x_1 = np.where(delta_x == 0, x_0, slopes * (y_1 - y_0) + x_0)
+            x_2 = np.where(delta_x == 0, x_0, slopes * (y_2 - y_0) + x_0)
+    horizontal_or_vertical_lines = (
+        np.stack([x_1, y_1, x_2, y_2], axis=1).astype(np.int64)
+        .reshape(-1, 2, 2).tolist()
+    )
+    return horizontal_or_vertical_lines
@@ -0,0 +1,292 @@
+# The functions in this file make it possible to measure how much time each
+# step of the table segmentation algorithm takes, and to record some counts
+# (e.g. the number of lsd_lines or contours) describing the amount of work
+# done in each step. The measurements are written into a JSON Lines file, i.e.,
+# a text file containing one JSON object per line, which is easy to analyse
+# with other tools.
+
+# A step is measured by enclosing its code in a so-called span:
+
+# with instrumentation_functions.span('find_contours') as counts:
+#     contours = ...
+#     counts['contours'] = len(contours)
+
+# Spans can be nested, and the name of a recorded span is the path formed by
+# the names of the enclosing spans, e.g. table_structure/horizontal_table_lines/
+# fit_line. A recorded span, or a timing event, is a dictionary of the form
+# {'span': name, 'start': start_time, 'duration': duration, 'counts': counts}.
+
+# The instrumentation is disabled by default, in which case a span does nothing
+# but yield a dictionary for the counts (which is then discarded). The timing
+# events are collected by enclosing the code in collect_timing_events:
+
+# with instrumentation_functions.collect_timing_events() as timing_events:
+#     ...
+
+# The collection is specific to the current thread, so the pages processed by
+# different threads at the same time (see multiple_logbooks_test) do not get
+# their timing events mixed up. Since the worker processes collect their own
+# timing events, the events of a page are returned to the main process as a
+# part of the page result (see process_page_image in main_test_functions.py).
+
+# In addition, an opt-in resource accounting mode can be enabled. In this mode,
+# each timing event also contains the dictionary 'resources' with the
+# following figures:
+# rss_before, rss_after: the resident set size of the process (in bytes) at the
+# beginning and at the end of the span,
+# max_rss: the peak resident set size of the process so far (in bytes),
+# traced_memory_delta: the change in the amount of memory allocated by Python
+# and numpy during the span (as measured by tracemalloc),
+# traced_memory_peak: the peak amount of memory allocated by Python and numpy
+# during the span, relative to the amount allocated at the beginning,
+# user_time, system_time: the CPU time spent by the thread (or by the process,
+# where thread-specific figures are not available) during the span.
+# Note that the memory figures are process-wide, so they include the memory
+# allocated by other threads running at the same time, and the memory
+# allocated internally by cv2 is only visible in the resident set sizes. The
+# resource accounting slows down the processing considerably, mainly due to
+# tracemalloc.
+
+import numpy as np
+import contextlib
+import contextvars
+import tracemalloc
+import json
+import time
+import os
+
+# The resource module is not available on all platforms. Without it, the CPU
+# times and the peak resident set size are not recorded.
+try:
+    import resource
+except ImportError:
+    resource = None
+
+INSTRUMENTATION_ENABLED = False
+RESOURCE_ACCOUNTING_ENABLED = False
+
+# The percentiles printed at the end of a run.
+
+SUMMARY_PERCENTILES = [50, 95, 99]
+
+# The names of the enclosing spans are stored in a context variable, so that
+# spans opened in different threads do not get mixed up.
+
+SPAN_PATH = contextvars.ContextVar('span_path', default=())
+
+# In the resource accounting mode, the context variable below holds a list
+# [traced_memory_peak] for the innermost enclosing span. Since the peak of
+# tracemalloc is reset at the beginning of each span, a span passes the peak
+# measured by it on to the enclosing span (see measure_span_resources).
+
+TRACED_MEMORY_PEAK = contextvars.ContextVar('traced_memory_peak', default=None)
+
+# The context variable below holds the list into which the timing events of
+# the current thread are collected, or None if the events are not collected.
+
+TIMING_EVENT_LIST = contextvars.ContextVar('timing_event_list', default=None)
+
+# The function below enables or disables the instrumentation. The resource
+# accounting mode can only be enabled together with the instrumentation.
+
+def enable_instrumentation(enabled=True, resource_accounting_enabled=False):
+    global INSTRUMENTATION_ENABLED
+    global RESOURCE_ACCOUNTING_ENABLED
+    INSTRUMENTATION_ENABLED = enabled
+    RESOURCE_ACCOUNTING_ENABLED = enabled and resource_accounting_enabled
+    if RESOURCE_ACCOUNTING_ENABLED and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+# The following function returns the current resident set size of the process
+# in bytes, or None if it cannot be determined (the /proc file system is only
+# available on Linux).
+
+def get_current_rss():
+    try:
+        with open('/proc/self/statm') as statm_file:
+            resident_pages = int(statm_file.read().split()[1])
+    except (OSError, ValueError, IndexError):
+        return None
+    current_rss = resident_pages * os.sysconf('SC_PAGE_SIZE')
+    return current_rss
+
+# The function below returns the list [user_time, system_time, max_rss]. The
+# value of max_rss is given by getrusage in kilobytes on Linux.
+
+def get_resource_usage():
+    if resource is None:
+        return [None, None, None]
+    who = getattr(resource, 'RUSAGE_THREAD', resource.RUSAGE_SELF)
+    resource_usage = resource.getrusage(who)
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return [resource_usage.ru_utime, resource_usage.ru_stime, max_rss]
+
+# The following context manager measures the resources used by the code in its
+# body and stores the figures in the dictionary resources.
+
+@contextlib.contextmanager
+def measure_span_resources(resources):
+    # Pass the peak measured so far on to the enclosing span before resetting
+    # the peak.
+    enclosing_peak = TRACED_MEMORY_PEAK.get()
+    traced_memory_before, traced_memory_peak = tracemalloc.get_traced_memory()
+    if enclosing_peak is not None:
+        enclosing_peak[0] = max(enclosing_peak[0], traced_memory_peak)
+    tracemalloc.reset_peak()
+    span_peak = [traced_memory_before]
+    token = TRACED_MEMORY_PEAK.set(span_peak)
+    rss_before = get_current_rss()
+    user_time_before, system_time_before, _ = get_resource_usage()
+    try:
+        yield
+    finally:
+        user_time_after, system_time_after, max_rss = get_resource_usage()
+        traced_memory_after, traced_memory_peak = (
+            tracemalloc.get_traced_memory()
+        )
+        span_peak[0] = max(span_peak[0], traced_memory_peak)
+        TRACED_MEMORY_PEAK.reset(token)
+        if enclosing_peak is not None:
+            enclosing_peak[0] = max(enclosing_peak[0], span_peak[0])
+        resources.update({
+            'rss_before': rss_before,
+            'rss_after': get_current_rss(),
+            'max_rss': max_rss,
+            'traced_memory_delta': traced_memory_after - traced_memory_before,
+            'traced_memory_peak': span_peak[0] - traced_memory_before
+        })
+        if user_time_before is not None:
+            resources['user_time'] = user_time_after - user_time_before
+            resources['system_time'] = system_time_after - system_time_before
+
+@contextlib.contextmanager
+def span(name):
+    counts = {}
+    if not INSTRUMENTATION_ENABLED:
+        yield counts
+        return
+    span_path = SPAN_PATH.get() + (name,)
+    token = SPAN_PATH.set(span_path)
+    resources = {}
+    if RESOURCE_ACCOUNTING_ENABLED:
+        resource_measurement = measure_span_resources(resources)
+    else:
+        resource_measurement = contextlib.nullcontext()
+    start_time = time.time()
+    start_counter = time.perf_counter()
+    try:
+        with resource_measurement:
+            yield counts
+    finally:
+        duration = time.perf_counter() - start_counter
+        SPAN_PATH.reset(token)
+        timing_event = {'span': '/'.join(span_path),
+                        'start': start_time,
+                        'duration': duration,
+                        'counts': counts}
+        if RESOURCE_ACCOUNTING_ENABLED:
+            timing_event['resources'] = resources
+        timing_event_list = TIMING_EVENT_LIST.get()
+        if timing_event_list is not None:
+            timing_event_list.append(timing_event)
+
+# The context manager below yields a list into which the timing events of the
+# spans ending in its body are collected, in the order in which the spans end.
+# The events are collected into the innermost list only.
+
+@contextlib.contextmanager
+def collect_timing_events():
+    timing_events = []
+    token = TIMING_EVENT_LIST.set(timing_events)
+    try:
+        yield timing_events
+    finally:
+        TIMING_EVENT_LIST.reset(token)
+
+# The following function writes timing events into a JSON Lines file. The
+# dictionary page_information (e.g. the logbook and the image number of the
+# page) is added to each event.
+
+def write_timing_events(timing_event_file, timing_events, page_information):
+    for timing_event in timing_events:
+        timing_event_line = json.dumps(dict(page_information, **timing_event))
+        timing_event_file.write(timing_event_line + '\n')
+    timing_event_file.flush()
+
+# The function below adds timing events to span_timing_events, which is a
+# dictionary mapping span names to lists of timing events.
+
+def collect_span_timing_events(span_timing_events, timing_events):
+    for timing_event in timing_events:
+        span_timing_events.setdefault(timing_event['span'], []).append(
+            timing_event
+        )
+
+# The following function computes the number of occurrences, the total
+# duration and the percentiles SUMMARY_PERCENTILES of the durations of each
+# span. The return value is a list of summary dictionaries sorted by the total
+# duration, so that the most expensive spans come first.
+
+# If the timing events contain resource figures, the summary of a span also
+# contains the maximum traced memory peak, the maximum peak resident set size
+# and the total user and system times of the span.
+
+def construct_span_duration_summaries(span_timing_events):
+    span_duration_summaries = []
+    for name, timing_events in span_timing_events.items():
+        durations = [timing_event['duration']
+                     for timing_event in timing_events]
+        span_duration_summary = {'summary': name,
+                                 'count': len(durations),
+                                 'total': float(np.sum(durations))}
+        percentile_values = np.percentile(durations, SUMMARY_PERCENTILES)
+        for percentile, value in zip(SUMMARY_PERCENTILES, percentile_values):
+            span_duration_summary['p{}'.format(percentile)] = float(value)
+        resources = [timing_event['resources']
+                     for timing_event in timing_events
+                     if 'resources' in timing_event]
+        if resources:
+            span_duration_summary['max_traced_memory_peak'] = max(
+                figures['traced_memory_peak'] for figures in resources
+            )
+            span_duration_summary['max_rss'] = max(
+                figures['max_rss'] or 0 for figures in resources
+            )
+            span_duration_summary['user_time'] = sum(
+                figures.get('user_time', 0) for figures in resources
+            )
+            span_duration_summary['system_time'] = sum(
+                figures.get('system_time', 0) for figures in resources
+            )
+        span_duration_summaries.append(span_duration_summary)
+    span_duration_summaries.sort(key=lambda summary: -summary['total'])
+    return span_duration_summaries
+
+def print_span_duration_summaries(span_duration_summaries):
+    span_duration_summaries_string = 'Span durations (count, total, '
+    span_duration_summaries_string += ', '.join(
+        'p{}'.format(percentile) for percentile in SUMMARY_PERCENTILES
+    )
+    span_duration_summaries_string += '): \n'
+    for summary in span_duration_summaries:
+        percentile_string = ' '.join(
+            '{:.3f}s'.format(summary['p{}'.format(percentile)])
+            for percentile in SUMMARY_PERCENTILES
+        )
+        span_duration_summaries_string += '{}: {} {:.2f}s {}'.format(
+            summary['summary'],
+            summary['count'],
+            summary['total'],
+            percentile_string
+        )
+        if 'max_traced_memory_peak' in summary:
+            span_duration_summaries_string += (
+                ', peak {:.1f}MB, max RSS {:.1f}MB, '.format(
+                    summary['max_traced_memory_peak'] / 1024 ** 2,
+                    summary['max_rss'] / 1024 ** 2
+                )
+                + 'user {:.2f}s, sys {:.2f}s'.format(summary['user_time'],
+                                                    summary['system_time'])
+            )
+        span_duration_summaries_string += ' \n'
+    print(span_duration_summaries_string)
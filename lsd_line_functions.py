@@ -212,3 +212,446 @@ def draw_lsd_lines_in_octave_images(image,
                         cv.LINE_AA)
         octave_images.append(octave_image)
     return octave_images
+
+# The functions above process lsd_lines one at a time in Python, which is slow
+# when there are thousands of lsd_lines. The main algorithm therefore converts
+# the detected lsd_lines once into so-called lsd_line_arrays, a list of numpy
+# arrays with one element (or row) per lsd_line, and the functions below
+# process all lsd_line_arrays at once. The list consists of
+# 1) an array of shape (N, 4) of the endpoints, whose rows are of the form
+#    [x_1, y_1, x_2, y_2] (see compute_lsd_line_endpoint_array below),
+# 2) an array of the angles (the attribute angle),
+# 3) an array of the lengths (see compute_lsd_line_length),
+# 4) an array of the octaves (the attribute octave) and
+# 5) an array of the responses (the attribute response).
+# The line segments detected by other line segment detectors than the
+# LSDDetector can be converted into lsd_line_arrays directly (see
+# create_lsd_line_arrays_from_endpoints), and lsd_line_arrays can be converted
+# back into lsd_lines for the functions above (see
+# convert_lsd_line_arrays_to_lsd_lines).
+
+def create_lsd_line_arrays(lsd_lines):
+    endpoint_array = compute_lsd_line_endpoint_array(lsd_lines)
+    angle_array = np.array([lsd_line.angle for lsd_line in lsd_lines],
+                           dtype=np.float64)
+    octave_array = np.array([lsd_line.octave for lsd_line in lsd_lines],
+                            dtype=np.int32)
+    response_array = np.array([lsd_line.response for lsd_line in lsd_lines],
+                              dtype=np.float64)
+    lsd_line_arrays = [endpoint_array,
+                       angle_array,
+                       compute_lsd_line_array_lengths(endpoint_array),
+                       octave_array,
+                       response_array]
+    return lsd_line_arrays
+
+# The following function creates lsd_line_arrays from an array of shape (N, 4)
+# of endpoints. The line segments are regarded as line segments of the first
+# octave, and the responses are zero.
+
+def create_lsd_line_arrays_from_endpoints(endpoint_array):
+    endpoint_array = np.asarray(endpoint_array, dtype=np.float64).reshape(-1, 4)
+    x_1, y_1, x_2, y_2 = endpoint_array.T
+    number_of_lsd_lines = len(endpoint_array)
+    lsd_line_arrays = [endpoint_array,
+                       np.arctan2(y_2 - y_1, x_2 - x_1),
+                       compute_lsd_line_array_lengths(endpoint_array),
+                       np.zeros(number_of_lsd_lines, dtype=np.int32),
+                       np.zeros(number_of_lsd_lines, dtype=np.float64)]
+    return lsd_line_arrays
+
+def compute_lsd_line_array_lengths(endpoint_array):
+    x_1, y_1, x_2, y_2 = endpoint_array.T
+    length_array = np.sqrt(np.square(x_2 - x_1) + np.square(y_2 - y_1))
+    return length_array
+
+def select_lsd_line_arrays(lsd_line_arrays, selection):
+    return [array[selection] for array in lsd_line_arrays]
+
+# The function below is the counterpart of filter_lsd_lines for lsd_line_arrays.
+# The conditions are evaluated for all lsd_lines at once, and the return value
+# consists of the lsd_line_arrays of the remaining lsd_lines (in the original
+# order).
+
+def filter_lsd_line_arrays(lsd_line_arrays,
+                           length_upper_bound=-1,
+                           length_lower_bound=-1,
+                           cos_upper_bound=-1,
+                           cos_lower_bound=-1,
+                           sin_upper_bound=-1,
+                           sin_lower_bound=-1):
+    _, angle_array, length_array, _, _ = lsd_line_arrays
+    mask = np.ones(len(length_array), dtype=bool)
+    if length_upper_bound > 0:
+        mask &= length_array <= length_upper_bound
+    if length_lower_bound > 0:
+        mask &= length_array >= length_lower_bound
+    if cos_upper_bound > 0 or cos_lower_bound > 0:
+        abs_cos_array = np.abs(np.cos(angle_array))
+        if cos_upper_bound > 0:
+            mask &= abs_cos_array <= cos_upper_bound
+        if cos_lower_bound > 0:
+            mask &= abs_cos_array >= cos_lower_bound
+    if sin_upper_bound > 0 or sin_lower_bound > 0:
+        abs_sin_array = np.abs(np.sin(angle_array))
+        if sin_upper_bound > 0:
+            mask &= abs_sin_array <= sin_upper_bound
+        if sin_lower_bound > 0:
+            mask &= abs_sin_array >= sin_lower_bound
+    return select_lsd_line_arrays(lsd_line_arrays, mask)
+
+# The following function computes the integer endpoints of lsd_line_arrays in
+# the same way as get_lsd_line_start_point_and_end_point, i.e., the
+# coordinates are truncated. The return value is an int32 array of shape
+# (N, 2, 2).
+
+def compute_lsd_line_array_points(lsd_line_arrays):
+    endpoint_array = lsd_line_arrays[0]
+    point_array = endpoint_array.astype(np.int32).reshape(-1, 2, 2)
+    return point_array
+
+# The function below is the counterpart of draw_lsd_lines for lsd_line_arrays.
+# All line segments are drawn by a single call of the function polylines of
+# cv2, which draws exactly the same pixels as drawing the line segments one by
+# one.
+
+def draw_lsd_line_arrays(image, lsd_line_arrays, color, thickness):
+    point_array = compute_lsd_line_array_points(lsd_line_arrays)
+    if len(point_array) == 0:
+        return
+    cv.polylines(image,
+                 list(point_array),
+                 False,
+                 color,
+                 thickness,
+                 cv.LINE_AA)
+
+# The following function converts lsd_line_arrays back into lsd_lines, e.g.
+# for the study and drawing functions above. The coordinates in the octave are
+# obtained by dividing the coordinates by scale ** octave, where scale is the
+# scale of the line segment detector (see LSD_LINE_DETECTOR_SCALE in
+# main_computer_vision_functions.py). The attributes which are not included in
+# lsd_line_arrays are left at their default values.
+
+def convert_lsd_line_arrays_to_lsd_lines(lsd_line_arrays, scale=2):
+    lsd_lines = []
+    for class_id, (endpoints, angle, length, octave, response) in enumerate(
+            zip(*lsd_line_arrays)):
+        lsd_line = cv.line_descriptor.KeyLine()
+        x_1, y_1, x_2, y_2 = [float(coordinate) for coordinate in endpoints]
+        octave_scale = scale ** int(octave)
+        lsd_line.startPointX = x_1
+        lsd_line.startPointY = y_1
+        lsd_line.endPointX = x_2
+        lsd_line.endPointY = y_2
+        lsd_line.sPointInOctaveX = x_1 / octave_scale
+        lsd_line.sPointInOctaveY = y_1 / octave_scale
+        lsd_line.ePointInOctaveX = x_2 / octave_scale
+        lsd_line.ePointInOctaveY = y_2 / octave_scale
+        lsd_line.pt = ((x_1 + x_2) / 2, (y_1 + y_2) / 2)
+        lsd_line.angle = float(angle)
+        lsd_line.lineLength = float(length) / octave_scale
+        lsd_line.octave = int(octave)
+        lsd_line.response = float(response)
+        lsd_line.class_id = class_id
+        lsd_lines.append(lsd_line)
+    return lsd_lines
+
+# The functions below are used by the tiled line segment detection (see
+# detect_lsd_lines in main_computer_vision_functions.py). In the tiled
+# detection, the input image is divided into a grid of tiles of roughly equal
+# size, each tile is extended by tile_overlap pixels on every side (within the
+# image), and the lsd_lines of the extended tiles are detected separately. The
+# lsd_lines of the tiles are then translated to the coordinate system of the
+# input image and merged into a single collection of lsd_lines.
+
+# A tile is represented by a list [core_rectangle, tile_rectangle], where
+# tile_rectangle is the extended tile and core_rectangle is the part of the
+# image which belongs to this tile only. Both rectangles are of the form
+# [[x_min, y_min], [x_max, y_max]], where x_max and y_max are exclusive. The
+# tile boundaries are chosen so that the number of tiles in each direction is
+# the smallest one for which no tile is larger than tile_size, which guarantees
+# that no tile is less than half of tile_size in size.
+
+def compute_lsd_tiles(image_shape, tile_size, tile_overlap):
+    height, width = image_shape[:2]
+    num_rows = max(1, int(np.ceil(height / tile_size)))
+    num_columns = max(1, int(np.ceil(width / tile_size)))
+    y_boundaries = [round(k * height / num_rows) for k in range(num_rows + 1)]
+    x_boundaries = [round(k * width / num_columns)
+                    for k in range(num_columns + 1)]
+    lsd_tiles = []
+    for y_min, y_max in zip(y_boundaries[:-1], y_boundaries[1:]):
+        for x_min, x_max in zip(x_boundaries[:-1], x_boundaries[1:]):
+            core_rectangle = [[x_min, y_min], [x_max, y_max]]
+            tile_rectangle = [[max(0, x_min - tile_overlap),
+                               max(0, y_min - tile_overlap)],
+                              [min(width, x_max + tile_overlap),
+                               min(height, y_max + tile_overlap)]]
+            lsd_tiles.append([core_rectangle, tile_rectangle])
+    return lsd_tiles
+
+# The function below translates the given lsd_lines (in place) by the vector
+# (x_offset, y_offset), e.g. from the coordinate system of a tile to that of
+# the input image. Besides the endpoints and the middle point, an lsd_line has
+# the endpoints in the coordinate system of its octave, which are scaled by
+# the factor scale ** octave (see LSD_LINE_DETECTOR_SCALE in
+# main_computer_vision_functions.py).
+
+def translate_lsd_lines(lsd_lines, x_offset, y_offset, scale):
+    for lsd_line in lsd_lines:
+        lsd_line.startPointX += x_offset
+        lsd_line.startPointY += y_offset
+        lsd_line.endPointX += x_offset
+        lsd_line.endPointY += y_offset
+        x_mid, y_mid = lsd_line.pt
+        lsd_line.pt = (x_mid + x_offset, y_mid + y_offset)
+        octave_scale = scale ** lsd_line.octave
+        lsd_line.sPointInOctaveX += x_offset / octave_scale
+        lsd_line.sPointInOctaveY += y_offset / octave_scale
+        lsd_line.ePointInOctaveX += x_offset / octave_scale
+        lsd_line.ePointInOctaveY += y_offset / octave_scale
+
+# The function below maps the given lsd_lines (in place) from an image
+# downscaled by the factor scale to the original image. The octave of each
+# lsd_line is increased by one, so the coordinates in the octave (and the
+# attribute lineLength, which is measured in them) stay the same.
+
+def upscale_lsd_lines(lsd_lines, scale):
+    for lsd_line in lsd_lines:
+        lsd_line.startPointX *= scale
+        lsd_line.startPointY *= scale
+        lsd_line.endPointX *= scale
+        lsd_line.endPointY *= scale
+        x_mid, y_mid = lsd_line.pt
+        lsd_line.pt = (x_mid * scale, y_mid * scale)
+        lsd_line.octave += 1
+
+# The simple function below collects the endpoints of the given lsd_lines into
+# a numpy array of shape (N, 4), whose rows are of the form
+# [x_1, y_1, x_2, y_2].
+
+def compute_lsd_line_endpoint_array(lsd_lines):
+    endpoint_array = np.array(
+        [[lsd_line.startPointX,
+          lsd_line.startPointY,
+          lsd_line.endPointX,
+          lsd_line.endPointY] for lsd_line in lsd_lines],
+        dtype=np.float64
+    ).reshape(-1, 4)
+    return endpoint_array
+
+# The following function determines which pairs of line segments are pieces of
+# the same line. The line segments are given as two endpoint arrays (see
+# above), and the return value is a Boolean array whose element (i, j) tells
+# whether the i-th segment of the first array and the j-th segment of the
+# second array match. Two segments match if
+# 1) they are parallel, i.e., the sine of the angle between them is at most
+#    sin_tolerance,
+# 2) the endpoints of one of them are at most distance_tolerance pixels away
+#    from the line through the other one, and
+# 3) they overlap or there is a gap of at most distance_tolerance pixels
+#    between them along the line.
+
+def match_line_segments(first_endpoint_array,
+                        second_endpoint_array,
+                        distance_tolerance,
+                        sin_tolerance):
+    def compute_directions(endpoint_array):
+        difference = endpoint_array[:, 2:] - endpoint_array[:, :2]
+        lengths = np.sqrt(np.sum(np.square(difference), axis=1))
+        directions = difference / np.maximum(lengths, 1e-9)[:, np.newaxis]
+        return directions, lengths
+    def compute_distances_and_projections(endpoint_array,
+                                          directions,
+                                          other_endpoint_array):
+        # Element (i, j, k) concerns the k-th endpoint of the j-th segment of
+        # other_endpoint_array and the line through the i-th segment of
+        # endpoint_array.
+        start_points = endpoint_array[:, np.newaxis, np.newaxis, :2]
+        other_endpoints = other_endpoint_array.reshape(1, -1, 2, 2)
+        differences = other_endpoints - start_points
+        directions = directions[:, np.newaxis, np.newaxis, :]
+        distances = np.abs(directions[..., 0] * differences[..., 1]
+                           - directions[..., 1] * differences[..., 0])
+        projections = np.sum(directions * differences, axis=3)
+        return distances, projections
+    first_directions, first_lengths = compute_directions(first_endpoint_array)
+    second_directions, second_lengths = (
+        compute_directions(second_endpoint_array)
+    )
+    sines = np.abs(first_directions[:, np.newaxis, 0]
+                   * second_directions[np.newaxis, :, 1]
+                   - first_directions[:, np.newaxis, 1]
+                   * second_directions[np.newaxis, :, 0])
+    first_distances, first_projections = compute_distances_and_projections(
+        first_endpoint_array,
+        first_directions,
+        second_endpoint_array
+    )
+    second_distances, _ = compute_distances_and_projections(
+        second_endpoint_array,
+        second_directions,
+        first_endpoint_array
+    )
+    near = ((np.max(first_distances, axis=2) <= distance_tolerance)
+            | (np.max(second_distances, axis=2) <= distance_tolerance).T)
+    overlapping = (
+        (np.max(first_projections, axis=2) >= -distance_tolerance)
+        & (np.min(first_projections, axis=2)
+           <= first_lengths[:, np.newaxis] + distance_tolerance)
+    )
+    matches = (sines <= sin_tolerance) & near & overlapping
+    return matches
+
+# The function below merges the lsd_lines detected in the tiles (given as a
+# list containing a list of lsd_lines for each tile, already translated to the
+# coordinate system of the input image). There are two kinds of lsd_lines
+# which have to be taken care of:
+# 1) An lsd_line which lies in the overlap of two tiles is typically detected
+#    in both tiles. Of these duplicates, only the one detected in the tile
+#    whose core rectangle contains the middle point of the lsd_line is kept.
+# 2) An lsd_line which crosses the boundary of an extended tile is cut by the
+#    boundary. The pieces of the lsd_line are the lsd_lines which have an
+#    endpoint on a boundary of their tile that is not a boundary of the image.
+#    Each piece is compared with the lsd_lines of the other tiles that lie in
+#    the overlap of the tiles with match_line_segments, and the matching
+#    lsd_lines are combined into groups. Each group is replaced by a single
+#    lsd_line that spans all the lsd_lines of the group.
+
+def merge_tile_lsd_lines(lsd_tiles,
+                         tile_lsd_lines,
+                         distance_tolerance=3,
+                         sin_tolerance=0.05):
+    lsd_lines = []
+    tile_indices = []
+    for tile_index, lsd_lines_of_tile in enumerate(tile_lsd_lines):
+        lsd_lines.extend(lsd_lines_of_tile)
+        tile_indices.extend([tile_index] * len(lsd_lines_of_tile))
+    tile_indices = np.array(tile_indices, dtype=np.int64)
+    endpoint_array = compute_lsd_line_endpoint_array(lsd_lines)
+    x_mins = np.minimum(endpoint_array[:, 0], endpoint_array[:, 2])
+    x_maxs = np.maximum(endpoint_array[:, 0], endpoint_array[:, 2])
+    y_mins = np.minimum(endpoint_array[:, 1], endpoint_array[:, 3])
+    y_maxs = np.maximum(endpoint_array[:, 1], endpoint_array[:, 3])
+    x_mids = (endpoint_array[:, 0] + endpoint_array[:, 2]) / 2
+    y_mids = (endpoint_array[:, 1] + endpoint_array[:, 3]) / 2
+    # The image boundaries are the maximum extents of the tiles.
+    image_x_max = max(lsd_tile[1][1][0] for lsd_tile in lsd_tiles)
+    image_y_max = max(lsd_tile[1][1][1] for lsd_tile in lsd_tiles)
+    owned = np.zeros(len(lsd_lines), dtype=bool)
+    cut = np.zeros(len(lsd_lines), dtype=bool)
+    for tile_index, lsd_tile in enumerate(lsd_tiles):
+        (core_x_min, core_y_min), (core_x_max, core_y_max) = lsd_tile[0]
+        (x_min, y_min), (x_max, y_max) = lsd_tile[1]
+        in_tile = tile_indices == tile_index
+        owned[in_tile] = ((x_mids[in_tile] >= core_x_min)
+                          & (x_mids[in_tile] < core_x_max)
+                          & (y_mids[in_tile] >= core_y_min)
+                          & (y_mids[in_tile] < core_y_max))
+        cut_boundaries = np.zeros(np.count_nonzero(in_tile), dtype=bool)
+        if x_min > 0:
+            cut_boundaries |= x_mins[in_tile] <= x_min + distance_tolerance
+        if y_min > 0:
+            cut_boundaries |= y_mins[in_tile] <= y_min + distance_tolerance
+        if x_max < image_x_max:
+            cut_boundaries |= x_maxs[in_tile] >= x_max - distance_tolerance
+        if y_max < image_y_max:
+            cut_boundaries |= y_maxs[in_tile] >= y_max - distance_tolerance
+        cut[in_tile] = cut_boundaries
+    # The groups are maintained with a simple union-find structure.
+    parents = list(range(len(lsd_lines)))
+    def find_root(k):
+        while parents[k] != k:
+            parents[k] = parents[parents[k]]
+            k = parents[k]
+        return k
+    for first_tile_index, first_lsd_tile in enumerate(lsd_tiles):
+        for second_tile_index, second_lsd_tile in enumerate(lsd_tiles):
+            if first_tile_index == second_tile_index:
+                continue
+            (first_x_min, first_y_min), (first_x_max, first_y_max) = (
+                first_lsd_tile[1]
+            )
+            (second_x_min, second_y_min), (second_x_max, second_y_max) = (
+                second_lsd_tile[1]
+            )
+            x_min = max(first_x_min, second_x_min) - distance_tolerance
+            x_max = min(first_x_max, second_x_max) + distance_tolerance
+            y_min = max(first_y_min, second_y_min) - distance_tolerance
+            y_max = min(first_y_max, second_y_max) + distance_tolerance
+            if x_min >= x_max or y_min >= y_max:
+                continue
+            in_overlap = ((x_maxs >= x_min) & (x_mins <= x_max)
+                          & (y_maxs >= y_min) & (y_mins <= y_max))
+            first_indices = np.flatnonzero(
+                in_overlap & cut & (tile_indices == first_tile_index)
+            )
+            second_indices = np.flatnonzero(
+                in_overlap & (tile_indices == second_tile_index)
+            )
+            if len(first_indices) == 0 or len(second_indices) == 0:
+                continue
+            matches = match_line_segments(endpoint_array[first_indices],
+                                          endpoint_array[second_indices],
+                                          distance_tolerance,
+                                          sin_tolerance)
+            for i, j in zip(*np.nonzero(matches)):
+                first_root = find_root(int(first_indices[i]))
+                second_root = find_root(int(second_indices[j]))
+                if first_root != second_root:
+                    parents[second_root] = first_root
+    groups = {}
+    for k in range(len(lsd_lines)):
+        groups.setdefault(find_root(k), []).append(k)
+    merged_lsd_lines = []
+    for group in groups.values():
+        if len(group) == 1:
+            if owned[group[0]]:
+                merged_lsd_lines.append(lsd_lines[group[0]])
+            continue
+        # The merged lsd_line runs along the longest lsd_line of the group,
+        # and its endpoints are the extreme endpoints of the group in the
+        # direction of the longest lsd_line.
+        group_endpoints = endpoint_array[group].reshape(-1, 2)
+        lengths = np.sqrt(
+            np.sum(np.square(endpoint_array[group, 2:]
+                             - endpoint_array[group, :2]), axis=1)
+        )
+        longest_index = group[int(np.argmax(lengths))]
+        start_point = endpoint_array[longest_index, :2]
+        direction = endpoint_array[longest_index, 2:] - start_point
+        projections = (group_endpoints - start_point) @ direction
+        merged_lsd_lines.append(create_merged_lsd_line(
+            lsd_lines[longest_index],
+            group_endpoints[np.argmin(projections)],
+            group_endpoints[np.argmax(projections)]
+        ))
+    return merged_lsd_lines
+
+# The following function creates a new lsd_line with the given endpoints. The
+# other attributes are copied from the given lsd_line, except for those which
+# depend on the endpoints. Only lsd_lines of the first octave are merged (see
+# detect_lsd_lines), so the coordinates in the octave are the same as the
+# coordinates in the input image.
+
+def create_merged_lsd_line(lsd_line, start_point, end_point):
+    merged_lsd_line = cv.line_descriptor.KeyLine()
+    for attribute in ['class_id', 'numOfPixels', 'octave', 'response',
+                      'size']:
+        setattr(merged_lsd_line, attribute, getattr(lsd_line, attribute))
+    x_1, y_1 = float(start_point[0]), float(start_point[1])
+    x_2, y_2 = float(end_point[0]), float(end_point[1])
+    merged_lsd_line.startPointX = x_1
+    merged_lsd_line.startPointY = y_1
+    merged_lsd_line.endPointX = x_2
+    merged_lsd_line.endPointY = y_2
+    merged_lsd_line.sPointInOctaveX = x_1
+    merged_lsd_line.sPointInOctaveY = y_1
+    merged_lsd_line.ePointInOctaveX = x_2
+    merged_lsd_line.ePointInOctaveY = y_2
+    merged_lsd_line.pt = ((x_1 + x_2) / 2, (y_1 + y_2) / 2)
+    merged_lsd_line.angle = np.arctan2(y_2 - y_1, x_2 - x_1)
+    merged_lsd_line.lineLength = np.sqrt(np.square(x_2 - x_1)
+                                         + np.square(y_2 - y_1))
+    return merged_lsd_line
@@ -4,9 +4,16 @@
 
 import numpy as np
 import cv2 as cv
+import concurrent.futures
+import contextvars
+import functools
+import threading
 
+import buffer_arena_functions
 import general_computer_vision_functions
+import geometric_array_operations
 import geometric_operations
+import instrumentation_functions
 import lsd_line_functions
 import utilities
 
@@ -26,9 +33,49 @@ LSD_LINE_DETECTOR_SCALE = 2
 LSD_LINES_IMAGE_COLOR = 255
 LSD_LINES_IMAGE_THICKNESS = 5
 
+# In the coarse-to-fine detection (see detect_table_lines_coarse_to_fine), the
+# lsd_lines of the downscaled image are drawn thinner, since otherwise nearby
+# table lines would merge at the coarse resolution.
+
+COARSE_LSD_LINES_IMAGE_THICKNESS = 1
+
+# In the morphological line engine, the line-like pixels are dilated with a
+# square kernel of the size below, so that they resemble the lsd_lines drawn
+# with the thickness LSD_LINES_IMAGE_THICKNESS.
+
+MORPHOLOGY_LINE_PIXELS_DILATION_SIZE = 3
+
 LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR = 255
 LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS = 1
 
+# Note that merge_rectangle_array in geometric_array_operations.py, which is
+# used in detect_horizontal_or_vertical_table_lines, reproduces the rectangles
+# drawn with the thickness 1 only. If the thickness above is changed, the
+# function merge_rectangle_array_by_drawing has to be used instead.
+
+# The table lines are assembled from the lsd_lines either by drawing and
+# merging rectangles ('raster') or by chaining the lsd_lines directly
+# ('chaining'), see detect_horizontal_or_vertical_table_lines. In the chaining,
+# the rectangles of two lsd_lines on the same table line may be at most
+# CHAINING_OFFSET_TOLERANCE pixels apart in the direction perpendicular to the
+# table line, and the rectangles are widened by CHAINING_RECTANGLE_MARGIN
+# pixels in addition to half of the thickness of the drawn lsd_lines.
+
+LINE_ASSEMBLY_METHODS = ['raster', 'chaining']
+CHAINING_OFFSET_TOLERANCE = 3
+CHAINING_RECTANGLE_MARGIN = 2
+
+# The table lines are fitted either to the pixels of the drawn lsd_lines
+# ('pixels') or directly to the endpoints and midpoints of the lsd_lines
+# ('segments'), see the step 7) of detect_horizontal_or_vertical_table_lines.
+# In the latter case, the table lines are extended by SEGMENT_FIT_EXTENT_MARGIN
+# pixels in addition to half of the thickness of the drawn lsd_lines, so that
+# they cover the drawn lsd_lines in the same way as the table lines fitted to
+# the pixels.
+
+LINE_FIT_METHODS = ['pixels', 'segments']
+SEGMENT_FIT_EXTENT_MARGIN = 1
+
 LSD_LINES_FULL_IMAGE_COLOR = (255, 0, 0)
 LSD_LINES_FULL_IMAGE_THICKNESS = 5
 
@@ -40,15 +87,120 @@ TABLE_LINE_THICKNESS = 5
 TABLE_ELEMENT_RECTANGLE_COLOR = (255, 0, 0)
 TABLE_ELEMENT_RECTANGLE_THICKNESS = 2
 
+# Creating an instance of the LSDDetector class is not free, and since the
+# instance does not depend on the input image, there is no need to create a new
+# instance for every page. The variable LSD_LINE_DETECTORS holds the instances
+# created by get_lsd_line_detector (see below), one for each thread, so that
+# each thread creates its instance only once. A separate instance is used in
+# each thread, since the tiles of a page may be processed by several threads at
+# the same time (see detect_lsd_lines). The instances of the other line segment
+# detectors (see LINE_SEGMENT_DETECTORS below) are held in the same way.
+
+LSD_LINE_DETECTORS = threading.local()
+
+# The function below returns the LSDDetector instance of the current thread,
+# and creates the instance if this has not been done yet. Worker processes call
+# this function already when they are started (see main_test_functions.py), so
+# that the first page processed by a worker does not pay the creation cost.
+
+def get_lsd_line_detector():
+    return get_line_segment_detector(
+        'lsd_line_detector',
+        cv.line_descriptor.LSDDetector.createLSDDetector
+    )
+
+# The following function returns the instance of the line segment detector
+# detector_name of the current thread. The instance is created by calling
+# create_detector if this has not been done yet.
+
+def get_line_segment_detector(detector_name, create_detector):
+    line_segment_detector = getattr(LSD_LINE_DETECTORS, detector_name, None)
+    if line_segment_detector is None:
+        line_segment_detector = create_detector()
+        setattr(LSD_LINE_DETECTORS, detector_name, line_segment_detector)
+    return line_segment_detector
+
+# The independent parts of the processing of a single page can be run in
+# parallel by a pool of threads, which reduces the time spent on a single page
+# when there are more cores than pages to process (e.g. in random_sample_test or
+# in the segmentation server). Threads are sufficient here, since the
+# functions of cv2 release the GIL. The following parts are independent: the
+# detection of the horizontal table lines and the detection of the vertical
+# table lines (see detect_table_structure), the line segment detection in the
+# tiles of the input image if the tiled detection is used (see
+# detect_lsd_lines), and the Otsu binarization of the
+# input image and the detection of the table structure (see
+# detect_table_structure_and_elements). The rest of the table element detection
+# depends on the table lines.
+
+# The variable PAGE_THREAD_POOL holds the thread pool of the current process, or
+# None if the parts are run one after the other (which is the default). The
+# pool must not be created before worker processes are forked, since the threads
+# of the pool would not exist in the worker processes, so each worker process
+# creates its own pool (see initialize_worker_process in main_test_functions.py).
+
+PAGE_THREAD_POOL = None
+
+def set_num_page_threads(num_page_threads):
+    global PAGE_THREAD_POOL
+    if PAGE_THREAD_POOL is not None:
+        PAGE_THREAD_POOL.shutdown(wait=False)
+        PAGE_THREAD_POOL = None
+    if num_page_threads > 1:
+        PAGE_THREAD_POOL = concurrent.futures.ThreadPoolExecutor(
+            num_page_threads
+        )
+
+# The function below runs the given functions (which take no arguments) and
+# returns the list of their return values. The first function is run in the
+# current thread and the others in the thread pool, if there is one. The
+# functions run in the pool must not call run_page_tasks themselves, since
+# otherwise the pool could run out of threads while the tasks wait for each
+# other.
+
+# Each function is run in a copy of the context of the current thread, so that
+# the spans opened in the function are nested in the current span (see
+# instrumentation_functions.py).
+
+def run_page_tasks(page_tasks):
+    if PAGE_THREAD_POOL is None:
+        page_task_results = [page_task() for page_task in page_tasks]
+        return page_task_results
+    page_task_futures = [submit_page_task(page_task)
+                         for page_task in page_tasks[1:]]
+    page_task_results = [page_tasks[0]()]
+    page_task_results.extend(page_task_future.result()
+                             for page_task_future in page_task_futures)
+    return page_task_results
+
+# The following function submits a single function to the page thread pool in
+# the same way as run_page_tasks, and returns the future of the function.
+
+def submit_page_task(page_task):
+    page_task_future = PAGE_THREAD_POOL.submit(
+        contextvars.copy_context().run,
+        page_task
+    )
+    return page_task_future
+
 # Depending on whether the value of detect_horizontal_lines is True or False,
 # the function below detects the horizontal or vertical table lines in the
-# input image, respectively. See the comments in the code below for a more
-# detailed description of the algorithm steps.
+# input image, respectively. The lsd_lines of the input image are given as
+# lsd_line_arrays (see lsd_line_functions.py). See the comments in the code
+# below for a more detailed description of the algorithm steps.
 
 # The directory ./example_images/example_progress_images contains the progress
 # image examples referred to in the code. We use the symbol k to refer to the
 # image file image_k.jpg.
 
+# If construct_progress_images or record_progress_geometry is True, the
+# geometric intermediate results of the algorithm are collected in a list
+# called progress_geometry (see below), which is all that is needed for drawing
+# the progress images. The progress images are drawn by draw_progress_images
+# only if construct_progress_images is True, so with record_progress_geometry
+# the drawing can be postponed, e.g. until someone actually wants to look at
+# the progress images of a page (see progress_geometry_functions.py).
+
 # The full list of progress image variable names is the following:
 # [image,
 #  lsd_lines_full_image,
@@ -63,8 +215,9 @@ TABLE_ELEMENT_RECTANGLE_THICKNESS = 2
 #  horizontal_or_vertical_table_lines_rectangles_image,
 #  horizontal_or_vertical_table_lines_full_image]
 
+@buffer_arena_functions.release_scratch_buffers
 def detect_horizontal_or_vertical_table_lines(image,
-                                              lsd_lines,
+                                              lsd_line_arrays,
                                               detect_horizontal_lines,
                                               line_length_lower_bound=-1,
                                               cos_upper_bound=-1,
@@ -72,94 +225,181 @@ def detect_horizontal_or_vertical_table_lines(image,
                                               right_extra_length=0,
                                               bottom_extra_length=0,
                                               rectangle_length_lower_bound=-1,
-                                              construct_progress_images=False):
-    # 1) Filter lsd_lines which are not long enough or which are not 
-    # sufficiently horizontal/vertical. The sin limit is used in the horizontal
-    # case and the cos limit in the vertical case.
-    lsd_lines = lsd_line_functions.filter_lsd_lines(
-        lsd_lines,
-        length_lower_bound=line_length_lower_bound,
-        cos_upper_bound=cos_upper_bound,
-        sin_upper_bound=sin_upper_bound
-    )
-    # 2) Draw the remaining lsd_lines in a zero-initialized image of the same
-    # shape as the input image.
-    # Relevant progress image variable names:
-    # lsd_lines_full_image,
-    # lsd_lines_image
-    # Relevant progress image examples: 2, 3, 13, 14
-    lsd_lines_image = np.zeros_like(image)
-    lsd_line_functions.draw_lsd_lines(
-        lsd_lines_image,
-        lsd_lines,
-        LSD_LINES_IMAGE_COLOR,
-        LSD_LINES_IMAGE_THICKNESS
-    )
-    # 3) Determine the connected components in the image drawn in 2).
-    lsd_lines_component_parameters = (
-        general_computer_vision_functions
-        .compute_connected_component_parameters(lsd_lines_image)
-    )
-    # 4) For each connected component determined in 3), we construct the minimal
-    # rectangle containing said component and extend the rectangle either
-    # rightwards or downwards, depending on whether we are looking for
-    # horizontal or vertical table lines, respectively.
-    # The idea is that for each relevant table line there are lsd_lines
-    # close to it and, therefore, also connected components determined in 3) 
-    # close to it. The hope is that, by extending the rectangles, each relevant 
-    # table line will be contained in a collection of mutually-intersecting 
-    # rectangles. (By definition, a collection of rectangles is said to be
-    # mutually-intersecting if for each rectangle in the collection there is at
-    # least one other rectangle in the collection which intersects the first
-    # rectangle).
-    # Relevant progress image variable names:
-    # lsd_lines_component_short_rectangles_image,
-    # lsd_lines_component_short_rectangles_zeros_image,
-    # lsd_lines_component_rectangles_image,
-    # Relevant progress image examples: 4, 5, 6, 15, 16, 17
-    lsd_lines_component_rectangles = (
-        general_computer_vision_functions
-        .compute_connected_component_rectangles(
-            image,
-            lsd_lines_component_parameters,
-            right_extra_length=right_extra_length,
-            bottom_extra_length=bottom_extra_length
-        )
-    )
-    # 5) Draw the rectangles constructed in 4) in a zero-initialized image of
-    # the same shape as the input image. Determine first the connected
-    # components of this image and then the minimal rectangles containing these
-    # components. The hope is that every relevant horizontal/vertical table line
-    # is contained in exactly one of the minimal rectangles. We also hope that 
-    # the minimal rectangles which do not contain a relevant horizontal/
-    # vertical table line are exactly those which are too short with respect to
-    # the horizontal/vertical direction. (The lower bound for the rectangle
-    # length is given by the function argument rectangle_length_lower_bound.)
-    # Relevant progress image variable names:
-    # lsd_lines_component_rectangles_image,
-    # rectangle_component_rectangles_image,
-    # rectangle_component_rectangles_zeros_image
-    # Relevant progress image examples: 6, 7, 8, 17, 18, 19
-    lsd_lines_component_rectangles_image = np.zeros_like(image)
-    utilities.draw_rectangles(
-        lsd_lines_component_rectangles_image,
-        lsd_lines_component_rectangles,
-        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
-        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
-    )
-    rectangle_component_parameters = (
-        general_computer_vision_functions
-        .compute_connected_component_parameters(
-            lsd_lines_component_rectangles_image
-        )
-    )
-    rectangle_component_rectangles = (
-        general_computer_vision_functions
-        .compute_connected_component_rectangles(
-            image,
-            rectangle_component_parameters
+                                              construct_progress_images=False,
+                                              record_progress_geometry=False,
+                                              lsd_lines_image_thickness
+                                              =LSD_LINES_IMAGE_THICKNESS,
+                                              line_pixels_image=None,
+                                              line_assembly='raster',
+                                              line_fit='pixels',
+                                              *,
+                                              scratch_buffers):
+    # The steps of the algorithm are measured with spans (see
+    # instrumentation_functions.py).
+    span = instrumentation_functions.span
+    # The arguments line_assembly and line_fit are explained below 2) and in
+    # 7), respectively. The morphological line engine has no lsd_lines, so it
+    # always uses the raster assembly and the pixel fit. If both the chaining
+    # and the segment fit are used, the image of 2) is not needed at all, and
+    # no image of the same shape as the input image is allocated.
+    chain_lsd_lines = line_assembly == 'chaining' and line_pixels_image is None
+    fit_lsd_lines = line_fit == 'segments' and line_pixels_image is None
+    # The images of the same shape as the input image which are needed only
+    # inside this function are borrowed from the buffer arena (see
+    # buffer_arena_functions.py), and they are collected in the list
+    # scratch_buffers, so that they are released when the function returns or
+    # fails (see release_scratch_buffers in buffer_arena_functions.py).
+    # If the argument line_pixels_image is given, the line-like pixels have
+    # already been determined without lsd_lines (see the morphological line
+    # engine in detect_table_structure), so the steps 1) and 2) are skipped and
+    # line_pixels_image is used as the image drawn in 2).
+    if line_pixels_image is not None:
+        lsd_line_arrays = (
+            lsd_line_functions.create_lsd_line_arrays_from_endpoints([])
         )
-    )
+        lsd_lines_image = line_pixels_image
+    else:
+        # 1) Filter lsd_lines which are not long enough or which are not 
+        # sufficiently horizontal/vertical. The sin limit is used in the horizontal
+        # case and the cos limit in the vertical case. The lsd_lines are given as
+        # lsd_line_arrays (see lsd_line_functions.py), so that all of them are
+        # filtered at once.
+        with span('filter') as counts:
+            counts['lsd_lines_in'] = len(lsd_line_arrays[0])
+            lsd_line_arrays = lsd_line_functions.filter_lsd_line_arrays(
+                lsd_line_arrays,
+                length_lower_bound=line_length_lower_bound,
+                cos_upper_bound=cos_upper_bound,
+                sin_upper_bound=sin_upper_bound
+            )
+            counts['lsd_lines'] = len(lsd_line_arrays[0])
+        # 2) Draw the remaining lsd_lines in a zero-initialized image of the same
+        # shape as the input image. The thickness of the drawn lines is given by
+        # lsd_lines_image_thickness.
+        # Relevant progress image variable names:
+        # lsd_lines_full_image,
+        # lsd_lines_image
+        # Relevant progress image examples: 2, 3, 13, 14
+        if not (chain_lsd_lines and fit_lsd_lines):
+            with span('rasterise'):
+                lsd_lines_image = buffer_arena_functions.borrow_buffer(
+                    image.shape,
+                    image.dtype,
+                    zero_buffer=True
+                )
+                scratch_buffers.append(lsd_lines_image)
+                lsd_line_functions.draw_lsd_line_arrays(
+                    lsd_lines_image,
+                    lsd_line_arrays,
+                    LSD_LINES_IMAGE_COLOR,
+                    lsd_lines_image_thickness
+                )
+    # If line_assembly is 'chaining', the steps 3) to 5) are replaced with the
+    # chaining of the lsd_lines (see chain_lsd_line_arrays below and
+    # chain_rectangle_array in geometric_array_operations.py), whose running
+    # time depends on the number of lsd_lines instead of the size of the
+    # image: Each remaining lsd_line
+    # is enclosed in a rectangle widened by half of lsd_lines_image_thickness
+    # and CHAINING_RECTANGLE_MARGIN, which resembles the minimal rectangle of
+    # the lsd_line drawn in 2) (the pixels drawn with cv.LINE_AA extend a
+    # little beyond the thickness) together with the outline drawn in 5). Two
+    # rectangles are chained if the gap between them is at most
+    # right_extra_length (bottom_extra_length) in the horizontal (vertical)
+    # direction and at most CHAINING_OFFSET_TOLERANCE in the other direction.
+    # The minimal rectangles of the chains are extended in the same way as the
+    # rectangles in 4), so that they correspond to the minimal rectangles
+    # constructed in 5).
+    if chain_lsd_lines:
+        with span('chain') as counts:
+            (lsd_line_segments,
+             lsd_lines_component_short_rectangles,
+             lsd_lines_component_rectangles,
+             rectangle_component_rectangles) = chain_lsd_line_arrays(
+                image.shape,
+                lsd_line_arrays,
+                detect_horizontal_lines,
+                right_extra_length,
+                bottom_extra_length,
+                lsd_lines_image_thickness
+            )
+            counts['chains'] = len(rectangle_component_rectangles)
+    else:
+        # 3) Determine the connected components in the image drawn in 2). Only
+        # the statistics of the components are used, so the label image is
+        # written into a scratch buffer.
+        with span('connected_components') as counts:
+            lsd_lines_component_labels = buffer_arena_functions.borrow_buffer(
+                image.shape,
+                np.uint16
+            )
+            scratch_buffers.append(lsd_lines_component_labels)
+            lsd_lines_component_parameters = (
+                general_computer_vision_functions
+                .compute_connected_component_parameters(
+                    lsd_lines_image,
+                    labels=lsd_lines_component_labels
+                )
+            )
+            counts['components'] = lsd_lines_component_parameters[0] - 1
+        # 4) For each connected component determined in 3), we construct the
+        # minimal rectangle containing said component and extend the rectangle
+        # either rightwards or downwards, depending on whether we are looking
+        # for horizontal or vertical table lines, respectively. The idea is that
+        # for each relevant table line there are lsd_lines close to it and,
+        # therefore, also connected components determined in 3) close to it. The
+        # hope is that, by extending the rectangles, each relevant table line
+        # will be contained in a collection of mutually-intersecting rectangles.
+        # (By definition, a collection of rectangles is said to be
+        # mutually-intersecting if for each rectangle in the collection there is
+        # at least one other rectangle in the collection which intersects the
+        # first rectangle).
+        # Relevant progress image variable names:
+        # lsd_lines_component_short_rectangles_image,
+        # lsd_lines_component_short_rectangles_zeros_image,
+        # lsd_lines_component_rectangles_image,
+        # Relevant progress image examples: 4, 5, 6, 15, 16, 17
+        # The rectangles of the steps 4) to 6) are point pair arrays (see
+        # geometric_array_operations.py), so that all of them are processed at
+        # once.
+        with span('rectangles') as counts:
+            lsd_lines_component_rectangles = (
+                geometric_array_operations
+                .compute_connected_component_rectangle_array(
+                    image.shape,
+                    lsd_lines_component_parameters,
+                    right_extra_length=right_extra_length,
+                    bottom_extra_length=bottom_extra_length
+                )
+            )
+            counts['rectangles'] = len(lsd_lines_component_rectangles)
+        # 5) Draw the rectangles constructed in 4) in a zero-initialized image
+        # of the same shape as the input image. Determine first the connected
+        # components of this image and then the minimal rectangles containing
+        # these components. The hope is that every relevant horizontal/vertical
+        # table line is contained in exactly one of the minimal rectangles. We
+        # also hope that the minimal rectangles which do not contain a relevant
+        # horizontal/vertical table line are exactly those which are too short
+        # with respect to the horizontal/vertical direction. (The lower bound
+        # for the rectangle length is given by the function argument
+        # rectangle_length_lower_bound.)
+        # The image and its connected components are not actually computed,
+        # since merge_rectangle_array in geometric_array_operations.py gives the
+        # same minimal rectangles directly from the coordinates of the
+        # rectangles (see merge_rectangle_array_by_drawing below for the
+        # computation with the image).
+        # Relevant progress image variable names:
+        # lsd_lines_component_rectangles_image,
+        # rectangle_component_rectangles_image,
+        # rectangle_component_rectangles_zeros_image
+        # Relevant progress image examples: 6, 7, 8, 17, 18, 19
+        with span('rectangle_merge') as counts:
+            rectangle_component_rectangles = (
+                geometric_array_operations.merge_rectangle_array(
+                    lsd_lines_component_rectangles,
+                    image.shape
+                )
+            )
+            counts['components'] = len(rectangle_component_rectangles)
     # 6) Remove those minimal rectangles constructed in 5) which are too short
     # in the horizontal/vertical direction. If the algorithm works as it is
     # supposed to, there is an exact correspondence between the remaining
@@ -167,20 +407,22 @@ def detect_horizontal_or_vertical_table_lines(image,
     # Relevant progress image variable name:
     # rectangle_component_filtered_rectangles_zeros_image
     # Relevant progress image examples: 9, 20
-    if detect_horizontal_lines:
-        rectangle_component_rectangles = (
-            geometric_operations.filter_rectangles(
-                rectangle_component_rectangles,
-                horizontal_length_lower_bound=rectangle_length_lower_bound
+    with span('rectangle_filter') as counts:
+        if detect_horizontal_lines:
+            rectangle_component_filtered_rectangles = (
+                geometric_array_operations.filter_rectangle_array(
+                    rectangle_component_rectangles,
+                    horizontal_length_lower_bound=rectangle_length_lower_bound
+                )
             )
-        )
-    else:
-        rectangle_component_rectangles = (
-            geometric_operations.filter_rectangles(
-                rectangle_component_rectangles,
-                vertical_length_lower_bound=rectangle_length_lower_bound
+        else:
+            rectangle_component_filtered_rectangles = (
+                geometric_array_operations.filter_rectangle_array(
+                    rectangle_component_rectangles,
+                    vertical_length_lower_bound=rectangle_length_lower_bound
+                )
             )
-        )
+        counts['rectangles'] = len(rectangle_component_filtered_rectangles)
     # 7) For each of the remaining minimal rectangles, construct the line
     # segment that is the best fit to the original line-like pixels contained
     # in the rectangle. This line segment will be the ultimate horizontal/
@@ -190,156 +432,774 @@ def detect_horizontal_or_vertical_table_lines(image,
     # horizontal_or_vertical_table_lines_rectangles_image,
     # horizontal_or_vertical_table_lines_full_image
     # Relevant progress image examples: 10, 11, 12, 21, 22, 23
-    horizontal_or_vertical_table_lines = (
-        geometric_operations
-        .compute_horizontal_or_vertical_lines_using_rectangles(
-            lsd_lines_image,
-            rectangle_component_rectangles,
-            detect_horizontal_lines
-        )
-    )
-    if construct_progress_images:
-        # We have already pointed out which progress images are relevant to
-        # a given step of the algorithm, and so the comments will be minimal
-        # from here onwards. We will mainly just point out which progress image
-        # examples are relevent to a given variable. For example:
-        # lsd_lines_full_image: 2, 13
-        lsd_lines_full_image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
-        lsd_line_functions.draw_lsd_lines(
-            lsd_lines_full_image,
-            lsd_lines,
-            LSD_LINES_FULL_IMAGE_COLOR,
-            LSD_LINES_FULL_IMAGE_THICKNESS
-        )
-        # lsd_lines_component_short_rectangles_image: 4, 15
-        lsd_lines_component_short_rectangles = (
-            general_computer_vision_functions
-            .compute_connected_component_rectangles(
-                image,
-                lsd_lines_component_parameters,
-            )
-        )
-        lsd_lines_component_short_rectangles_image = lsd_lines_image.copy()
-        utilities.draw_rectangles(
-            lsd_lines_component_short_rectangles_image,
-            lsd_lines_component_short_rectangles,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
-        )
-        # lsd_lines_component_short_rectangles_zeros_image: 5, 16
-        lsd_lines_component_short_rectangles_zeros_image = np.zeros_like(image)
-        utilities.draw_rectangles(
-            lsd_lines_component_short_rectangles_zeros_image,
-            lsd_lines_component_short_rectangles,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
-        )
-        # Note that rectangle_component_rectangles was already computed during
-        # the execution of the actual algorithm. But since the set of rectangles
-        # denoted by the variable got filtered, we perform a recalculation
-        # here.
-        # rectangle_component_rectangles_image: 7, 18
-        rectangle_component_rectangles = (
-            general_computer_vision_functions
-            .compute_connected_component_rectangles(
-                image,
-                rectangle_component_parameters
-            )
-        )
-        rectangle_component_rectangles_image = cv.cvtColor(
-            lsd_lines_component_rectangles_image,
-            cv.COLOR_GRAY2BGR
-        )
-        utilities.draw_rectangles(
-            rectangle_component_rectangles_image,
-            rectangle_component_rectangles,
-            LSD_LINES_FULL_IMAGE_COLOR,
-            RECTANGLE_COMPONENT_RECTANGLES_IMAGE_THICKNESS
-        )
-        # rectangle_component_rectangles_zeros_image: 8, 19
-        rectangle_component_rectangles_zeros_image = np.zeros_like(image)
-        utilities.draw_rectangles(
-            rectangle_component_rectangles_zeros_image,
-            rectangle_component_rectangles,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
-        )
-        # We perform the same filtering of rectangles as we did during the
-        # execution of the actual algorithm, but this time we use an explicitly
-        # different variable name.
-        # rectangle_component_filtered_rectangles_zeros_image: 9, 20
-        if detect_horizontal_lines:
-            rectangle_component_filtered_rectangles = (
-                geometric_operations.filter_rectangles(
-                    rectangle_component_rectangles,
-                    horizontal_length_lower_bound=rectangle_length_lower_bound
+    # If line_fit is 'segments', the line segment is fitted to the lsd_lines
+    # whose midpoints are contained in the rectangle instead of the pixels
+    # drawn in 2), with each lsd_line weighted by its length (see
+    # compute_horizontal_or_vertical_lines_using_line_segment_array in
+    # geometric_operations.py). The line segments of the lsd_lines have
+    # already been computed if the chaining is used.
+    with span('fit_line') as counts:
+        if fit_lsd_lines:
+            if not chain_lsd_lines:
+                lsd_line_segments = (
+                    lsd_line_functions
+                    .compute_lsd_line_array_points(lsd_line_arrays)
+                )
+            horizontal_or_vertical_table_lines = (
+                geometric_operations
+                .compute_horizontal_or_vertical_lines_using_line_segment_array(
+                    rectangle_component_filtered_rectangles,
+                    lsd_line_segments,
+                    detect_horizontal_lines,
+                    lsd_lines_image_thickness // 2 + SEGMENT_FIT_EXTENT_MARGIN
                 )
             )
         else:
-            rectangle_component_filtered_rectangles = (
-                geometric_operations.filter_rectangles(
-                    rectangle_component_rectangles,
-                    vertical_length_lower_bound=rectangle_length_lower_bound
+            horizontal_or_vertical_table_lines = (
+                geometric_operations
+                .compute_horizontal_or_vertical_lines_using_rectangle_array(
+                    lsd_lines_image,
+                    rectangle_component_filtered_rectangles,
+                    detect_horizontal_lines
                 )
             )
-        rectangle_component_filtered_rectangles_zeros_image = (
-            np.zeros_like(image)
+        counts['table_lines'] = len(horizontal_or_vertical_table_lines)
+    # The list progress_geometry consists of the remaining lsd_lines as line
+    # segments (with the integer endpoints used for drawing them), the minimal
+    # rectangles of the connected components determined in 3) before and after
+    # the extension in 4), the minimal rectangles constructed in 5) before and
+    # after the filtering in 6) and the table lines. Only the line segments and
+    # the minimal rectangles before the extension have to be computed
+    # separately. All items except the table lines are point pair arrays.
+    # With the chaining, the line segments and the rectangles widened from them
+    # are used as the minimal rectangles before the extension.
+    if ((construct_progress_images or record_progress_geometry)
+            and not chain_lsd_lines):
+        if not fit_lsd_lines:
+            lsd_line_segments = (
+                lsd_line_functions
+                .compute_lsd_line_array_points(lsd_line_arrays)
+            )
+        lsd_lines_component_short_rectangles = (
+            geometric_array_operations
+            .compute_connected_component_rectangle_array(
+                image.shape,
+                lsd_lines_component_parameters
+            )
         )
-        utilities.draw_rectangles(
-            rectangle_component_filtered_rectangles_zeros_image,
+    if construct_progress_images or record_progress_geometry:
+        progress_geometry = [
+            lsd_line_segments,
+            lsd_lines_component_short_rectangles,
+            lsd_lines_component_rectangles,
+            rectangle_component_rectangles,
             rectangle_component_filtered_rectangles,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+            horizontal_or_vertical_table_lines
+        ]
+    else:
+        progress_geometry = None
+    if construct_progress_images:
+        progress_images = draw_progress_images(image, progress_geometry)
+    else:
+        progress_images = None
+    return horizontal_or_vertical_table_lines, progress_images, progress_geometry
+
+# The function below chains the lsd_lines given as lsd_line_arrays in the way
+# described in detect_horizontal_or_vertical_table_lines, where it replaces the
+# steps 3) to 5) if line_assembly is 'chaining'. The return value is the list
+# [lsd_line_segments, short_rectangles, rectangles, chain_rectangles], where
+# lsd_line_segments are the integer endpoints of the lsd_lines, the short
+# rectangles are the widened rectangles of the lsd_lines, the rectangles are
+# the short rectangles after the extension, and the chain rectangles are the
+# extended minimal rectangles of the chains. All of them are point pair arrays.
+
+def chain_lsd_line_arrays(image_shape,
+                          lsd_line_arrays,
+                          detect_horizontal_lines,
+                          right_extra_length=0,
+                          bottom_extra_length=0,
+                          lsd_lines_image_thickness=LSD_LINES_IMAGE_THICKNESS):
+    lsd_line_segments = (
+        lsd_line_functions.compute_lsd_line_array_points(lsd_line_arrays)
+    )
+    short_rectangles = (
+        geometric_array_operations.compute_line_segment_rectangle_array(
+            image_shape,
+            lsd_line_segments,
+            lsd_lines_image_thickness // 2 + CHAINING_RECTANGLE_MARGIN
         )
-        # rectangle_component_filtered_rectangles_image: 10, 21
-        rectangle_component_filtered_rectangles_image = lsd_lines_image.copy()
-        utilities.draw_rectangles(
-            rectangle_component_filtered_rectangles_image,
-            rectangle_component_filtered_rectangles,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
-            LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+    )
+    if detect_horizontal_lines:
+        x_gap_tolerance = right_extra_length
+        y_gap_tolerance = CHAINING_OFFSET_TOLERANCE
+    else:
+        x_gap_tolerance = CHAINING_OFFSET_TOLERANCE
+        y_gap_tolerance = bottom_extra_length
+    chain_rectangles, _ = geometric_array_operations.chain_rectangle_array(
+        short_rectangles,
+        x_gap_tolerance,
+        y_gap_tolerance
+    )
+    extended_rectangle_arrays = []
+    for rectangles in [short_rectangles, chain_rectangles]:
+        rectangles = geometric_array_operations.extend_rectangle_array(
+            rectangles,
+            right_extra_length=right_extra_length,
+            bottom_extra_length=bottom_extra_length
         )
-        # horizontal_or_vertical_table_lines_rectangles_image: 11, 22
-        horizontal_or_vertical_table_lines_rectangles_image = cv.cvtColor(
-            rectangle_component_filtered_rectangles_image,
-            cv.COLOR_GRAY2BGR
+        extended_rectangle_arrays.append(
+            geometric_array_operations.clamp_point_pair_array(rectangles,
+                                                              image_shape)
         )
-        utilities.draw_lines(
-            horizontal_or_vertical_table_lines_rectangles_image,
-            horizontal_or_vertical_table_lines,
-            TABLE_LINE_COLOR,
-            TABLE_LINE_THICKNESS
+    rectangles, chain_rectangles = extended_rectangle_arrays
+    return [lsd_line_segments, short_rectangles, rectangles, chain_rectangles]
+
+# The function below merges the rectangles of a rectangle array in the way
+# described in the step 5) of detect_horizontal_or_vertical_table_lines, i.e.,
+# by drawing the rectangles in a zero-initialized image and computing the
+# minimal rectangles of the connected components of the image. The result is
+# the same as that of merge_rectangle_array in geometric_array_operations.py,
+# and the function is kept as a reference for that function.
+
+def merge_rectangle_array_by_drawing(rectangle_array, image_shape):
+    rectangles_image = np.zeros(image_shape[:2], dtype=np.uint8)
+    utilities.draw_rectangles(rectangles_image,
+                              rectangle_array,
+                              LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
+                              LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS)
+    rectangle_component_parameters = (
+        general_computer_vision_functions
+        .compute_connected_component_parameters(rectangles_image)
+    )
+    merged_rectangle_array = (
+        geometric_array_operations.compute_connected_component_rectangle_array(
+            image_shape,
+            rectangle_component_parameters
         )
-        # horizontal_or_vertical_table_lines_full_image: 12, 23
-        horizontal_or_vertical_table_lines_full_image = (
-            cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    )
+    return merged_rectangle_array
+
+# The function below draws the progress images of
+# detect_horizontal_or_vertical_table_lines from the list progress_geometry.
+# Drawing the line segments of the lsd_lines gives exactly the same pixels as
+# drawing the lsd_lines themselves (see draw_lsd_line_arrays in
+# lsd_line_functions.py).
+
+def draw_progress_images(image, progress_geometry):
+    (lsd_line_segments,
+     lsd_lines_component_short_rectangles,
+     lsd_lines_component_rectangles,
+     rectangle_component_rectangles,
+     rectangle_component_filtered_rectangles,
+     horizontal_or_vertical_table_lines) = progress_geometry
+    # We have already pointed out which progress images are relevant to a given
+    # step of the algorithm, and so the comments will be minimal from here
+    # onwards. We will mainly just point out which progress image examples are
+    # relevent to a given variable. For example:
+    # lsd_lines_full_image: 2, 13
+    lsd_lines_full_image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    utilities.draw_lines(lsd_lines_full_image,
+                         lsd_line_segments,
+                         LSD_LINES_FULL_IMAGE_COLOR,
+                         LSD_LINES_FULL_IMAGE_THICKNESS)
+    # lsd_lines_image: 3, 14
+    lsd_lines_image = np.zeros_like(image)
+    utilities.draw_lines(lsd_lines_image,
+                         lsd_line_segments,
+                         LSD_LINES_IMAGE_COLOR,
+                         LSD_LINES_IMAGE_THICKNESS)
+    # lsd_lines_component_short_rectangles_image: 4, 15
+    lsd_lines_component_short_rectangles_image = lsd_lines_image.copy()
+    utilities.draw_rectangles(
+        lsd_lines_component_short_rectangles_image,
+        lsd_lines_component_short_rectangles,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+    )
+    # lsd_lines_component_short_rectangles_zeros_image: 5, 16
+    lsd_lines_component_short_rectangles_zeros_image = np.zeros_like(image)
+    utilities.draw_rectangles(
+        lsd_lines_component_short_rectangles_zeros_image,
+        lsd_lines_component_short_rectangles,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+    )
+    # lsd_lines_component_rectangles_image: 6, 17
+    lsd_lines_component_rectangles_image = np.zeros_like(image)
+    utilities.draw_rectangles(
+        lsd_lines_component_rectangles_image,
+        lsd_lines_component_rectangles,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+    )
+    # rectangle_component_rectangles_image: 7, 18
+    rectangle_component_rectangles_image = cv.cvtColor(
+        lsd_lines_component_rectangles_image,
+        cv.COLOR_GRAY2BGR
+    )
+    utilities.draw_rectangles(
+        rectangle_component_rectangles_image,
+        rectangle_component_rectangles,
+        LSD_LINES_FULL_IMAGE_COLOR,
+        RECTANGLE_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+    )
+    # rectangle_component_rectangles_zeros_image: 8, 19
+    rectangle_component_rectangles_zeros_image = np.zeros_like(image)
+    utilities.draw_rectangles(
+        rectangle_component_rectangles_zeros_image,
+        rectangle_component_rectangles,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+    )
+    # rectangle_component_filtered_rectangles_zeros_image: 9, 20
+    rectangle_component_filtered_rectangles_zeros_image = np.zeros_like(image)
+    utilities.draw_rectangles(
+        rectangle_component_filtered_rectangles_zeros_image,
+        rectangle_component_filtered_rectangles,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+    )
+    # rectangle_component_filtered_rectangles_image: 10, 21
+    rectangle_component_filtered_rectangles_image = lsd_lines_image.copy()
+    utilities.draw_rectangles(
+        rectangle_component_filtered_rectangles_image,
+        rectangle_component_filtered_rectangles,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_COLOR,
+        LSD_LINES_COMPONENT_RECTANGLES_IMAGE_THICKNESS
+    )
+    # horizontal_or_vertical_table_lines_rectangles_image: 11, 22
+    horizontal_or_vertical_table_lines_rectangles_image = cv.cvtColor(
+        rectangle_component_filtered_rectangles_image,
+        cv.COLOR_GRAY2BGR
+    )
+    utilities.draw_lines(
+        horizontal_or_vertical_table_lines_rectangles_image,
+        horizontal_or_vertical_table_lines,
+        TABLE_LINE_COLOR,
+        TABLE_LINE_THICKNESS
+    )
+    # horizontal_or_vertical_table_lines_full_image: 12, 23
+    horizontal_or_vertical_table_lines_full_image = (
+        cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    )
+    utilities.draw_lines(
+        horizontal_or_vertical_table_lines_full_image,
+        horizontal_or_vertical_table_lines,
+        TABLE_LINE_COLOR,
+        TABLE_LINE_THICKNESS
+    )
+    progress_images = [
+        image,
+        lsd_lines_full_image,
+        lsd_lines_image,
+        lsd_lines_component_short_rectangles_image,
+        lsd_lines_component_short_rectangles_zeros_image,
+        lsd_lines_component_rectangles_image,
+        rectangle_component_rectangles_image,
+        rectangle_component_rectangles_zeros_image,
+        rectangle_component_filtered_rectangles_zeros_image,
+        rectangle_component_filtered_rectangles_image,
+        horizontal_or_vertical_table_lines_rectangles_image,
+        horizontal_or_vertical_table_lines_full_image
+    ]
+    return progress_images
+
+# The following function detects the lsd_lines of the input image. If
+# lsd_tile_size is positive, the detection is divided into parts which are run
+# in parallel if there is a page thread pool (see run_page_tasks), which
+# reduces the time spent on the line segment detection, the most
+# time-consuming step of the algorithm.
+
+# The detect method of an LSDDetector detects the lsd_lines of each octave in
+# a Gaussian pyramid of the input image, where each image is the previous one
+# downscaled by the factor LSD_LINE_DETECTOR_SCALE. Most of the time is spent
+# on the first octave, i.e., on the input image itself. Therefore the parts of
+# the tiled detection are the following:
+# 1) The lsd_lines of the first octave are detected in overlapping tiles of the
+#    input image whose size is at most lsd_tile_size (not counting the overlap
+#    of lsd_tile_overlap pixels on each side), and the lsd_lines of the tiles
+#    are merged (see compute_lsd_tiles and merge_tile_lsd_lines in
+#    lsd_line_functions.py).
+# 2) The lsd_lines of the other octaves are detected in the downscaled input
+#    image, i.e., in the second image of the pyramid, which gives exactly the
+#    same lsd_lines as the detection in the whole input image. The coarse
+#    octaves are not detected in the tiles, since the coarse octaves of a tile
+#    see too little of the surroundings of the tile, and the running time of
+#    the detection in a coarse octave of a small tile is very unpredictable.
+
+# The lsd_lines of the first octave are not exactly the same as those of the
+# detection in the whole input image, since the lsd_lines crossing tile
+# boundaries are joined from pieces. See run_lsd_tiling_benchmark.py for a
+# comparison of the speed and the results of the two detections.
+
+def detect_lsd_lines(image, num_octaves, lsd_tile_size=0, lsd_tile_overlap=0):
+    if lsd_tile_size <= 0:
+        mask = np.ones_like(image)
+        lsd_line_detector = get_lsd_line_detector()
+        lsd_lines = lsd_line_detector.detect(image,
+                                             LSD_LINE_DETECTOR_SCALE,
+                                             num_octaves,
+                                             mask)
+        return lsd_lines
+    lsd_tiles = lsd_line_functions.compute_lsd_tiles(image.shape,
+                                                     lsd_tile_size,
+                                                     lsd_tile_overlap)
+    def detect_coarse_octave_lsd_lines():
+        if num_octaves < 2:
+            return []
+        height, width = image.shape
+        downscaled_image = cv.pyrDown(
+            image,
+            dstsize=(width // LSD_LINE_DETECTOR_SCALE,
+                     height // LSD_LINE_DETECTOR_SCALE)
         )
-        utilities.draw_lines(
-            horizontal_or_vertical_table_lines_full_image,
-            horizontal_or_vertical_table_lines,
-            TABLE_LINE_COLOR,
-            TABLE_LINE_THICKNESS
+        mask = np.ones_like(downscaled_image)
+        lsd_line_detector = get_lsd_line_detector()
+        coarse_octave_lsd_lines = list(lsd_line_detector.detect(
+            downscaled_image,
+            LSD_LINE_DETECTOR_SCALE,
+            num_octaves - 1,
+            mask
+        ))
+        lsd_line_functions.upscale_lsd_lines(coarse_octave_lsd_lines,
+                                             LSD_LINE_DETECTOR_SCALE)
+        return coarse_octave_lsd_lines
+    def detect_tile_lsd_lines(lsd_tile):
+        (x_min, y_min), (x_max, y_max) = lsd_tile[1]
+        tile_image = image[y_min:y_max, x_min:x_max]
+        mask = np.ones_like(tile_image)
+        lsd_line_detector = get_lsd_line_detector()
+        tile_lsd_lines = list(lsd_line_detector.detect(tile_image,
+                                                       LSD_LINE_DETECTOR_SCALE,
+                                                       1,
+                                                       mask))
+        lsd_line_functions.translate_lsd_lines(tile_lsd_lines,
+                                               x_min,
+                                               y_min,
+                                               LSD_LINE_DETECTOR_SCALE)
+        return tile_lsd_lines
+    # The coarse octaves are detected first, since they take the longest.
+    page_tasks = [detect_coarse_octave_lsd_lines]
+    page_tasks.extend(functools.partial(detect_tile_lsd_lines, lsd_tile)
+                      for lsd_tile in lsd_tiles)
+    coarse_octave_lsd_lines, *tile_lsd_lines = run_page_tasks(page_tasks)
+    lsd_lines = lsd_line_functions.merge_tile_lsd_lines(lsd_tiles,
+                                                        tile_lsd_lines)
+    lsd_lines.extend(coarse_octave_lsd_lines)
+    for class_id, lsd_line in enumerate(lsd_lines):
+        lsd_line.class_id = class_id
+    return lsd_lines
+
+# The line segments can be detected by several line segment detectors, which
+# are called backends. Each backend is a function which takes the input image
+# and num_octaves and returns the detected line segments as a numpy array of
+# shape (N, 4), whose rows are of the form [x_1, y_1, x_2, y_2]. The backends
+# are the following:
+# 1) 'lsd': The LSDDetector of the line_descriptor module (see
+#    detect_lsd_lines above), which is the default backend. This is the only
+#    backend that uses num_octaves.
+# 2) 'opencv_lsd': The line segment detector created by
+#    cv.createLineSegmentDetector, which implements the same algorithm in the
+#    full-resolution image only.
+# 3) 'fast_line_detector': The FastLineDetector of the ximgproc module, which
+#    fits line segments to the Canny edges of the input image.
+# 4) 'hough': The probabilistic Hough transform of the Canny edge image (see
+#    compute_hough_line_segments in general_computer_vision_functions.py),
+#    whose parameters are given in PARAMETER_DICT of the same file.
+# The line segments of the backends are converted into lsd_line_arrays (see
+# detect_line_segments below), so the rest of the table line detection is the
+# same for each backend. Note that the backends based on edges detect both
+# edges of a thick line. The backends can be compared by using
+# run_line_engine_comparison.py.
+
+def detect_lsd_line_segments(image, num_octaves):
+    lsd_lines = detect_lsd_lines(image, num_octaves)
+    line_segments = (
+        lsd_line_functions.compute_lsd_line_endpoint_array(lsd_lines)
+    )
+    return line_segments.astype(np.float32)
+
+def detect_opencv_lsd_line_segments(image, num_octaves):
+    line_segment_detector = get_line_segment_detector(
+        'opencv_lsd_line_detector',
+        cv.createLineSegmentDetector
+    )
+    line_segments = line_segment_detector.detect(image)[0]
+    return convert_line_segments(line_segments)
+
+def detect_fast_line_detector_line_segments(image, num_octaves):
+    line_segment_detector = get_line_segment_detector(
+        'fast_line_detector',
+        cv.ximgproc.createFastLineDetector
+    )
+    line_segments = line_segment_detector.detect(image)
+    return convert_line_segments(line_segments)
+
+def detect_hough_line_segments(image, num_octaves):
+    return general_computer_vision_functions.compute_hough_line_segments(image)
+
+# The detectors of cv2 return None instead of an empty array if no line
+# segments are found, and the shape of the array is (N, 1, 4).
+
+def convert_line_segments(line_segments):
+    if line_segments is None:
+        return np.zeros((0, 4), dtype=np.float32)
+    return line_segments.reshape(-1, 4).astype(np.float32)
+
+LINE_SEGMENT_DETECTORS = {
+    'lsd': detect_lsd_line_segments,
+    'opencv_lsd': detect_opencv_lsd_line_segments,
+    'fast_line_detector': detect_fast_line_detector_line_segments,
+    'hough': detect_hough_line_segments
+}
+
+# The table lines can be detected either by using one of the line segment
+# detectors above or by using morphological operations ('morphology'), see
+# detect_table_structure and detect_table_lines_using_morphology. The line
+# engine is chosen by the argument line_engine of detect_table_structure.
+
+LINE_ENGINES = list(LINE_SEGMENT_DETECTORS) + ['morphology']
+
+# The function below detects the lsd_lines of the input image by using the
+# line segment detector line_engine (see LINE_SEGMENT_DETECTORS above) and
+# returns them as lsd_line_arrays (see lsd_line_functions.py). With the default
+# backend 'lsd', the detection can be performed in tiles (see
+# detect_lsd_lines). The tile arguments are ignored by the other backends.
+
+def detect_line_segments(image,
+                         line_engine,
+                         num_octaves,
+                         lsd_tile_size=0,
+                         lsd_tile_overlap=0):
+    if line_engine == 'lsd':
+        lsd_lines = detect_lsd_lines(image,
+                                     num_octaves,
+                                     lsd_tile_size,
+                                     lsd_tile_overlap)
+        return lsd_line_functions.create_lsd_line_arrays(lsd_lines)
+    line_segments = LINE_SEGMENT_DETECTORS[line_engine](image, num_octaves)
+    return lsd_line_functions.create_lsd_line_arrays_from_endpoints(
+        line_segments
+    )
+
+# The following function implements the so-called coarse-to-fine detection of
+# the table lines, which is used by detect_table_structure if
+# coarse_to_fine_scale is larger than 1. The relevant table lines are hundreds
+# or thousands of pixels long, so they can be found in a downscaled input
+# image, and only their exact positions need the full resolution:
+# 1) The input image is downscaled by the factor coarse_to_fine_scale, and the
+#    table lines of the downscaled image are detected in the usual way (with
+#    the length arguments divided by coarse_to_fine_scale and with fewer
+#    octaves). The table lines found in this way are called candidates.
+# 2) Each candidate is refined at full resolution by refine_table_line (see
+#    below), which only processes a narrow band of the input image around the
+#    candidate.
+# If no horizontal or no vertical candidates are found, the layout of the page
+# is not simple enough for the coarse detection, and the return value is None,
+# in which case the table lines are detected at full resolution in the usual
+# way. Otherwise the return value has the same form as the results of the
+# detection at full resolution in detect_table_structure, i.e., the list
+# [horizontal_results, vertical_results].
+
+# The progress geometry of the coarse detection is scaled to the coordinate
+# system of the input image, and its table lines are replaced with the refined
+# ones, so the progress images show the steps of the coarse detection.
+
+def detect_table_lines_coarse_to_fine(image,
+                                      coarse_to_fine_scale,
+                                      num_octaves,
+                                      horizontal_line_length_lower_bound,
+                                      vertical_line_length_lower_bound,
+                                      sin_upper_bound,
+                                      cos_upper_bound,
+                                      right_extra_length,
+                                      bottom_extra_length,
+                                      horizontal_rectangle_length_lower_bound,
+                                      vertical_rectangle_length_lower_bound,
+                                      construct_progress_images=False,
+                                      record_progress_geometry=False,
+                                      lsd_tile_size=0,
+                                      lsd_tile_overlap=0,
+                                      line_engine='lsd',
+                                      line_assembly='raster',
+                                      line_fit='pixels'):
+    span = instrumentation_functions.span
+    scale = coarse_to_fine_scale
+    height, width = image.shape
+    coarse_image = cv.resize(image,
+                             (width // scale, height // scale),
+                             interpolation=cv.INTER_AREA)
+    # Each octave halves the resolution, so the downscaling replaces about
+    # log2(scale) octaves.
+    coarse_num_octaves = max(1, num_octaves - int(round(np.log2(scale))))
+    with span('lsd') as counts:
+        coarse_lsd_line_arrays = detect_line_segments(
+            coarse_image,
+            line_engine,
+            coarse_num_octaves,
+            lsd_tile_size // scale,
+            lsd_tile_overlap // scale
         )
-        # Note that the progress images lsd_lines_image (examples 3 and 14) and
-        # lsd_lines_component_rectangles_image (examples 6 and 17) were
-        # constructed during the execution of the actual algorithm.
-        progress_images = [
-            image,
-            lsd_lines_full_image,
-            lsd_lines_image,
-            lsd_lines_component_short_rectangles_image,
-            lsd_lines_component_short_rectangles_zeros_image,
-            lsd_lines_component_rectangles_image,
-            rectangle_component_rectangles_image,
-            rectangle_component_rectangles_zeros_image,
-            rectangle_component_filtered_rectangles_zeros_image,
-            rectangle_component_filtered_rectangles_image,
-            horizontal_or_vertical_table_lines_rectangles_image,
-            horizontal_or_vertical_table_lines_full_image
-        ]
+        counts['lsd_lines'] = len(coarse_lsd_line_arrays[0])
+    # The progress geometry of the coarse detection is always recorded, since
+    # the refinement needs the rectangles containing the candidates.
+    def detect_horizontal_candidates():
+        with span('horizontal_table_lines'):
+            return detect_horizontal_or_vertical_table_lines(
+                coarse_image,
+                coarse_lsd_line_arrays,
+                detect_horizontal_lines=True,
+                line_length_lower_bound=(horizontal_line_length_lower_bound
+                                         / scale),
+                sin_upper_bound=sin_upper_bound,
+                right_extra_length=right_extra_length // scale,
+                rectangle_length_lower_bound
+                =horizontal_rectangle_length_lower_bound // scale,
+                record_progress_geometry=True,
+                lsd_lines_image_thickness=COARSE_LSD_LINES_IMAGE_THICKNESS,
+                line_assembly=line_assembly,
+                line_fit=line_fit
+            )
+    def detect_vertical_candidates():
+        with span('vertical_table_lines'):
+            return detect_horizontal_or_vertical_table_lines(
+                coarse_image,
+                coarse_lsd_line_arrays,
+                detect_horizontal_lines=False,
+                line_length_lower_bound=(vertical_line_length_lower_bound
+                                         / scale),
+                cos_upper_bound=cos_upper_bound,
+                bottom_extra_length=bottom_extra_length // scale,
+                rectangle_length_lower_bound
+                =vertical_rectangle_length_lower_bound // scale,
+                record_progress_geometry=True,
+                lsd_lines_image_thickness=COARSE_LSD_LINES_IMAGE_THICKNESS,
+                line_assembly=line_assembly,
+                line_fit=line_fit
+            )
+    candidate_results = run_page_tasks([detect_horizontal_candidates,
+                                        detect_vertical_candidates])
+    horizontal_candidates = candidate_results[0][0]
+    vertical_candidates = candidate_results[1][0]
+    if not horizontal_candidates or not vertical_candidates:
+        return None
+    # The rectangles containing the candidates are the filtered rectangles of
+    # the progress geometry, one for each candidate.
+    refinement_arguments = [
+        [candidate,
+         rectangle,
+         True,
+         horizontal_line_length_lower_bound]
+        for candidate, rectangle in zip(horizontal_candidates,
+                                        candidate_results[0][2][4].tolist())
+    ]
+    refinement_arguments.extend(
+        [candidate,
+         rectangle,
+         False,
+         vertical_line_length_lower_bound]
+        for candidate, rectangle in zip(vertical_candidates,
+                                        candidate_results[1][2][4].tolist())
+    )
+    with span('refine') as counts:
+        table_lines = run_page_tasks([
+            functools.partial(refine_table_line,
+                              image,
+                              candidate,
+                              rectangle,
+                              scale,
+                              refine_horizontal,
+                              line_length_lower_bound)
+            for (candidate,
+                 rectangle,
+                 refine_horizontal,
+                 line_length_lower_bound) in refinement_arguments
+        ])
+        counts['table_lines'] = len(table_lines)
+    horizontal_table_lines = table_lines[:len(horizontal_candidates)]
+    vertical_table_lines = table_lines[len(horizontal_candidates):]
+    table_line_results = []
+    for (_, _, coarse_progress_geometry), direction_table_lines in zip(
+            candidate_results,
+            [horizontal_table_lines, vertical_table_lines]):
+        if construct_progress_images or record_progress_geometry:
+            progress_geometry = [item * scale
+                                 for item in coarse_progress_geometry[:-1]]
+            progress_geometry.append(direction_table_lines)
+        else:
+            progress_geometry = None
+        if construct_progress_images:
+            progress_images = draw_progress_images(image, progress_geometry)
+        else:
+            progress_images = None
+        table_line_results.append([direction_table_lines,
+                                   progress_images,
+                                   progress_geometry])
+    return table_line_results
+
+# The function below refines a candidate table line of the coarse-to-fine
+# detection (see above). The arguments candidate and rectangle are the
+# candidate and the rectangle containing it in the downscaled image. The
+# corresponding band of the input image (see below), extended by scale pixels
+# on each side, is binarized by using the Otsu method, and the pixels which do
+# not belong to a horizontal or vertical run of at least
+# line_length_lower_bound dark pixels are removed (see
+# extract_horizontal_or_vertical_line_pixels in
+# general_computer_vision_functions.py), which removes e.g. handwriting
+# crossing the table line. The table line is then fitted to the remaining
+# pixels by compute_horizontal_or_vertical_lines_using_rectangles. If no pixels
+# remain, the candidate is simply scaled to the input image.
+
+# The line segment detection is not used in the band, since its running time
+# turned out to be very unpredictable in narrow images.
+
+def refine_table_line(image,
+                      candidate,
+                      rectangle,
+                      scale,
+                      refine_horizontal,
+                      line_length_lower_bound):
+    # Along the candidate, the band is limited by the endpoints of the
+    # candidate, since the rectangle has been extended beyond the table line
+    # (see detect_horizontal_or_vertical_table_lines). Across the candidate,
+    # the band is limited by the rectangle, which covers the whole table line
+    # even if it is not exactly horizontal or vertical.
+    height, width = image.shape
+    (x_1, y_1), (x_2, y_2) = rectangle
+    if refine_horizontal:
+        x_1 = min(x for x, _ in candidate)
+        x_2 = max(x for x, _ in candidate)
     else:
-        progress_images = None
-    return horizontal_or_vertical_table_lines, progress_images
+        y_1 = min(y for _, y in candidate)
+        y_2 = max(y for _, y in candidate)
+    x_min = max(0, (x_1 - 1) * scale)
+    y_min = max(0, (y_1 - 1) * scale)
+    x_max = min(width, (x_2 + 2) * scale)
+    y_max = min(height, (y_2 + 2) * scale)
+    band_image = image[y_min:y_max, x_min:x_max]
+    binary_image = (
+        general_computer_vision_functions
+        .triangle_or_otsu_binarization(band_image, otsu_mode=True)
+    )
+    line_pixels_image = (
+        general_computer_vision_functions
+        .extract_horizontal_or_vertical_line_pixels(binary_image,
+                                                    refine_horizontal,
+                                                    line_length_lower_bound)
+    )
+    if not np.any(line_pixels_image):
+        # The centre of a pixel of the downscaled image is scale // 2 pixels
+        # away from its top left corner in the input image.
+        table_line = [[x * scale + scale // 2, y * scale + scale // 2]
+                      for x, y in candidate]
+        return table_line
+    band_height, band_width = band_image.shape
+    band_rectangle = [[0, 0], [band_width - 1, band_height - 1]]
+    [[band_x_1, band_y_1], [band_x_2, band_y_2]] = (
+        geometric_operations
+        .compute_horizontal_or_vertical_lines_using_rectangles(
+            line_pixels_image,
+            [band_rectangle],
+            refine_horizontal
+        )[0]
+    )
+    table_line = [[band_x_1 + x_min, band_y_1 + y_min],
+                  [band_x_2 + x_min, band_y_2 + y_min]]
+    return table_line
+
+# The following function implements the morphological line engine, which is
+# used by detect_table_structure if line_engine is 'morphology' (see
+# LINE_ENGINES). The line segment detection is replaced with the following
+# simple steps:
+# 1) The input image is binarized by using an adaptive threshold (see
+#    adaptive_binarization in general_computer_vision_functions.py), which
+#    also finds faint thin table lines.
+# 2) The horizontal (vertical) line-like pixels are extracted from the binary
+#    image by a morphological opening with a horizontal (vertical) kernel of
+#    length horizontal_line_length_lower_bound
+#    (vertical_line_length_lower_bound), see
+#    extract_horizontal_or_vertical_line_pixels in
+#    general_computer_vision_functions.py.
+# 3) The images of the line-like pixels are dilated slightly, so that they
+#    resemble the images of the drawn lsd_lines, and passed to
+#    detect_horizontal_or_vertical_table_lines as line_pixels_image, i.e., the
+#    rest of the algorithm is the same as with the line segment detection.
+# The morphological operations are much faster than the line segment
+# detection, but they only find lines which are nearly exactly horizontal or
+# vertical, so the engine is best suited for well-aligned scans. The arguments
+# sin_upper_bound and cos_upper_bound are not needed, since the kernels only
+# admit horizontal and vertical runs of pixels.
+
+# The return value has the same form as the results of the detection with the
+# line segment detection in detect_table_structure, i.e., the list
+# [horizontal_results, vertical_results]. The progress geometry contains no
+# line segments.
+
+def detect_table_lines_using_morphology(image,
+                                        horizontal_line_length_lower_bound,
+                                        vertical_line_length_lower_bound,
+                                        right_extra_length,
+                                        bottom_extra_length,
+                                        horizontal_rectangle_length_lower_bound,
+                                        vertical_rectangle_length_lower_bound,
+                                        construct_progress_images=False,
+                                        record_progress_geometry=False):
+    span = instrumentation_functions.span
+    with span('binarize'):
+        binary_image = (
+            general_computer_vision_functions.adaptive_binarization(image)
+        )
+    dilation_kernel = np.ones((MORPHOLOGY_LINE_PIXELS_DILATION_SIZE,
+                               MORPHOLOGY_LINE_PIXELS_DILATION_SIZE),
+                              dtype=np.uint8)
+    def extract_line_pixels(extract_horizontal, line_length_lower_bound):
+        with span('line_pixels'):
+            line_pixels_image = (
+                general_computer_vision_functions
+                .extract_horizontal_or_vertical_line_pixels(
+                    binary_image,
+                    extract_horizontal,
+                    line_length_lower_bound
+                )
+            )
+            return cv.dilate(line_pixels_image, dilation_kernel)
+    # The horizontal and vertical table lines are detected in parallel if
+    # there is a page thread pool (see run_page_tasks).
+    def detect_horizontal_table_lines():
+        with span('horizontal_table_lines'):
+            return detect_horizontal_or_vertical_table_lines(
+                image,
+                None,
+                detect_horizontal_lines=True,
+                right_extra_length=right_extra_length,
+                rectangle_length_lower_bound
+                =horizontal_rectangle_length_lower_bound,
+                construct_progress_images=construct_progress_images,
+                record_progress_geometry=record_progress_geometry,
+                line_pixels_image=extract_line_pixels(
+                    True,
+                    horizontal_line_length_lower_bound
+                )
+            )
+    def detect_vertical_table_lines():
+        with span('vertical_table_lines'):
+            return detect_horizontal_or_vertical_table_lines(
+                image,
+                None,
+                detect_horizontal_lines=False,
+                bottom_extra_length=bottom_extra_length,
+                rectangle_length_lower_bound
+                =vertical_rectangle_length_lower_bound,
+                construct_progress_images=construct_progress_images,
+                record_progress_geometry=record_progress_geometry,
+                line_pixels_image=extract_line_pixels(
+                    False,
+                    vertical_line_length_lower_bound
+                )
+            )
+    table_line_results = run_page_tasks([detect_horizontal_table_lines,
+                                         detect_vertical_table_lines])
+    return table_line_results
 
 # The function below is used to detect the table structure in the input image,
 # i.e., the relevant table lines. This function can also be used to construct
@@ -353,6 +1213,21 @@ def detect_horizontal_or_vertical_table_lines(image,
 # The arguments of the detect method are rather technical in nature and will
 # not be discussed in detail here.
 
+# The detection can also be performed in tiles (see detect_lsd_lines above),
+# which is controlled by the arguments lsd_tile_size and lsd_tile_overlap. If
+# coarse_to_fine_scale is larger than 1, the table lines are first detected in
+# a downscaled image (see detect_table_lines_coarse_to_fine above). The
+# argument line_engine selects the line segment detector (see
+# LINE_SEGMENT_DETECTORS above); the LSDDetector is used by default. If
+# line_engine is 'morphology', the line segment detection is not used at all,
+# and the line-like structures are found by morphological operations instead
+# (see detect_table_lines_using_morphology above). The argument line_assembly
+# selects how the table lines are assembled from the line segments (see
+# LINE_ASSEMBLY_METHODS above), and the argument line_fit selects how the table
+# lines are fitted (see LINE_FIT_METHODS above); with the morphological line
+# engine, the table lines are always assembled by drawing and merging
+# rectangles and fitted to the line-like pixels.
+
 # The return value of the detect method is a collection of objects called
 # lsd_lines. In terms of geometry, an lsd_line is a line segment, but as an
 # object data structure it is much more complex. See lsd_line_functions.py for
@@ -371,6 +1246,11 @@ def detect_horizontal_or_vertical_table_lines(image,
 # The first members of the above pairs are used in the detection of horizontal
 # table lines and the second members in the detection of vertical table lines.
 
+# The return value progress_geometry is the list [horizontal_progress_geometry,
+# vertical_progress_geometry] (see detect_horizontal_or_vertical_table_lines),
+# or None if neither construct_progress_images nor record_progress_geometry is
+# True.
+
 def detect_table_structure(image,
                            num_octaves,
                            horizontal_line_length_lower_bound,
@@ -382,45 +1262,107 @@ def detect_table_structure(image,
                            horizontal_rectangle_length_lower_bound,
                            vertical_rectangle_length_lower_bound,
                            construct_progress_images=False,
-                           construct_table_line_image=False):
-    mask = np.ones_like(image)
-    lsd_line_detector = cv.line_descriptor.LSDDetector.createLSDDetector()
-    lsd_lines = lsd_line_detector.detect(image,
-                                         LSD_LINE_DETECTOR_SCALE,
-                                         num_octaves,
-                                         mask)
-    horizontal_table_lines, horizontal_progress_images = (
-        detect_horizontal_or_vertical_table_lines(
+                           construct_table_line_image=False,
+                           record_progress_geometry=False,
+                           lsd_tile_size=0,
+                           lsd_tile_overlap=0,
+                           coarse_to_fine_scale=1,
+                           line_engine='lsd',
+                           line_assembly='raster',
+                           line_fit='pixels'):
+    span = instrumentation_functions.span
+    table_line_results = None
+    if line_engine == 'morphology':
+        table_line_results = detect_table_lines_using_morphology(
             image,
-            lsd_lines,
-            detect_horizontal_lines=True,
-            line_length_lower_bound=horizontal_line_length_lower_bound,
-            sin_upper_bound=sin_upper_bound,
-            right_extra_length=right_extra_length,
-            rectangle_length_lower_bound
-            =horizontal_rectangle_length_lower_bound,
-            construct_progress_images=construct_progress_images
+            horizontal_line_length_lower_bound,
+            vertical_line_length_lower_bound,
+            right_extra_length,
+            bottom_extra_length,
+            horizontal_rectangle_length_lower_bound,
+            vertical_rectangle_length_lower_bound,
+            construct_progress_images,
+            record_progress_geometry
         )
-    )
-    vertical_table_lines, vertical_progress_images = (
-        detect_horizontal_or_vertical_table_lines(
-            image,
-            lsd_lines,
-            detect_horizontal_lines=False,
-            line_length_lower_bound=vertical_line_length_lower_bound,
-            cos_upper_bound=cos_upper_bound,
-            bottom_extra_length=bottom_extra_length,
-            rectangle_length_lower_bound=vertical_rectangle_length_lower_bound,
-            construct_progress_images=construct_progress_images
+    elif coarse_to_fine_scale > 1:
+        with span('coarse_to_fine') as counts:
+            table_line_results = detect_table_lines_coarse_to_fine(
+                image,
+                coarse_to_fine_scale,
+                num_octaves,
+                horizontal_line_length_lower_bound,
+                vertical_line_length_lower_bound,
+                sin_upper_bound,
+                cos_upper_bound,
+                right_extra_length,
+                bottom_extra_length,
+                horizontal_rectangle_length_lower_bound,
+                vertical_rectangle_length_lower_bound,
+                construct_progress_images,
+                record_progress_geometry,
+                lsd_tile_size,
+                lsd_tile_overlap,
+                line_engine,
+                line_assembly,
+                line_fit
+            )
+            counts['fallback'] = int(table_line_results is None)
+    if table_line_results is None:
+        with span('lsd') as counts:
+            lsd_line_arrays = detect_line_segments(image,
+                                                   line_engine,
+                                                   num_octaves,
+                                                   lsd_tile_size,
+                                                   lsd_tile_overlap)
+            counts['lsd_lines'] = len(lsd_line_arrays[0])
+        # The horizontal and vertical table lines are detected in parallel if
+        # there is a page thread pool (see run_page_tasks).
+        def detect_horizontal_table_lines():
+            with span('horizontal_table_lines'):
+                return detect_horizontal_or_vertical_table_lines(
+                    image,
+                    lsd_line_arrays,
+                    detect_horizontal_lines=True,
+                    line_length_lower_bound=horizontal_line_length_lower_bound,
+                    sin_upper_bound=sin_upper_bound,
+                    right_extra_length=right_extra_length,
+                    rectangle_length_lower_bound
+                    =horizontal_rectangle_length_lower_bound,
+                    construct_progress_images=construct_progress_images,
+                    record_progress_geometry=record_progress_geometry,
+                    line_assembly=line_assembly,
+                    line_fit=line_fit
+                )
+        def detect_vertical_table_lines():
+            with span('vertical_table_lines'):
+                return detect_horizontal_or_vertical_table_lines(
+                    image,
+                    lsd_line_arrays,
+                    detect_horizontal_lines=False,
+                    line_length_lower_bound=vertical_line_length_lower_bound,
+                    cos_upper_bound=cos_upper_bound,
+                    bottom_extra_length=bottom_extra_length,
+                    rectangle_length_lower_bound
+                    =vertical_rectangle_length_lower_bound,
+                    construct_progress_images=construct_progress_images,
+                    record_progress_geometry=record_progress_geometry,
+                    line_assembly=line_assembly,
+                    line_fit=line_fit
+                )
+        table_line_results = run_page_tasks(
+            [detect_horizontal_table_lines, detect_vertical_table_lines]
         )
-    )
+    horizontal_results, vertical_results = table_line_results
+    (horizontal_table_lines,
+     horizontal_progress_images,
+     horizontal_progress_geometry) = horizontal_results
+    (vertical_table_lines,
+     vertical_progress_images,
+     vertical_progress_geometry) = vertical_results
     table_lines = horizontal_table_lines + vertical_table_lines
     if construct_table_line_image:
-        table_lines_image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
-        utilities.draw_lines(table_lines_image,
-                             table_lines,
-                             TABLE_LINE_COLOR,
-                             TABLE_LINE_THICKNESS)
+        with span('table_line_image'):
+            table_lines_image = draw_table_lines_image(image, table_lines)
     else:
         table_lines_image = None
     table_line_lists = [horizontal_table_lines,
@@ -429,7 +1371,24 @@ def detect_table_structure(image,
     progress_images = [horizontal_progress_images,
                        vertical_progress_images,
                        table_lines_image]
-    return table_line_lists, progress_images
+    if horizontal_progress_geometry is not None:
+        progress_geometry = [horizontal_progress_geometry,
+                             vertical_progress_geometry]
+    else:
+        progress_geometry = None
+    return table_line_lists, progress_images, progress_geometry
+
+# The following simple function constructs the image which displays the
+# detected table lines. It is used by detect_table_structure and
+# construct_table_structure_and_elements_description (see below).
+
+def draw_table_lines_image(image, table_lines):
+    table_lines_image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    utilities.draw_lines(table_lines_image,
+                         table_lines,
+                         TABLE_LINE_COLOR,
+                         TABLE_LINE_THICKNESS)
+    return table_lines_image
 
 # The following function is used to detect the table elements in the input
 # image, and also to construct images pertaining to this procedure if needed. 
@@ -445,18 +1404,30 @@ def detect_table_structure(image,
 # table_elements to refer to the file image_3_table_elements.jpg, and we will
 # do similarly in the case of other files.
 
+@buffer_arena_functions.release_scratch_buffers
 def detect_table_elements(image,
                           table_lines,
                           removed_line_thickness,
                           contour_thickness,
-                          construct_table_element_images=False):
+                          construct_table_element_images=False,
+                          otsu_image=None,
+                          *,
+                          scratch_buffers):
     # 1) The input image is binarized by using the Otsu method. A great
     # advantage of the Otsu method is that it does not need user-provided
-    # parameters.
-    otsu_image = (
-        general_computer_vision_functions
-        .triangle_or_otsu_binarization(image, otsu_mode=True)
-    )
+    # parameters. The binarization can also be performed beforehand (see
+    # detect_table_structure_and_elements), in which case the Otsu image is
+    # given as the argument otsu_image. Note that the Otsu image is modified
+    # below.
+    # The steps are measured with spans (see instrumentation_functions.py).
+    span = instrumentation_functions.span
+    # The Otsu image and the blob image (see 4) below) are borrowed from the
+    # buffer arena (see buffer_arena_functions.py) and collected in the list
+    # scratch_buffers, so that they are released when the function returns or
+    # fails. A given Otsu image is released by the caller.
+    if otsu_image is None:
+        otsu_image = compute_otsu_image(image)
+        scratch_buffers.append(otsu_image)
     # 2) Remove the table lines determined earlier from the Otsu image by
     # drawing the table lines in the black color. It is essential that the
     # thickness of the removed lines is chosen to be large enough: The table
@@ -468,17 +1439,22 @@ def detect_table_elements(image,
     # We use the variable black_color in order to make it clear to the reader
     # what the meaning of this particular argument is.
     black_color = 0
-    utilities.draw_lines(otsu_image,
-                         table_lines,
-                         black_color,
-                         removed_line_thickness)
+    with span('remove_lines') as counts:
+        utilities.draw_lines(otsu_image,
+                             table_lines,
+                             black_color,
+                             removed_line_thickness)
+        counts['table_lines'] = len(table_lines)
     # 3) Detect all contours in the Otsu image. The function detect_contours
     # returns also the so-called hierarchy of contours (not used in the code at
     # the moment), and this is the reason for the [0] index experession.
-    contours = (
-        general_computer_vision_functions
-        .detect_contours(otsu_image)[0]
-    )
+    with span('find_contours') as counts:
+        contours = (
+            general_computer_vision_functions
+            .detect_contours(otsu_image)[0]
+        )
+        counts['contours'] = len(contours)
+        counts['contour_points'] = sum(len(contour) for contour in contours)
     # 4) Draw the detected contours in a zero-initialized image of the same
     # shape as the input image. Once again, we use a relatively high value for
     # the thickness (value 20, see run_main_tests.py). The idea is that contours
@@ -489,46 +1465,94 @@ def detect_table_elements(image,
     # object mentioned earlier.
     # We use the variable white_color in order to make it clear to the reader
     # what the meaning of this particular argument is.
-    blob_image = np.zeros_like(image)
     white_color = 255
-    utilities.draw_contours(blob_image,
-                            contours,
-                            white_color,
-                            contour_thickness)
+    with span('draw_contours'):
+        blob_image = buffer_arena_functions.borrow_buffer(image.shape,
+                                                          image.dtype,
+                                                          zero_buffer=True)
+        scratch_buffers.append(blob_image)
+        utilities.draw_contours(blob_image,
+                                contours,
+                                white_color,
+                                contour_thickness)
     # 5) Determine the connected components in the image constructed in 4).
     # The resulting data structure table_element_component_parameters represents
     # the information in the input image which does not pertain to table lines.
-    table_element_component_parameters = (
-        general_computer_vision_functions
-        .compute_connected_component_parameters(blob_image)
-    )
+    with span('connected_components') as counts:
+        table_element_component_parameters = (
+            general_computer_vision_functions
+            .compute_connected_component_parameters(blob_image)
+        )
+        counts['components'] = table_element_component_parameters[0] - 1
     # The result image examples table_elements, element_blob_rectangles and
     # element_blobs illustrate the results of this function. The first two of
     # these images are constructed below and element_blobs is constructed by a
     # testing function (see main_test_functions.py).
+    # The blob image is returned too if the table element images are
+    # constructed, so that it can be stored in the result cache (see
+    # result_cache_functions.py). It is copied, since the buffer itself is
+    # released when the function returns.
     if construct_table_element_images:
-        full_table_element_image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
-        blob_table_element_image = cv.cvtColor(blob_image, cv.COLOR_GRAY2BGR)
-        table_element_rectangles = (
-            general_computer_vision_functions
-            .compute_connected_component_rectangles(
+        with span('table_element_images'):
+            table_element_images = draw_table_element_images(
                 image,
+                blob_image,
                 table_element_component_parameters
             )
-        )
-        utilities.draw_rectangles(full_table_element_image,
-                                  table_element_rectangles,
-                                  TABLE_ELEMENT_RECTANGLE_COLOR,
-                                  TABLE_ELEMENT_RECTANGLE_THICKNESS)
-        utilities.draw_rectangles(blob_table_element_image,
-                                  table_element_rectangles,
-                                  TABLE_ELEMENT_RECTANGLE_COLOR,
-                                  TABLE_ELEMENT_RECTANGLE_THICKNESS)
-        table_element_images = [full_table_element_image,
-                                blob_table_element_image]
+            blob_image = blob_image.copy()
     else:
         table_element_images = None
-    return table_element_component_parameters, table_element_images
+        blob_image = None
+    return (table_element_component_parameters,
+            table_element_images,
+            blob_image)
+
+# The following simple function performs the Otsu binarization of step 1) of
+# detect_table_elements. The Otsu image is borrowed from the buffer arena, so
+# it should be released once it is no longer needed.
+
+def compute_otsu_image(image):
+    with instrumentation_functions.span('otsu'):
+        otsu_image = buffer_arena_functions.borrow_buffer(image.shape,
+                                                          np.uint8)
+        try:
+            general_computer_vision_functions.triangle_or_otsu_binarization(
+                image,
+                otsu_mode=True,
+                binary_image=otsu_image
+            )
+        except BaseException:
+            buffer_arena_functions.release_buffer(otsu_image)
+            raise
+    return otsu_image
+
+# The function below constructs the result images table_elements and
+# element_blob_rectangles discussed above. The argument blob_image is the
+# binary image whose connected components are the table elements.
+
+def draw_table_element_images(image,
+                              blob_image,
+                              table_element_component_parameters):
+    full_table_element_image = cv.cvtColor(image, cv.COLOR_GRAY2BGR)
+    blob_table_element_image = cv.cvtColor(blob_image, cv.COLOR_GRAY2BGR)
+    table_element_rectangles = (
+        general_computer_vision_functions
+        .compute_connected_component_rectangles(
+            image,
+            table_element_component_parameters
+        )
+    )
+    utilities.draw_rectangles(full_table_element_image,
+                              table_element_rectangles,
+                              TABLE_ELEMENT_RECTANGLE_COLOR,
+                              TABLE_ELEMENT_RECTANGLE_THICKNESS)
+    utilities.draw_rectangles(blob_table_element_image,
+                              table_element_rectangles,
+                              TABLE_ELEMENT_RECTANGLE_COLOR,
+                              TABLE_ELEMENT_RECTANGLE_THICKNESS)
+    table_element_images = [full_table_element_image,
+                            blob_table_element_image]
+    return table_element_images
 
 # The following function is the main function in this file, and it is called by
 # the functions used to test the main algorithm.
@@ -548,24 +1572,96 @@ def detect_table_elements(image,
 def detect_table_structure_and_elements(image,
                                         table_structure_detection_arguments,
                                         table_element_detection_arguments):
-    table_line_lists, progress_images = (
-        detect_table_structure(
-            image,
-            *table_structure_detection_arguments
-        )
-    )
-    table_lines = table_line_lists[2]
-    table_element_component_parameters, table_element_images = (
-        detect_table_elements(
+    span = instrumentation_functions.span
+    def detect_structure():
+        with span('table_structure'):
+            return detect_table_structure(image,
+                                          *table_structure_detection_arguments)
+    # If there is a page thread pool, the Otsu binarization of the table
+    # element detection is performed while the table structure is detected
+    # (see submit_page_task). In this case, the span of the binarization is not
+    # nested in the span of the table element detection. The Otsu image is
+    # released at the end, also if the detection fails, in which case the
+    # binarization is first waited for.
+    if PAGE_THREAD_POOL is not None:
+        otsu_image_future = submit_page_task(lambda: compute_otsu_image(image))
+    else:
+        otsu_image_future = None
+    try:
+        table_structure = detect_structure()
+        if otsu_image_future is not None:
+            otsu_image = otsu_image_future.result()
+        else:
+            otsu_image = None
+        table_line_lists, progress_images, progress_geometry = table_structure
+        table_lines = table_line_lists[2]
+        with span('table_elements'):
+            (table_element_component_parameters,
+             table_element_images,
+             blob_image) = (
+                detect_table_elements(
+                    image,
+                    table_lines,
+                    *table_element_detection_arguments,
+                    otsu_image=otsu_image
+                )
+            )
+    finally:
+        if (otsu_image_future is not None
+                and otsu_image_future.exception() is None):
+            buffer_arena_functions.release_buffer(otsu_image_future.result())
+    table_structure_and_elements_description = [
+        table_line_lists,
+        progress_images,
+        table_element_component_parameters,
+        table_element_images,
+        progress_geometry,
+        blob_image
+    ]
+    return table_structure_and_elements_description
+
+# The function below constructs a table_structure_and_elements_description
+# (see detect_table_structure_and_elements above) from already known table
+# lines and table element component parameters without performing the actual
+# detection. It is used when the detection results of a page are taken from
+# the result cache (see result_cache_functions.py).
+
+# The table line image and the table element images are drawn as usual if they
+# are needed. The table element images are drawn from the cached blob image
+# (the argument blob_image), so they are identical to the ones drawn by
+# detect_table_elements. The lists of horizontal and vertical progress images
+# and the progress geometry are left as None here; the caller fills them in
+# from the cached progress geometry (see compute_page_result in
+# main_test_functions.py).
+
+def construct_table_structure_and_elements_description(
+        image,
+        table_line_lists,
+        table_element_component_parameters,
+        construct_table_line_image=False,
+        construct_table_element_images=False,
+        blob_image=None):
+    if construct_table_line_image:
+        table_lines = table_line_lists[2]
+        table_lines_image = draw_table_lines_image(image, table_lines)
+    else:
+        table_lines_image = None
+    progress_images = [None, None, table_lines_image]
+    if construct_table_element_images:
+        table_element_images = draw_table_element_images(
             image,
-            table_lines,
-            *table_element_detection_arguments
+            blob_image,
+            table_element_component_parameters
         )
-    )
+    else:
+        table_element_images = None
+        blob_image = None
     table_structure_and_elements_description = [
         table_line_lists,
         progress_images,
         table_element_component_parameters,
-        table_element_images
+        table_element_images,
+        None,
+        blob_image
     ]
     return table_structure_and_elements_description
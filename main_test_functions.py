@@ -5,13 +5,22 @@
 
 import numpy as np
 import cv2 as cv
+import multiprocessing
+import bisect
 import time
 import os
 
 import main_computer_vision_functions
 import numpy_array_operations
 import analysis_functions
+import buffer_arena_functions
 import gui_functions
+import instrumentation_functions
+import manifest_functions
+import pipeline_functions
+import progress_geometry_functions
+import result_cache_functions
+import shard_functions
 import utilities
 
 # The following simple function constructs a list containing all of the
@@ -26,11 +35,18 @@ def construct_document_list(root_dir):
     document_list = os.listdir(root_dir)
     return document_list
 
-# The function below loads the input images associated with a given document.
-def load_page_images(logbook, root_dir):
+# The function below lists the image files associated with a given document.
+# It is essential that the document directory contains the image files and
+# nothing else.
+
+# The list is sorted, since the image number of a page is determined by the
+# position of the page in the list, and the image numbers must not change
+# between runs (see the resume argument of multiple_logbooks_test).
+
+def construct_page_file_list(logbook, root_dir):
     image_dir = os.path.join(root_dir, logbook)
-    images = utilities.load_images(image_dir, grayscale=True)
-    return images
+    page_file_list = sorted(os.listdir(image_dir))
+    return page_file_list
 
 # The function random_sample_test uses the following function to load the
 # images it processes one at a time.
@@ -59,14 +75,16 @@ def create_save_directories(logbook,
         os.mkdir(save_root_dir)
     subdirs_to_create = save_dirs_to_create[1:]
     construct_progress_images = table_structure_detection_arguments[9]
+    record_progress_geometry = table_structure_detection_arguments[11]
     # We need to create logbook_save_dir and logbook_save_dir/subdir for every
     # subdir in subdirs_to_create. 
     logbook_save_dir = os.path.join(save_root_dir, logbook)
     # By adding the empty string to subdirs_to_create, we can use the
     # following loop to create logbook_save_dir as well.
     subdirs_to_create = [''] + subdirs_to_create
-    # Remove the last subdirectory if it is not needed.
-    if not construct_progress_images:
+    # Remove the last subdirectory if it is not needed. The progress geometry
+    # files are saved in the same directory as the progress images.
+    if not (construct_progress_images or record_progress_geometry):
         subdirs_to_create = subdirs_to_create[:-1]
     # Create all of the required directories by using the following loop.
     save_dirs = []
@@ -145,33 +163,61 @@ def save_progress_images(image_number,
     construct_progress_images = table_structure_detection_arguments[9]
     if construct_progress_images:
         progress_images = table_structure_and_elements_description[1]
-        # The lists of horizontal and vertical progress images both contain the 
-        # original input image as the first element, so in order to avoid
-        # including the original input image twice, we add the [1:] part to the
-        # expression featuring vertical_progress_images.
-        horizontal_progress_images = progress_images[0]
-        vertical_progress_images = progress_images[1][1:]
-        # Strictly speaking, table_line_image is not a progress image but
-        # rather a result image. However, it is natural to include it into
-        # the collection of progress images.
-        table_line_image = progress_images[2]
-        progress_images_to_save = (
-            horizontal_progress_images
-            + vertical_progress_images
-            + [table_line_image]
-        )
         progress_images_save_dir = save_dirs[3]
-        for p, progress_image in enumerate(progress_images_to_save):
-            progress_image_number = p + 1
-            filename = 'image_{}_{}.jpg'.format(image_number,
-                                                progress_image_number)
-            path = os.path.join(progress_images_save_dir, filename)
-            cv.imwrite(path, progress_image)
+        write_progress_images(image_number,
+                              progress_images,
+                              progress_images_save_dir)
         progress_images_saved_time = time.time()
     else:
         progress_images_saved_time = None
     return progress_images_saved_time
 
+# The following function writes the progress images of a page into the
+# directory progress_images_save_dir. It is also used when the progress images
+# are drawn afterwards from the progress geometry (see
+# render_logbook_progress_images).
+
+def write_progress_images(image_number,
+                          progress_images,
+                          progress_images_save_dir):
+    # The lists of horizontal and vertical progress images both contain the 
+    # original input image as the first element, so in order to avoid
+    # including the original input image twice, we add the [1:] part to the
+    # expression featuring vertical_progress_images.
+    horizontal_progress_images = progress_images[0]
+    vertical_progress_images = progress_images[1][1:]
+    # Strictly speaking, table_line_image is not a progress image but
+    # rather a result image. However, it is natural to include it into
+    # the collection of progress images.
+    table_line_image = progress_images[2]
+    progress_images_to_save = (
+        horizontal_progress_images
+        + vertical_progress_images
+        + [table_line_image]
+    )
+    for p, progress_image in enumerate(progress_images_to_save):
+        progress_image_number = p + 1
+        filename = 'image_{}_{}.jpg'.format(image_number,
+                                            progress_image_number)
+        path = os.path.join(progress_images_save_dir, filename)
+        cv.imwrite(path, progress_image)
+
+# The function below saves the progress geometry of a page (see
+# progress_geometry_functions.py) if it was recorded. The file is saved in the
+# progress image directory.
+
+def save_progress_geometry(image_number,
+                           table_structure_and_elements_description,
+                           table_structure_detection_arguments,
+                           save_dirs):
+    record_progress_geometry = table_structure_detection_arguments[11]
+    if record_progress_geometry:
+        progress_geometry = table_structure_and_elements_description[4]
+        filename = 'image_{}_progress_geometry.npz'.format(image_number)
+        path = os.path.join(save_dirs[3], filename)
+        progress_geometry_functions.save_progress_geometry(progress_geometry,
+                                                           path)
+
 # A result array is almost always associated with a particular logbook page.
 # The exceptional result array is numbers_of_table_elements which is associated
 # with a given logbook in its totality.
@@ -279,6 +325,60 @@ def prepare_result_arrays(table_structure_and_elements_description,
                      element_centroid_array]
     return result_arrays
 
+# The function below is the inverse of prepare_result_arrays in the sense that it
+# constructs a table_structure_and_elements_description from the result arrays
+# of a page (see construct_table_structure_and_elements_description in
+# main_computer_vision_functions.py). It is used when the result arrays of a
+# page are found in the result cache, and the page-specific row of
+# numbers_of_table_elements is appended in the same way as in
+# prepare_result_arrays. The argument blob_image is the cached blob image of
+# the page, which is needed only if the table element images are constructed.
+
+def construct_description_from_result_arrays(
+        image,
+        result_arrays,
+        numbers_of_table_elements,
+        image_number,
+        table_structure_detection_arguments,
+        table_element_detection_arguments,
+        blob_image=None):
+    construct_table_line_image = table_structure_detection_arguments[10]
+    construct_table_element_images = table_element_detection_arguments[2]
+    (horizontal_table_lines,
+     vertical_table_lines,
+     table_lines,
+     compressed_element_label_array,
+     element_rectangle_array,
+     element_centroid_array) = result_arrays
+    table_line_lists = [horizontal_table_lines.tolist(),
+                        vertical_table_lines.tolist(),
+                        table_lines.tolist()]
+    element_label_array = (
+        numpy_array_operations.construct_array_from_compressed_array(
+            compressed_element_label_array
+        )
+    )
+    # Each row of element_rectangle_array corresponds to an element label.
+    number_of_element_labels = len(element_rectangle_array)
+    table_element_component_parameters = [number_of_element_labels,
+                                          element_label_array,
+                                          element_rectangle_array,
+                                          element_centroid_array]
+    number_of_table_elements = number_of_element_labels - 1
+    numbers_of_table_elements.append([image_number, number_of_table_elements])
+    table_structure_and_elements_description = (
+        main_computer_vision_functions
+        .construct_table_structure_and_elements_description(
+            image,
+            table_line_lists,
+            table_element_component_parameters,
+            construct_table_line_image,
+            construct_table_element_images,
+            blob_image
+        )
+    )
+    return table_structure_and_elements_description
+
 # The following function prepares result images to be saved, see the directory
 # ./example_images/example_result_images for a set of examples.
 
@@ -392,6 +492,225 @@ def determine_images_to_display(image,
         images_to_display.append(table_element_cell_position_image)
     return images_to_display
 
+# The following function performs all of the page-specific computations of
+# multiple_logbooks_test, i.e., it determines the table lines and table
+# elements and prepares the result arrays and result images. Saving the results
+# is left to the caller, so that the computations can be performed in a worker
+# process.
+
+# If construct_result_images is False, the result images are not prepared, and
+# the caller is expected to prepare them by calling prepare_result_images (see
+# the render stage of multiple_logbooks_test).
+
+# The function does not extend numbers_of_table_elements of the caller (see
+# prepare_result_arrays). Instead, the page-specific row of the array is
+# returned as a part of the page result, and the caller extends its own array.
+
+# If cache_dir is not None, the result arrays of the page are looked up in the
+# result cache in cache_dir (see result_cache_functions.py). On a cache hit, the
+# detection is skipped and the table_structure_and_elements_description is
+# constructed from the cached result arrays. On a cache miss, the result arrays
+# computed as usual are stored in the cache. Since progress images and progress
+# geometry cannot be constructed from the result arrays, the progress geometry
+# of the page is cached together with the result arrays when either of them is
+# needed, and the progress images are drawn from it on a cache hit.
+
+# The return value page_result is a list of the following nine objects:
+# table_structure_and_elements_description, result_arrays, result_images, the
+# numbers_of_table_elements row of the page, a list of time points, cache_hit,
+# cache_entry_size, timing_events and buffer_arena_statistics. The value of
+# result_images is None if the result images were not prepared. The value of
+# cache_hit is True or False depending on whether the result arrays were found
+# in the cache, or None if no cache is used. The value of cache_entry_size is
+# the size in bytes of the cache entry stored on a cache miss, and 0 otherwise,
+# so that the caller can keep track of the cache size (see update_cache_size in
+# result_cache_functions.py). The list timing_events contains the timing events
+# recorded while the page was processed (see instrumentation_functions.py), and
+# it is empty unless the instrumentation is enabled. The list
+# buffer_arena_statistics gives the use of the scratch buffer arena of the
+# process during the page (see buffer_arena_functions.py).
+
+def process_page_image(image,
+                       image_number,
+                       table_structure_detection_arguments,
+                       table_element_detection_arguments,
+                       construct_table_element_cell_position_image,
+                       cache_dir=None,
+                       construct_result_images=True):
+    initial_buffer_arena_statistics = (
+        buffer_arena_functions.get_buffer_arena_statistics()
+    )
+    with instrumentation_functions.collect_timing_events() as timing_events:
+        page_result = compute_page_result(
+            image,
+            image_number,
+            table_structure_detection_arguments,
+            table_element_detection_arguments,
+            construct_table_element_cell_position_image,
+            cache_dir,
+            construct_result_images
+        )
+    page_result.append(timing_events)
+    buffer_arena_statistics = [
+        final_value - initial_value
+        for final_value, initial_value in zip(
+            buffer_arena_functions.get_buffer_arena_statistics(),
+            initial_buffer_arena_statistics
+        )
+    ]
+    page_result.append(buffer_arena_statistics)
+    return page_result
+
+# The function below does the actual work of process_page_image and returns
+# the first seven objects of page_result. The list of time points contains the
+# start time, the time when the table lines and elements were obtained and the
+# time when the result arrays were prepared, followed by the start and end times
+# of the preparation of the result images if they were prepared.
+
+def compute_page_result(image,
+                        image_number,
+                        table_structure_detection_arguments,
+                        table_element_detection_arguments,
+                        construct_table_element_cell_position_image,
+                        cache_dir,
+                        construct_result_images):
+    span = instrumentation_functions.span
+    start_time = time.time()
+    construct_progress_images = table_structure_detection_arguments[9]
+    record_progress_geometry = table_structure_detection_arguments[11]
+    numbers_of_table_elements = []
+    # Look up the result arrays (and the progress geometry and the blob image)
+    # in the cache.
+    cache_entry = None
+    cache_entry_size = 0
+    if cache_dir is not None:
+        with span('cache_lookup'):
+            cache_key = result_cache_functions.compute_cache_key(
+                image,
+                table_structure_detection_arguments,
+                table_element_detection_arguments
+            )
+            cache_entry = result_cache_functions.load_cache_entry(cache_dir,
+                                                                  cache_key)
+        cache_hit = cache_entry is not None
+    else:
+        cache_hit = None
+    if cache_entry is None:
+        # Determine table lines and table elements.
+        with span('detection'):
+            table_structure_and_elements_description = (
+                main_computer_vision_functions
+                .detect_table_structure_and_elements(
+                    image,
+                    table_structure_detection_arguments,
+                    table_element_detection_arguments
+                )
+            )
+        table_lines_and_elements_obtained_time = time.time()
+        # Prepare result arrays.
+        with span('result_arrays'):
+            result_arrays = prepare_result_arrays(
+                table_structure_and_elements_description,
+                numbers_of_table_elements,
+                image_number
+            )
+            if cache_dir is not None:
+                cache_entry_size = result_cache_functions.store_cache_entry(
+                    cache_dir,
+                    cache_key,
+                    result_arrays,
+                    table_structure_and_elements_description[4],
+                    table_structure_and_elements_description[5]
+                )
+        result_arrays_prepared_time = time.time()
+    else:
+        result_arrays, progress_geometry, blob_image = cache_entry
+        with span('cached_description'):
+            table_structure_and_elements_description = (
+                construct_description_from_result_arrays(
+                    image,
+                    result_arrays,
+                    numbers_of_table_elements,
+                    image_number,
+                    table_structure_detection_arguments,
+                    table_element_detection_arguments,
+                    blob_image
+                )
+            )
+            # The horizontal and vertical progress images are drawn from the
+            # cached progress geometry (see progress_geometry_functions.py).
+            if construct_progress_images:
+                progress_images = table_structure_and_elements_description[1]
+                for k, direction_progress_geometry in enumerate(
+                        progress_geometry):
+                    progress_images[k] = (
+                        main_computer_vision_functions.draw_progress_images(
+                            image,
+                            direction_progress_geometry
+                        )
+                    )
+            if record_progress_geometry:
+                table_structure_and_elements_description[4] = (
+                    progress_geometry
+                )
+        table_lines_and_elements_obtained_time = time.time()
+        result_arrays_prepared_time = time.time()
+    times = [start_time,
+             table_lines_and_elements_obtained_time,
+             result_arrays_prepared_time]
+    # Prepare result images if needed.
+    if construct_result_images:
+        with span('result_images'):
+            result_images = prepare_result_images(
+                image,
+                table_structure_and_elements_description,
+                table_structure_detection_arguments,
+                table_element_detection_arguments,
+                construct_table_element_cell_position_image
+            )
+        times.extend([result_arrays_prepared_time, time.time()])
+    else:
+        result_images = None
+    page_result = [table_structure_and_elements_description,
+                   result_arrays,
+                   result_images,
+                   numbers_of_table_elements[0],
+                   times,
+                   cache_hit,
+                   cache_entry_size]
+    return page_result
+
+# The function below is the initializer of the worker processes used by
+# multiple_logbooks_test when the number of workers is larger than one.
+
+# The idea is that a worker process pays the cost of importing cv2 (which
+# happens when this module is imported) and creating the LSDDetector instance
+# only once, i.e., when the worker is started, and not separately for every
+# page.
+
+# Each worker process is restricted to a single cv2 thread, since the pages are
+# already processed in parallel and additional threads would only compete for
+# the same cores.
+
+# If instrumentation_enabled is True, the worker process records timing events,
+# and if resource_accounting_enabled is True as well, the timing events contain
+# resource figures (see instrumentation_functions.py).
+
+# If num_page_threads is larger than one, the independent parts of the
+# processing of a page are run in parallel by a pool of num_page_threads threads
+# (see run_page_tasks in main_computer_vision_functions.py).
+
+def initialize_worker_process(instrumentation_enabled=False,
+                              resource_accounting_enabled=False,
+                              num_page_threads=1):
+    cv.setNumThreads(1)
+    main_computer_vision_functions.get_lsd_line_detector()
+    main_computer_vision_functions.set_num_page_threads(num_page_threads)
+    instrumentation_functions.enable_instrumentation(
+        instrumentation_enabled,
+        resource_accounting_enabled
+    )
+
 # The following simple, self-explanatory function prints information pertaining
 # to a run of random_sample_test.
 
@@ -420,7 +739,8 @@ def print_multiple_logbooks_test_times(logbook,
                                        total_number_of_images,
                                        table_structure_and_elements_description,
                                        times,
-                                       table_structure_detection_arguments):
+                                       table_structure_detection_arguments,
+                                       overlapped_write_time=None):
     # Do some argument unpacking.
     table_element_component_parameters = (
         table_structure_and_elements_description[2]
@@ -430,11 +750,17 @@ def print_multiple_logbooks_test_times(logbook,
     # table elements is one less than the number of element labels.
     number_of_table_elements = number_of_element_labels - 1
     # Construct the part of the main string that will printed in any case.
+    # The time points times[0], ..., times[2] are recorded by
+    # process_page_image, times[3] and times[4] when the result images are
+    # prepared and the rest when the results are saved. Since a page may wait
+    # for a while between the stages of multiple_logbooks_test, the preparation
+    # of the result images is timed from times[3] and the saving from times[5]
+    # onwards. The total time includes the waiting.
     lines_and_elements_time = times[1] - times[0]
     arrays_prepared_time = times[2] - times[1]
-    arrays_saved_time = times[3] - times[2]
     images_prepared_time = times[4] - times[3]
-    images_saved_time = times[5] - times[4]
+    arrays_saved_time = times[6] - times[5]
+    images_saved_time = times[7] - times[6]
     multiple_logbooks_test_times_string = (
         'Document: {} ({} / {}) \n'.format(logbook,
                                           logbook_number,
@@ -443,20 +769,29 @@ def print_multiple_logbooks_test_times(logbook,
         + 'Number of elements: {} \n'.format(number_of_table_elements)
         + 'Table lines and elements: {:.2f}s \n'.format(lines_and_elements_time)
         + 'Result arrays prepared: {:.2f}s \n'.format(arrays_prepared_time)
-        + 'Result arrays saved: {:.2f}s \n'.format(arrays_saved_time)
         + 'Result images prepared: {:.2f}s \n'.format(images_prepared_time)
+        + 'Result arrays saved: {:.2f}s \n'.format(arrays_saved_time)
         + 'Result images saved: {:.2f}s \n'.format(images_saved_time)
     )
     # Extend the main string if needed.
     construct_progress_images = table_structure_detection_arguments[9]
     if construct_progress_images:
-        progress_images_saved_time = times[6] - times[5]
+        progress_images_saved_time = times[8] - times[7]
         progress_images_string = (
             'Progress images saved: {:.2f}s \n'.format(
                 progress_images_saved_time
             )
         )
         multiple_logbooks_test_times_string += progress_images_string
+    # The part of the saving that was hidden behind the detection of other
+    # pages (see compute_overlapped_write_time).
+    if overlapped_write_time is not None:
+        overlapped_write_time_string = (
+            'Saving overlapped with detection: {:.2f}s \n'.format(
+                overlapped_write_time
+            )
+        )
+        multiple_logbooks_test_times_string += overlapped_write_time_string
     # Finalize and print the main string.
     total_time = times[-1] - times[0]
     total_time_string = 'Total time: {:.2f}s \n'.format(total_time)
@@ -474,15 +809,68 @@ def print_logbook_total_time(logbook_start_time):
     )
     print(logbook_total_time_string)
 
+# The function below computes how much of the time spent on saving the result
+# files of a page was overlapped with the determination of the table lines and
+# elements of other pages, i.e., hidden behind the detection by the pipeline of
+# multiple_logbooks_test. The argument write_interval is the list [start_time,
+# end_time] of the saving, and detection_intervals is a list of such lists, one
+# for each page whose detection has started. The end time of a detection that
+# is still in progress is None, and current_time is used instead. The
+# detection intervals are clipped to the write interval and merged, so that the
+# time covered by several detections at once is counted only once.
+
+def compute_overlapped_write_time(write_interval,
+                                  detection_intervals,
+                                  current_time):
+    write_start_time, write_end_time = write_interval
+    clipped_detection_intervals = []
+    for start_time, end_time in list(detection_intervals):
+        if end_time is None:
+            end_time = current_time
+        start_time = max(start_time, write_start_time)
+        end_time = min(end_time, write_end_time)
+        if start_time < end_time:
+            clipped_detection_intervals.append([start_time, end_time])
+    overlapped_write_time = 0.0
+    covered_until_time = write_start_time
+    for start_time, end_time in sorted(clipped_detection_intervals):
+        start_time = max(start_time, covered_until_time)
+        if start_time < end_time:
+            overlapped_write_time += end_time - start_time
+            covered_until_time = end_time
+    return overlapped_write_time
+
+# The following simple function prints the total time spent on saving the
+# result files of a logbook and the part of it that was overlapped with the
+# detection (see compute_overlapped_write_time).
+
+def print_overlapped_write_time(write_time, overlapped_write_time):
+    overlapped_fraction = (overlapped_write_time / write_time
+                           if write_time > 0 else 0.0)
+    overlapped_write_time_string = (
+        'Result files saved: {:.2f}s \n'.format(write_time)
+        + 'Saving overlapped with detection: {:.2f}s ({:.0f}%) \n'.format(
+            overlapped_write_time,
+            100 * overlapped_fraction
+        )
+    )
+    print(overlapped_write_time_string)
+
 # The following is the first main test function. It processes random pages of
 # random documents one at a time and displays the results onscreen. Given our
 # discussion on the auxiliary functions above, the code of the function should
 # be easy to understand.
 
+# If num_page_threads is larger than one, the independent parts of the
+# processing of a page are run in parallel (see run_page_tasks in
+# main_computer_vision_functions.py).
+
 def random_sample_test(table_structure_detection_arguments,
                        table_element_detection_arguments,
                        construct_table_element_cell_position_image,
-                       data_dir):
+                       data_dir,
+                       num_page_threads=1):
+    main_computer_vision_functions.set_num_page_threads(num_page_threads)
     while True:
         start_time = time.time()
         # Choose a random page of a random logbook.
@@ -514,6 +902,162 @@ def random_sample_test(table_structure_detection_arguments,
         title = 'Document {} / {}'.format(logbook, image_file)
         gui_functions.display_multiple_images(images_to_display, title)
 
+# The following four functions are the stage functions of the pipeline used by
+# multiple_logbooks_test (see pipeline_functions.py). A page passing through the
+# pipeline is represented by a list [image_file, image_number, image,
+# page_result], where image and page_result are None until the page has been
+# loaded and processed, respectively. Each stage function fills in the list and
+# returns it.
+
+# The first stage loads the page image.
+
+def load_page_image(page, image_dir):
+    image_file = page[0]
+    path = os.path.join(image_dir, image_file)
+    page[2] = utilities.load_image(path, grayscale=True)
+    return page
+
+# The second stage determines the table lines and elements and prepares the
+# result arrays (see process_page_image). If worker_pool is None, the page is
+# processed in the current thread, and otherwise in a worker process. The
+# interval [start_time, end_time] of the detection is appended to the list
+# detection_intervals, with end_time None while the detection is in progress
+# (see compute_overlapped_write_time).
+
+def detect_page_table_lines_and_elements(page,
+                                         worker_pool,
+                                         page_arguments,
+                                         detection_intervals):
+    image_number = page[1]
+    image = page[2]
+    detection_interval = [time.time(), None]
+    detection_intervals.append(detection_interval)
+    try:
+        if worker_pool is None:
+            page_result = process_page_image(image,
+                                             image_number,
+                                             *page_arguments)
+        else:
+            page_result = worker_pool.apply(
+                process_page_image,
+                [image, image_number] + page_arguments
+            )
+    finally:
+        detection_interval[1] = time.time()
+    page[3] = page_result
+    return page
+
+# The third stage prepares the result images. The timing events recorded by the
+# stage are added to the timing events of the page.
+
+def render_page_result_images(page,
+                              table_structure_detection_arguments,
+                              table_element_detection_arguments,
+                              construct_table_element_cell_position_image):
+    span = instrumentation_functions.span
+    image = page[2]
+    page_result = page[3]
+    table_structure_and_elements_description = page_result[0]
+    times = page_result[4]
+    with instrumentation_functions.collect_timing_events() as timing_events:
+        result_images_start_time = time.time()
+        with span('result_images'):
+            result_images = prepare_result_images(
+                image,
+                table_structure_and_elements_description,
+                table_structure_detection_arguments,
+                table_element_detection_arguments,
+                construct_table_element_cell_position_image
+            )
+        times.extend([result_images_start_time, time.time()])
+    page_result[2] = result_images
+    page_result[7].extend(timing_events)
+    return page
+
+# The fourth stage saves the results of the page. Each image of the page is
+# released as soon as it has been saved, since the images of a page take a lot
+# of memory (see multiple_logbooks_test), and they are not needed anymore.
+
+def write_page_results(page,
+                       save_dirs,
+                       table_structure_detection_arguments,
+                       table_element_detection_arguments,
+                       construct_table_element_cell_position_image,
+                       result_array_file_suffixes,
+                       result_image_file_suffixes):
+    span = instrumentation_functions.span
+    image_number = page[1]
+    page_result = page[3]
+    (table_structure_and_elements_description,
+     result_arrays,
+     result_images) = page_result[:3]
+    times = page_result[4]
+    with instrumentation_functions.collect_timing_events() as timing_events:
+        # Save result arrays and result images.
+        save_start_time = time.time()
+        with span('save_result_arrays'):
+            save_result_arrays(result_arrays,
+                               image_number,
+                               save_dirs,
+                               result_array_file_suffixes)
+        result_arrays_saved_time = time.time()
+        with span('save_result_images'):
+            save_result_images(result_images,
+                               image_number,
+                               save_dirs,
+                               table_structure_detection_arguments,
+                               table_element_detection_arguments,
+                               construct_table_element_cell_position_image,
+                               result_image_file_suffixes)
+        result_images_saved_time = time.time()
+        # The input image and the table element images are a part of the
+        # result images, and the blob image is only needed for the latter.
+        result_images = None
+        page_result[2] = None
+        page[2] = None
+        table_structure_and_elements_description[3] = None
+        table_structure_and_elements_description[5] = None
+        # Save progress images and progress geometry if needed.
+        with span('save_progress_images'):
+            progress_images_saved_time = save_progress_images(
+                image_number,
+                table_structure_and_elements_description,
+                table_structure_detection_arguments,
+                save_dirs
+            )
+        table_structure_and_elements_description[1] = None
+        with span('save_progress_geometry'):
+            save_progress_geometry(image_number,
+                                   table_structure_and_elements_description,
+                                   table_structure_detection_arguments,
+                                   save_dirs)
+    times.extend([save_start_time,
+                  result_arrays_saved_time,
+                  result_images_saved_time])
+    if progress_images_saved_time is not None:
+        times.append(progress_images_saved_time)
+    page_result[7].extend(timing_events)
+    return page
+
+# The function below prepares the manifest of a logbook at the beginning of the
+# processing of the logbook. If resume is True and the logbook has a manifest
+# that was created with the same parameters, this manifest is returned, and
+# the pages recorded in it will be skipped. Otherwise, an empty manifest is
+# returned and saved (which replaces an existing manifest, if any).
+
+def prepare_manifest(logbook, logbook_save_dir, parameter_hash, resume):
+    if resume:
+        manifest = manifest_functions.load_manifest(logbook_save_dir)
+        if manifest is not None:
+            if manifest['parameter_hash'] == parameter_hash:
+                return manifest
+            print('Document {}: the parameters differ from '.format(logbook)
+                  + 'the previous run, processing all pages again. \n')
+    manifest = manifest_functions.construct_empty_manifest(logbook,
+                                                           parameter_hash)
+    manifest_functions.save_manifest(manifest, logbook_save_dir)
+    return manifest
+
 # The following is the second main test function. It processes all of the
 # documents in ./data, or more generally, in the root data
 # directory, and saves the results in ./results, or more
@@ -521,107 +1065,455 @@ def random_sample_test(table_structure_detection_arguments,
 # auxiliary functions above, the code of the function should be easy to
 # understand.
 
+# The pages of a logbook are processed by a pipeline of four stages (see
+# pipeline_functions.py): the page images are loaded by num_load_threads
+# threads, the table lines and elements are determined by num_workers worker
+# processes, the result images are prepared by num_render_threads threads and
+# the results are saved by num_writer_threads threads. The stages are connected
+# by queues holding at most prefetch_count, render_queue_size and
+# write_queue_size pages, respectively, so the memory usage does not depend on
+# the number of pages in a logbook. Note that a page carrying its result images
+# and progress images takes roughly 60 bytes per pixel of the page image (about
+# 1 GB for a 17-megapixel scan), so the queues are short by default, and the
+# images of a page are dropped as soon as they have been saved (see
+# write_page_results). The utilisation of the stages is printed
+# after each logbook and at the end, which shows the stage limiting the
+# throughput. The time spent on saving the result files that was hidden behind
+# the detection of other pages is printed after each logbook as well (see
+# print_overlapped_write_time).
+
+# If num_workers is larger than one, the worker processes form a pool which is
+# created once and used for all of the logbooks. Otherwise, the table lines
+# and elements are determined in the current process. The pages are passed
+# from one stage to the next, and thus also saved, recorded in the manifest and
+# reported, in page order regardless of the numbers of workers and threads (see
+# the reorder windows in pipeline_functions.py).
+
+# If num_page_threads is larger than one, the independent parts of the
+# processing of a single page are also run in parallel (see run_page_tasks in
+# main_computer_vision_functions.py), either by the worker processes or by the
+# current process.
+
+# The completed pages of each logbook are recorded in a manifest (see
+# manifest_functions.py) once all of their result files have been saved. The
+# manifest is saved every few pages and at the end of the logbook. If
+# resume is True, the pages recorded in the manifest are skipped, provided that
+# the manifest was created with the same parameters. In any case, the result
+# array numbers_of_table_elements is constructed from the manifest, so it also
+# covers the pages processed by earlier runs.
+
+# If cache_dir is not None, the result arrays are cached in cache_dir (see
+# process_page_image and result_cache_functions.py), and the least recently
+# used cache entries are evicted whenever the size of the cache exceeds
+# max_cache_size bytes. The size of the cache is computed once at the start and
+# then kept up to date from the sizes of the stored entries. The cache statistics are printed at the end.
+
+# The statistics of the scratch buffer arenas of the processes determining the
+# table lines and elements (see buffer_arena_functions.py) are summed over the
+# pages and printed after each logbook and at the end. They show how many of
+# the page-sized intermediate images were actually allocated, which is usually
+# only a few per worker, since the pages of a logbook tend to have the same
+# shape.
+
+# If shard_count is larger than one, only the logbooks belonging to the shard
+# shard_index are processed, or if shard_by_pages is True, only the pages
+# belonging to the shard (see shard_functions.py). In the latter case, the
+# image numbers are still determined by the full page lists of the logbooks, so
+# that the results of the shards can be merged.
+
+# If timing_events_path is not None, the timing events of each page (see
+# instrumentation_functions.py) are written into the JSON Lines file
+# timing_events_path, and the percentiles of the span durations are printed
+# and written into the same file at the end. If resource_accounting is True,
+# the timing events also contain memory and CPU time figures.
+
 def multiple_logbooks_test(table_structure_detection_arguments,
                            table_element_detection_arguments,
                            construct_table_element_cell_position_image,
                            data_dir,
                            save_dirs_to_create,
                            result_array_file_suffixes,
-                           result_image_file_suffixes):
-    # Get the list of logbooks and start processing the logbooks one at a time.
-    #logbook_list = construct_document_list(data_dirs)
-    logbook_list = construct_document_list(data_dir)
-    total_number_of_logbooks = len(logbook_list)
-    for b, logbook in enumerate(logbook_list):
-        logbook_start_time = time.time()
-        logbook_number = b + 1
-        # Create the save directories.
-        save_dirs = create_save_directories(
-            logbook,
-            save_dirs_to_create,
-            table_structure_detection_arguments
+                           result_image_file_suffixes,
+                           num_workers=1,
+                           prefetch_count=2,
+                           num_writer_threads=1,
+                           write_queue_size=1,
+                           resume=False,
+                           cache_dir=None,
+                           max_cache_size=10 * 1024 ** 3,
+                           shard_index=0,
+                           shard_count=1,
+                           shard_by_pages=False,
+                           timing_events_path=None,
+                           resource_accounting=False,
+                           num_load_threads=1,
+                           num_render_threads=1,
+                           render_queue_size=1,
+                           num_page_threads=1):
+    instrumentation_enabled = timing_events_path is not None
+    instrumentation_functions.enable_instrumentation(instrumentation_enabled,
+                                                     resource_accounting)
+    # The timing event file and the worker pool are created inside the try
+    # statement below, so that they are closed and terminated also if the
+    # creation of the other one fails.
+    timing_event_file = None
+    worker_pool = None
+    try:
+        if instrumentation_enabled:
+            timing_event_file = open(timing_events_path, 'w')
+        span_timing_events = {}
+        if num_workers > 1:
+            worker_pool = multiprocessing.Pool(
+                num_workers,
+                initializer=initialize_worker_process,
+                initargs=[instrumentation_enabled,
+                          resource_accounting,
+                          num_page_threads]
+            )
+        else:
+            main_computer_vision_functions.set_num_page_threads(
+                num_page_threads
+            )
+        # The result images are prepared by the render stage, not by
+        # process_page_image.
+        page_arguments = [table_structure_detection_arguments,
+                          table_element_detection_arguments,
+                          construct_table_element_cell_position_image,
+                          cache_dir,
+                          False]
+        parameter_hash = manifest_functions.compute_parameter_hash(
+            table_structure_detection_arguments,
+            table_element_detection_arguments,
+            construct_table_element_cell_position_image,
+            result_array_file_suffixes,
+            result_image_file_suffixes
         )
-        # Load the images.
-        images = load_page_images(logbook, data_dir)
-        total_number_of_images = len(images)
-        # The array numbers_of_table_elements is accumulated one image at a
+        if cache_dir is not None:
+            os.makedirs(cache_dir, exist_ok=True)
+            cache_size = result_cache_functions.compute_cache_size(cache_dir)
+        cache_statistics = [0, 0, 0]
+        total_buffer_arena_statistics = [0, 0, 0]
+        pipeline_stages = None
+        total_pipeline_statistics = []
+        # Get the list of logbooks and start processing the logbooks one at a
         # time.
-        numbers_of_table_elements = []
-        for i, image in enumerate(images):
-            start_time = time.time()
-            image_number = i + 1
-            # Determine table lines and table elements.
-            table_structure_and_elements_description = (
-                main_computer_vision_functions
-                .detect_table_structure_and_elements(
-                    image,
+        logbook_list = construct_document_list(data_dir)
+        if shard_count > 1 and not shard_by_pages:
+            logbook_list = shard_functions.select_shard_logbooks(logbook_list,
+                                                                 shard_index,
+                                                                 shard_count)
+        total_number_of_logbooks = len(logbook_list)
+        for b, logbook in enumerate(logbook_list):
+            logbook_start_time = time.time()
+            logbook_number = b + 1
+            page_file_list = construct_page_file_list(logbook, data_dir)
+            if shard_count > 1 and shard_by_pages:
+                shard_pages = set(shard_functions.select_shard_pages(
+                    logbook,
+                    page_file_list,
+                    shard_index,
+                    shard_count
+                ))
+                # A logbook without pages in the shard is skipped entirely.
+                if not shard_pages:
+                    continue
+            else:
+                shard_pages = set(page_file_list)
+            # Create the save directories.
+            save_dirs = create_save_directories(
+                logbook,
+                save_dirs_to_create,
+                table_structure_detection_arguments
+            )
+            logbook_save_dir = save_dirs[0]
+            manifest = prepare_manifest(logbook,
+                                        logbook_save_dir,
+                                        parameter_hash,
+                                        resume)
+            # Determine the pages to be processed. The image number of a page
+            # is its position in the full page list, also when some pages are
+            # skipped. The pages are constructed lazily, so that only the pages
+            # in the pipeline are held in memory.
+            total_number_of_images = len(page_file_list)
+            completed_pages = manifest['completed_pages']
+            pages = ([image_file, i + 1, None, None]
+                     for i, image_file in enumerate(page_file_list)
+                     if image_file in shard_pages
+                     and image_file not in completed_pages)
+            number_of_skipped_images = len(completed_pages)
+            if number_of_skipped_images > 0:
+                print('Document {}: skipping {} completed pages. \n'.format(
+                    logbook,
+                    number_of_skipped_images
+                ))
+            # Construct the pipeline stages of the logbook. The detection
+            # intervals of the pages are collected for determining how much of
+            # the saving was overlapped with the detection.
+            detection_intervals = []
+            image_dir = os.path.join(data_dir, logbook)
+            pipeline_stages = [
+                pipeline_functions.create_pipeline_stage(
+                    'load',
+                    lambda page: load_page_image(page, image_dir),
+                    num_load_threads,
+                    prefetch_count
+                ),
+                pipeline_functions.create_pipeline_stage(
+                    'detect',
+                    lambda page: detect_page_table_lines_and_elements(
+                        page,
+                        worker_pool,
+                        page_arguments,
+                        detection_intervals
+                    ),
+                    num_workers,
+                    render_queue_size
+                ),
+                pipeline_functions.create_pipeline_stage(
+                    'render',
+                    lambda page: render_page_result_images(
+                        page,
+                        table_structure_detection_arguments,
+                        table_element_detection_arguments,
+                        construct_table_element_cell_position_image
+                    ),
+                    num_render_threads,
+                    write_queue_size
+                ),
+                pipeline_functions.create_pipeline_stage(
+                    'write',
+                    lambda page: write_page_results(
+                        page,
+                        save_dirs,
+                        table_structure_detection_arguments,
+                        table_element_detection_arguments,
+                        construct_table_element_cell_position_image,
+                        result_array_file_suffixes,
+                        result_image_file_suffixes
+                    ),
+                    num_writer_threads,
+                    1
+                )
+            ]
+            buffer_arena_statistics = [0, 0, 0]
+            write_time = 0.0
+            overlapped_write_time = 0.0
+            manifest_save_state = [0, time.time()]
+            pipeline_start_time = time.time()
+            completed_page_results = pipeline_functions.run_pipeline(
+                pages,
+                pipeline_stages,
+                preserve_order=True
+            )
+            for image_file, _, _, page_result in completed_page_results:
+                (table_structure_and_elements_description,
+                 _,
+                 _,
+                 number_of_table_elements_row,
+                 times,
+                 cache_hit,
+                 cache_entry_size,
+                 timing_events,
+                 page_buffer_arena_statistics) = page_result
+                # Update the cache statistics. A cache miss means that a new
+                # entry was stored in the cache, so the cache may have to be
+                # shrunk.
+                if cache_hit:
+                    cache_statistics[0] += 1
+                elif cache_hit is not None:
+                    cache_statistics[1] += 1
+                    cache_size, number_of_evictions = (
+                        result_cache_functions.update_cache_size(
+                            cache_dir,
+                            cache_size,
+                            cache_entry_size,
+                            max_cache_size
+                        )
+                    )
+                    cache_statistics[2] += number_of_evictions
+                for k, value in enumerate(page_buffer_arena_statistics):
+                    buffer_arena_statistics[k] += value
+                    total_buffer_arena_statistics[k] += value
+                # The saving of the results of the page is timed from
+                # times[5] onwards (see print_multiple_logbooks_test_times).
+                page_write_time = times[-1] - times[5]
+                page_overlapped_write_time = compute_overlapped_write_time(
+                    [times[5], times[-1]],
+                    detection_intervals,
+                    time.time()
+                )
+                write_time += page_write_time
+                overlapped_write_time += page_overlapped_write_time
+                image_number, number_of_table_elements = (
+                    number_of_table_elements_row
+                )
+                # Write the timing events of the page.
+                if instrumentation_enabled:
+                    instrumentation_functions.write_timing_events(
+                        timing_event_file,
+                        timing_events,
+                        {'logbook': logbook,
+                         'image_file': image_file,
+                         'image_number': image_number}
+                    )
+                    instrumentation_functions.collect_span_timing_events(
+                        span_timing_events,
+                        timing_events
+                    )
+                # The result files of the page have been saved, so the page
+                # can be recorded in the manifest.
+                manifest_functions.record_completed_page(
+                    manifest,
+                    image_file,
+                    image_number,
+                    number_of_table_elements
+                )
+                manifest_save_state[0] += 1
+                manifest_functions.save_manifest_if_due(manifest,
+                                                        logbook_save_dir,
+                                                        manifest_save_state)
+                # Print a message pertaining to the processing of the input
+                # image.
+                print_multiple_logbooks_test_times(
+                    logbook,
+                    logbook_number,
+                    total_number_of_logbooks,
+                    image_number,
+                    total_number_of_images,
+                    table_structure_and_elements_description,
+                    times,
                     table_structure_detection_arguments,
-                    table_element_detection_arguments
+                    page_overlapped_write_time
                 )
+            pipeline_elapsed_time = time.time() - pipeline_start_time
+            if manifest_save_state[0] > 0:
+                manifest_functions.save_manifest(manifest, logbook_save_dir)
+            # After all of the pages of a logbook have been processed, save the
+            # result array numbers_of_table_elements and print messages as to
+            # the elapsed time and the utilisation of the pipeline stages.
+            numbers_of_table_elements = (
+                manifest_functions.construct_numbers_of_table_elements(manifest)
             )
-            table_lines_and_elements_obtained_time = time.time()
-            # Prepare and save result arrays.
-            result_arrays = prepare_result_arrays(
-                table_structure_and_elements_description,
+            study_and_save_numbers_of_table_elements(
                 numbers_of_table_elements,
-                image_number
+                logbook,
+                save_dirs
             )
-            result_arrays_prepared_time = time.time()
-            save_result_arrays(result_arrays,
-                               image_number,
-                               save_dirs,
-                               result_array_file_suffixes)
-            result_arrays_saved_time = time.time()
-            # Prepare and save result images.
-            result_images = prepare_result_images(
-                image,
-                table_structure_and_elements_description,
-                table_structure_detection_arguments,
-                table_element_detection_arguments,
-                construct_table_element_cell_position_image
+            print_logbook_total_time(logbook_start_time)
+            pipeline_functions.print_pipeline_utilisation(
+                pipeline_stages,
+                pipeline_elapsed_time,
+                [pipeline_stage[4] for pipeline_stage in pipeline_stages]
             )
-            result_images_prepared_time = time.time()
-            save_result_images(
-                result_images,
-                image_number,
-                save_dirs,
-                table_structure_detection_arguments,
-                table_element_detection_arguments,
-                construct_table_element_cell_position_image,
-                result_image_file_suffixes)
-            result_images_saved_time = time.time()
-            # Save progress images if needed.
-            progress_images_saved_time = save_progress_images(
-                image_number,
-                table_structure_and_elements_description,
-                table_structure_detection_arguments,
-                save_dirs
+            print_overlapped_write_time(write_time, overlapped_write_time)
+            pipeline_functions.accumulate_pipeline_statistics(
+                total_pipeline_statistics,
+                pipeline_stages,
+                pipeline_elapsed_time
             )
-            # Print a message pertaining to the processing of the input image.
-            times = [start_time,
-                     table_lines_and_elements_obtained_time,
-                     result_arrays_prepared_time,
-                     result_arrays_saved_time,
-                     result_images_prepared_time,
-                     result_images_saved_time]
-            if progress_images_saved_time is not None:
-                times.append(progress_images_saved_time)
-            print_multiple_logbooks_test_times(
-                logbook,
-                logbook_number,
-                total_number_of_logbooks,
-                image_number,
-                total_number_of_images,
-                table_structure_and_elements_description,
-                times,
-                table_structure_detection_arguments
+            buffer_arena_functions.print_buffer_arena_statistics(
+                buffer_arena_statistics
+            )
+        if total_pipeline_statistics:
+            print('All documents:')
+            pipeline_functions.print_pipeline_utilisation(
+                pipeline_stages,
+                total_pipeline_statistics[0],
+                total_pipeline_statistics[1:]
+            )
+            buffer_arena_functions.print_buffer_arena_statistics(
+                total_buffer_arena_statistics
+            )
+        if cache_dir is not None:
+            result_cache_functions.print_cache_statistics(cache_statistics)
+        if instrumentation_enabled:
+            span_duration_summaries = (
+                instrumentation_functions.construct_span_duration_summaries(
+                    span_timing_events
+                )
+            )
+            instrumentation_functions.write_timing_events(
+                timing_event_file,
+                span_duration_summaries,
+                {}
+            )
+            instrumentation_functions.print_span_duration_summaries(
+                span_duration_summaries
+            )
+    except BaseException:
+        # On an error or Ctrl+C, the tasks still queued for the worker
+        # processes are discarded instead of waiting for them to finish.
+        if worker_pool is not None:
+            worker_pool.terminate()
+        raise
+    else:
+        if worker_pool is not None:
+            worker_pool.close()
+    finally:
+        if worker_pool is not None:
+            worker_pool.join()
+        if timing_event_file is not None:
+            timing_event_file.close()
+
+# The following function draws the progress images of the pages of a logbook
+# from the progress geometry files saved by an earlier run of
+# multiple_logbooks_test (see save_progress_geometry), and saves them in the
+# progress image directory just as if they had been drawn during the run. If
+# image_numbers is None, the progress images of all pages with a progress
+# geometry file are drawn.
+
+# The image number of a page is its position in the page list of the logbook
+# (see multiple_logbooks_test), so the page images are found by means of the
+# page list. The function returns the number of pages whose progress images
+# were drawn.
+
+def render_logbook_progress_images(logbook,
+                                   data_dir,
+                                   results_dir,
+                                   progress_images_subdir,
+                                   image_numbers=None):
+    progress_images_save_dir = os.path.join(results_dir,
+                                            logbook,
+                                            progress_images_subdir)
+    page_file_list = construct_page_file_list(logbook, data_dir)
+    if image_numbers is None:
+        image_numbers = range(1, len(page_file_list) + 1)
+        report_missing_pages = False
+    else:
+        report_missing_pages = True
+    number_of_rendered_pages = 0
+    for image_number in image_numbers:
+        filename = 'image_{}_progress_geometry.npz'.format(image_number)
+        path = os.path.join(progress_images_save_dir, filename)
+        if not 1 <= image_number <= len(page_file_list):
+            print('Document {}: no page {}. \n'.format(logbook, image_number))
+            continue
+        if not os.path.isfile(path):
+            if report_missing_pages:
+                print('Document {}: no progress geometry for page {}. \n'.format(
+                    logbook,
+                    image_number
+                ))
+            continue
+        progress_geometry = progress_geometry_functions.load_progress_geometry(
+            path
+        )
+        image_path = os.path.join(data_dir,
+                                  logbook,
+                                  page_file_list[image_number - 1])
+        image = utilities.load_image(image_path, grayscale=True)
+        progress_images = (
+            progress_geometry_functions.draw_progress_images_from_geometry(
+                image,
+                progress_geometry
             )
-        # After all of the pages of a logbook have been processed, save the
-        # result array numbers_of_table_elements and print a message as to
-        # the elapsed time.
-        study_and_save_numbers_of_table_elements(
-            numbers_of_table_elements,
-            logbook,
-            save_dirs
         )
-        print_logbook_total_time(logbook_start_time)
+        write_progress_images(image_number,
+                              progress_images,
+                              progress_images_save_dir)
+        number_of_rendered_pages += 1
+    print('Document {}: progress images drawn for {} pages. \n'.format(
+        logbook,
+        number_of_rendered_pages
+    ))
+    return number_of_rendered_pages
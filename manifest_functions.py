@@ -0,0 +1,125 @@
+# The functions in this file maintain a so-called manifest for each logbook
+# processed by multiple_logbooks_test. The manifest records which pages of the
+# logbook have been completely processed, i.e., whose result files have all
+# been written, together with a hash of the parameters used. This makes it
+# possible to resume an interrupted run without processing the completed pages
+# again (see the resume argument of multiple_logbooks_test).
+
+# A manifest is a dictionary of the following form:
+# {'logbook': logbook,
+#  'parameter_hash': parameter_hash,
+#  'completed_pages': {image_file: [image_number, number_of_table_elements]}}
+# It is saved as the JSON file MANIFEST_FILENAME in the save directory of the
+# logbook.
+
+import hashlib
+import json
+import time
+import os
+
+MANIFEST_FILENAME = 'manifest.json'
+
+# Saving the whole manifest after every page would take time proportional to
+# the square of the number of pages of a logbook, so the manifest is saved only
+# after MANIFEST_SAVE_PAGE_INTERVAL recorded pages or MANIFEST_SAVE_TIME_INTERVAL
+# seconds, whichever comes first (see save_manifest_if_due). An interrupted run
+# thus processes at most a few pages again when it is resumed.
+
+MANIFEST_SAVE_PAGE_INTERVAL = 20
+MANIFEST_SAVE_TIME_INTERVAL = 5
+
+# The function below computes a hash of all of the arguments that affect the
+# result files of a page. The arguments are first turned into a canonical JSON
+# string, so that equal parameter sets always give the same hash.
+
+def compute_parameter_hash(table_structure_detection_arguments,
+                           table_element_detection_arguments,
+                           construct_table_element_cell_position_image,
+                           result_array_file_suffixes,
+                           result_image_file_suffixes):
+    parameters = [list(table_structure_detection_arguments),
+                  list(table_element_detection_arguments),
+                  construct_table_element_cell_position_image,
+                  list(result_array_file_suffixes),
+                  list(result_image_file_suffixes)]
+    parameter_string = json.dumps(parameters, sort_keys=True)
+    parameter_hash = hashlib.sha256(parameter_string.encode()).hexdigest()
+    return parameter_hash
+
+def construct_empty_manifest(logbook, parameter_hash):
+    manifest = {'logbook': logbook,
+                'parameter_hash': parameter_hash,
+                'completed_pages': {}}
+    return manifest
+
+# The function below loads the manifest of a logbook. If the manifest does not
+# exist, None is returned.
+
+def load_manifest(logbook_save_dir):
+    path = os.path.join(logbook_save_dir, MANIFEST_FILENAME)
+    if not os.path.isfile(path):
+        return None
+    with open(path) as manifest_file:
+        manifest = json.load(manifest_file)
+    return manifest
+
+# The following function saves a manifest atomically: the manifest is first
+# written into a temporary file in the same directory, and the temporary file
+# is then renamed. Since a rename within a directory is atomic, the manifest
+# file is always either the old or the new version, even if the program is
+# killed in the middle of the save.
+
+def save_manifest(manifest, logbook_save_dir):
+    path = os.path.join(logbook_save_dir, MANIFEST_FILENAME)
+    # The process id makes the name of the temporary file unique among the
+    # processes which might be saving the same manifest.
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+    try:
+        with open(temporary_path, 'w') as manifest_file:
+            json.dump(manifest, manifest_file, indent=1, sort_keys=True)
+            manifest_file.flush()
+            os.fsync(manifest_file.fileno())
+        os.replace(temporary_path, path)
+    except BaseException:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+        raise
+
+# The function below saves a manifest if enough pages have been recorded or
+# enough time has passed since the manifest was last saved (see above). The
+# list manifest_save_state is of the form [number_of_unsaved_pages,
+# last_save_time], and it is updated by the function. The caller is expected to
+# increment number_of_unsaved_pages for each recorded page, and to save the
+# manifest once more at the end if number_of_unsaved_pages is positive. The
+# return value tells whether the manifest was saved.
+
+def save_manifest_if_due(manifest, logbook_save_dir, manifest_save_state):
+    number_of_unsaved_pages, last_save_time = manifest_save_state
+    current_time = time.time()
+    if (number_of_unsaved_pages < MANIFEST_SAVE_PAGE_INTERVAL
+            and current_time - last_save_time < MANIFEST_SAVE_TIME_INTERVAL):
+        return False
+    save_manifest(manifest, logbook_save_dir)
+    manifest_save_state[0] = 0
+    manifest_save_state[1] = current_time
+    return True
+
+# The function below records a completed page in a manifest. The manifest is
+# not saved by this function.
+
+def record_completed_page(manifest,
+                          image_file,
+                          image_number,
+                          number_of_table_elements):
+    completed_pages = manifest['completed_pages']
+    completed_pages[image_file] = [int(image_number),
+                                   int(number_of_table_elements)]
+
+# The following function reconstructs the logbook-specific result array
+# numbers_of_table_elements (see study_and_save_numbers_of_table_elements in
+# main_test_functions.py) from a manifest. The rows are sorted by image number.
+
+def construct_numbers_of_table_elements(manifest):
+    completed_pages = manifest['completed_pages']
+    numbers_of_table_elements = sorted(completed_pages.values())
+    return numbers_of_table_elements
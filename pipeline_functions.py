@@ -0,0 +1,239 @@
+# The functions in this file implement a simple staged pipeline. A pipeline
+# consists of a sequence of stages, e.g. loading, detection, rendering and
+# writing in the case of multiple_logbooks_test. Each item (e.g. a page) passes
+# through the stages in order, but different items can be in different stages
+# at the same time, so that, for example, the next page is loaded and the
+# previous page is written while the current page is being processed.
+
+# Each stage has a number of threads of its own, and the stages are connected
+# by bounded queues. When the output queue of a stage is full, the threads of
+# the stage wait until the next stage has taken an item from the queue. This
+# so-called backpressure guarantees that a fast stage (e.g. the loading of
+# images) cannot fill the memory with items when a later stage (e.g. the
+# detection) is the bottleneck. The number of items in the pipeline is bounded
+# by the sizes of the queues and the numbers of threads.
+
+# Threads are enough for parallelism here, since the heavy stages either call
+# functions of cv2, which release the GIL, or pass the work on to worker
+# processes (see the detection stage of multiple_logbooks_test).
+
+# A stage is represented by a list of the following five objects:
+# 1) The name of the stage.
+# 2) The stage function, which takes an item and returns the item passed on to
+#    the next stage.
+# 3) The number of threads of the stage.
+# 4) The size of the output queue of the stage.
+# 5) The statistics of the stage, i.e., a list [number_of_items, busy_time,
+#    input_wait_time, output_wait_time], where busy_time is the total time
+#    spent by the threads of the stage in the stage function, input_wait_time
+#    is the total time spent waiting for items from the previous stage and
+#    output_wait_time is the total time spent waiting for space in the output
+#    queue (i.e., the time lost to backpressure).
+
+# If a stage has more than one thread, its threads may finish the items in a
+# different order than they received them. If preserve_order is True (see
+# run_pipeline), the items are nevertheless passed on to the next stage, and
+# yielded at the end, in their original order: an item finished ahead of its
+# turn is held back in a so-called reorder window of the stage until the items
+# before it have been passed on. The window of a stage holds at most as many
+# items as the stage has threads; a thread whose item does not fit into the
+# window waits, so that the reordering cannot fill the memory either. Otherwise,
+# the items are passed on in the order in which they are finished.
+
+import threading
+import queue
+import time
+
+def create_pipeline_stage(name, stage_function, num_threads, output_queue_size):
+    stage_statistics = [0, 0.0, 0.0, 0.0]
+    pipeline_stage = [name,
+                      stage_function,
+                      max(1, num_threads),
+                      max(1, output_queue_size),
+                      stage_statistics]
+    return pipeline_stage
+
+# The generator function below passes the given items through the stages and
+# yields the outputs of the last stage. The statistics of the stages are
+# updated as the items pass through.
+
+# The items are passed between the stages as [sequence_number, item] lists,
+# where sequence_number is the position of the item among the given items.
+
+# If a stage function raises an exception, the pipeline is stopped and the
+# exception is re-raised by the generator. The pipeline is also stopped if the
+# consumer of the generator stops iterating. In either case, the items that are
+# being processed by the stage functions are finished before the generator
+# returns, but no new items are started.
+
+def run_pipeline(items, pipeline_stages, preserve_order=False):
+    stop_event = threading.Event()
+    # The object end_marker is put into a queue after the last item.
+    end_marker = object()
+    errors = []
+    first_queue_size = 2 * pipeline_stages[0][2]
+    queues = [queue.Queue(first_queue_size)]
+    queues.extend(queue.Queue(pipeline_stage[3])
+                  for pipeline_stage in pipeline_stages)
+    # The reorder window of each stage is represented by a list
+    # [condition, next_sequence_number, held_items], where
+    # next_sequence_number is the sequence number of the next item to be
+    # passed on, and held_items maps sequence numbers to the items held back.
+    reorder_windows = [[threading.Condition(), 0, {}]
+                       for _ in pipeline_stages]
+    # Timeouts are used in the two functions below so that the threads notice
+    # when the pipeline has been stopped. The return value of put_item tells
+    # whether the item was put into the queue, and get_item returns end_marker
+    # if the pipeline has been stopped.
+    def put_item(item_queue, item):
+        while not stop_event.is_set():
+            try:
+                item_queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+    def get_item(item_queue):
+        while not stop_event.is_set():
+            try:
+                return item_queue.get(timeout=0.1)
+            except queue.Empty:
+                continue
+        return end_marker
+    # The function below passes an item finished by the stage k on to the
+    # next stage, in order if preserve_order is True.
+    def pass_item_on(k, sequence_number, item):
+        output_queue = queues[k + 1]
+        if not preserve_order:
+            put_item(output_queue, [sequence_number, item])
+            return
+        condition, _, held_items = reorder_windows[k]
+        window_size = pipeline_stages[k][2]
+        with condition:
+            while (sequence_number >= reorder_windows[k][1] + window_size
+                   and not stop_event.is_set()):
+                condition.wait(0.1)
+            held_items[sequence_number] = item
+            while reorder_windows[k][1] in held_items:
+                next_sequence_number = reorder_windows[k][1]
+                put_item(output_queue,
+                         [next_sequence_number,
+                          held_items.pop(next_sequence_number)])
+                reorder_windows[k][1] += 1
+            condition.notify_all()
+    def feed_items():
+        try:
+            for sequence_number, item in enumerate(items):
+                if not put_item(queues[0], [sequence_number, item]):
+                    return
+            put_item(queues[0], end_marker)
+        except Exception as exception:
+            errors.append(exception)
+            stop_event.set()
+    def run_stage_thread(k, finished_threads, statistics_lock):
+        _, stage_function, num_threads, _, stage_statistics = (
+            pipeline_stages[k]
+        )
+        input_queue = queues[k]
+        output_queue = queues[k + 1]
+        while True:
+            wait_start_time = time.perf_counter()
+            entry = get_item(input_queue)
+            input_wait_time = time.perf_counter() - wait_start_time
+            if entry is end_marker:
+                # Let the other threads of the stage see the end marker too.
+                # The last thread to finish passes the end marker on.
+                put_item(input_queue, end_marker)
+                with statistics_lock:
+                    stage_statistics[2] += input_wait_time
+                    finished_threads[0] += 1
+                    last_thread = finished_threads[0] == num_threads
+                if last_thread:
+                    put_item(output_queue, end_marker)
+                return
+            sequence_number, item = entry
+            busy_start_time = time.perf_counter()
+            try:
+                item = stage_function(item)
+            except Exception as exception:
+                errors.append(exception)
+                stop_event.set()
+                return
+            busy_time = time.perf_counter() - busy_start_time
+            # The output wait time includes the time spent waiting for room
+            # in the reorder window.
+            wait_start_time = time.perf_counter()
+            pass_item_on(k, sequence_number, item)
+            output_wait_time = time.perf_counter() - wait_start_time
+            with statistics_lock:
+                stage_statistics[0] += 1
+                stage_statistics[1] += busy_time
+                stage_statistics[2] += input_wait_time
+                stage_statistics[3] += output_wait_time
+    threads = [threading.Thread(target=feed_items, daemon=True)]
+    for k, pipeline_stage in enumerate(pipeline_stages):
+        finished_threads = [0]
+        statistics_lock = threading.Lock()
+        for _ in range(pipeline_stage[2]):
+            threads.append(threading.Thread(
+                target=run_stage_thread,
+                args=[k, finished_threads, statistics_lock],
+                daemon=True
+            ))
+    for thread in threads:
+        thread.start()
+    try:
+        while True:
+            entry = get_item(queues[-1])
+            if entry is end_marker:
+                break
+            yield entry[1]
+        if errors:
+            raise errors[0]
+    finally:
+        stop_event.set()
+        for thread in threads:
+            thread.join()
+
+# The following function adds the statistics of the stages of one pipeline run
+# to those of another (e.g. in order to compute totals over several logbooks).
+
+def accumulate_pipeline_statistics(total_statistics,
+                                   pipeline_stages,
+                                   elapsed_time):
+    if not total_statistics:
+        total_statistics.extend([0.0] + [[0, 0.0, 0.0, 0.0]
+                                         for _ in pipeline_stages])
+    total_statistics[0] += elapsed_time
+    for pipeline_stage, stage_totals in zip(pipeline_stages,
+                                            total_statistics[1:]):
+        for k, value in enumerate(pipeline_stage[4]):
+            stage_totals[k] += value
+
+# The function below prints the utilisation of each stage, i.e., the fraction
+# of the elapsed time its threads spent in the stage function. The stage with
+# the highest utilisation is the one that limits the throughput of the
+# pipeline; the stages before it spend their time waiting for space in their
+# output queues, and the stages after it spend their time waiting for items.
+
+def print_pipeline_utilisation(pipeline_stages, elapsed_time, stage_statistics):
+    pipeline_utilisation_string = 'Pipeline utilisation: \n'
+    for pipeline_stage, statistics in zip(pipeline_stages, stage_statistics):
+        name, _, num_threads, _, _ = pipeline_stage
+        number_of_items, busy_time, input_wait_time, output_wait_time = (
+            statistics
+        )
+        thread_time = max(elapsed_time * num_threads, 1e-9)
+        pipeline_utilisation_string += (
+            '{}: {} items, threads: {}, '.format(name,
+                                                 number_of_items,
+                                                 num_threads)
+            + 'busy {:.0f}%, '.format(100 * busy_time / thread_time)
+            + 'waiting for input {:.0f}%, '.format(
+                100 * input_wait_time / thread_time
+            )
+            + 'waiting for output {:.0f}% \n'.format(
+                100 * output_wait_time / thread_time
+            )
+        )
+    print(pipeline_utilisation_string)
@@ -0,0 +1,115 @@
+# The functions in this file make it possible to draw the progress images of a
+# page long after the page has been processed. Drawing the progress images
+# (see detect_horizontal_or_vertical_table_lines in
+# main_computer_vision_functions.py) means constructing and saving more than
+# twenty full-resolution images per page, which is a waste of time if nobody
+# ever looks at them.
+
+# Instead, the detection can record the so-called progress geometry of a page,
+# i.e., the line segments, rectangles and table lines that the progress images
+# are drawn from. The progress geometry of a page takes only a few kilobytes,
+# and the progress images drawn from it later are exactly the same as the ones
+# drawn during the detection.
+
+# The progress geometry of a page is stored in a compressed .npz file. Each
+# item of the progress geometry of each direction is stored as an int32 array
+# of shape (N, 2, 2), i.e., a list of pairs of points, under the name
+# '<direction>_<item name>', e.g. 'horizontal_filtered_rectangles'.
+
+import numpy as np
+
+import main_computer_vision_functions
+
+PROGRESS_GEOMETRY_DIRECTIONS = ['horizontal', 'vertical']
+
+# The names of the items of the progress geometry of a direction, in the order
+# of the items (see detect_horizontal_or_vertical_table_lines).
+
+PROGRESS_GEOMETRY_ITEM_NAMES = ['lsd_line_segments',
+                                'short_rectangles',
+                                'extended_rectangles',
+                                'merged_rectangles',
+                                'filtered_rectangles',
+                                'table_lines']
+
+# The following function converts a progress geometry into a dictionary of
+# named arrays as described above. It is also used for storing the progress
+# geometry in the result cache (see result_cache_functions.py).
+
+def construct_progress_geometry_arrays(progress_geometry):
+    progress_geometry_arrays = {}
+    for direction, direction_geometry in zip(PROGRESS_GEOMETRY_DIRECTIONS,
+                                             progress_geometry):
+        for item_name, item in zip(PROGRESS_GEOMETRY_ITEM_NAMES,
+                                   direction_geometry):
+            array_name = '{}_{}'.format(direction, item_name)
+            array = np.array(item, dtype=np.int32).reshape(-1, 2, 2)
+            progress_geometry_arrays[array_name] = array
+    return progress_geometry_arrays
+
+# The function below is the inverse of the function above. As in the progress
+# geometry recorded by the detection, the items are point pair arrays (see
+# geometric_array_operations.py), except for the table lines, which are
+# converted back to nested lists of integers. The argument
+# progress_geometry_arrays can be any mapping from the array names to the
+# arrays, e.g. an opened .npz file.
+
+def construct_progress_geometry_from_arrays(progress_geometry_arrays):
+    progress_geometry = []
+    for direction in PROGRESS_GEOMETRY_DIRECTIONS:
+        direction_geometry = []
+        for item_name in PROGRESS_GEOMETRY_ITEM_NAMES:
+            array_name = '{}_{}'.format(direction, item_name)
+            direction_geometry.append(progress_geometry_arrays[array_name])
+        direction_geometry[-1] = direction_geometry[-1].tolist()
+        progress_geometry.append(direction_geometry)
+    return progress_geometry
+
+# The following two functions save the progress geometry of a page into a
+# compressed .npz file and load it back.
+
+def save_progress_geometry(progress_geometry, path):
+    progress_geometry_arrays = construct_progress_geometry_arrays(
+        progress_geometry
+    )
+    np.savez_compressed(path, **progress_geometry_arrays)
+
+def load_progress_geometry(path):
+    with np.load(path) as progress_geometry_arrays:
+        progress_geometry = construct_progress_geometry_from_arrays(
+            progress_geometry_arrays
+        )
+    return progress_geometry
+
+# The following function draws the progress images of a page from its progress
+# geometry. The return value has the same form as the progress images of a
+# table_structure_and_elements_description, i.e., it is the list
+# [horizontal_progress_images, vertical_progress_images, table_lines_image].
+
+def draw_progress_images_from_geometry(image, progress_geometry):
+    horizontal_progress_geometry, vertical_progress_geometry = (
+        progress_geometry
+    )
+    horizontal_progress_images = (
+        main_computer_vision_functions.draw_progress_images(
+            image,
+            horizontal_progress_geometry
+        )
+    )
+    vertical_progress_images = (
+        main_computer_vision_functions.draw_progress_images(
+            image,
+            vertical_progress_geometry
+        )
+    )
+    # The table lines are the last items of the progress geometries.
+    table_lines = (horizontal_progress_geometry[-1]
+                   + vertical_progress_geometry[-1])
+    table_lines_image = main_computer_vision_functions.draw_table_lines_image(
+        image,
+        table_lines
+    )
+    progress_images = [horizontal_progress_images,
+                       vertical_progress_images,
+                       table_lines_image]
+    return progress_images
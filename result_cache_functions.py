@@ -0,0 +1,265 @@
+# The functions in this file implement an on-disk cache of result arrays (see
+# prepare_result_arrays in main_test_functions.py). The same scans are often
+# processed several times with the same parameters, and the cache makes it
+# possible to skip the table line and table element detection in such cases.
+
+# The cache is content-addressed: the key of a page is a hash of the pixel
+# values of the page image and of the parameters which affect the detection
+# results. The name of the page image file plays no role, so a re-exported or
+# copied scan is found in the cache as well.
+
+# When progress images are constructed or progress geometry is recorded, the
+# progress geometry of the page (see progress_geometry_functions.py) is needed
+# as well, since the progress images cannot be constructed from the result
+# arrays alone. In this case, the cache entry also contains the progress
+# geometry, and the key of the entry differs from the key used when the
+# progress geometry is not needed.
+
+# Similarly, when table element images are constructed, the blob image of the
+# page (see detect_table_elements in main_computer_vision_functions.py) is
+# needed, since its antialiased contour edges cannot be recovered from the
+# element label array. In this case, the cache entry also contains the blob
+# image, and the key of the entry is tagged accordingly. Such entries are
+# compressed, since a blob image is as large as the page image itself but
+# consists mostly of zeros.
+
+# Each cache entry is a single .npz file in the cache directory. The
+# modification time of the file is updated whenever the entry is used, so that
+# the entries can be evicted in least-recently-used order when the total size
+# of the cache exceeds a given limit (see evict_cache_entries). Listing the
+# cache directory becomes slow when the cache grows, so the users of the cache
+# keep a running total of the cache size and evict entries only when the total
+# exceeds the limit (see update_cache_size).
+
+# The cache statistics are represented by a list [hits, misses, evictions].
+
+import numpy as np
+import hashlib
+import json
+import os
+import tempfile
+
+import progress_geometry_functions
+
+CACHE_FILE_EXTENSION = '.npz'
+
+# The following function constructs a canonical form of the detection
+# parameters. The Boolean arguments that only determine which images (or
+# progress geometry) are constructed (table_structure_detection_arguments[9],
+# [10] and [11] and table_element_detection_arguments[2]) do not affect the
+# result arrays, and so they are left out. Only whether the progress geometry
+# and the blob image are needed (see includes_progress_geometry and
+# includes_blob_image) is included, since it determines the contents of the
+# cache entry.
+
+def construct_canonical_parameters(table_structure_detection_arguments,
+                                   table_element_detection_arguments):
+    image_argument_indices = [9, 10, 11]
+    structure_parameters = [
+        argument
+        for index, argument in enumerate(table_structure_detection_arguments)
+        if index not in image_argument_indices
+    ]
+    element_parameters = list(table_element_detection_arguments[:2])
+    canonical_parameters = [structure_parameters, element_parameters]
+    if includes_progress_geometry(table_structure_detection_arguments):
+        canonical_parameters.append('progress_geometry')
+    if includes_blob_image(table_element_detection_arguments):
+        canonical_parameters.append('blob_image')
+    canonical_parameters = json.dumps(canonical_parameters)
+    return canonical_parameters
+
+# The function below tells whether the cache entries contain the progress
+# geometry, i.e., whether progress images are constructed or progress geometry
+# is recorded.
+
+def includes_progress_geometry(table_structure_detection_arguments):
+    construct_progress_images = table_structure_detection_arguments[9]
+    record_progress_geometry = table_structure_detection_arguments[11]
+    return construct_progress_images or record_progress_geometry
+
+# The function below tells whether the cache entries contain the blob image,
+# i.e., whether table element images are constructed.
+
+def includes_blob_image(table_element_detection_arguments):
+    construct_table_element_images = table_element_detection_arguments[2]
+    return construct_table_element_images
+
+# The function below computes the cache key of a page. The shape and the data
+# type of the image are included, so that images with the same bytes but
+# different shapes get different keys.
+
+def compute_cache_key(image,
+                      table_structure_detection_arguments,
+                      table_element_detection_arguments):
+    canonical_parameters = construct_canonical_parameters(
+        table_structure_detection_arguments,
+        table_element_detection_arguments
+    )
+    key_hash = hashlib.sha256()
+    key_hash.update(str((image.shape, image.dtype.str)).encode())
+    key_hash.update(np.ascontiguousarray(image).data)
+    key_hash.update(canonical_parameters.encode())
+    cache_key = key_hash.hexdigest()
+    return cache_key
+
+def construct_cache_path(cache_dir, cache_key):
+    cache_path = os.path.join(cache_dir, cache_key + CACHE_FILE_EXTENSION)
+    return cache_path
+
+# The function below returns the cache entry of the given key as a list
+# [result_arrays, progress_geometry, blob_image], or None if the key is not in
+# the cache. The values of progress_geometry and blob_image are None if the
+# entry does not contain them. A missing or unreadable entry (e.g. an entry evicted by
+# another process at the same time) is treated as a cache miss.
+
+# The result arrays are stored under the default names arr_0, arr_1 etc. of
+# np.savez, the progress geometry arrays under their own names (see
+# construct_progress_geometry_arrays in progress_geometry_functions.py) and the
+# blob image under the name BLOB_IMAGE_ARRAY_NAME.
+
+BLOB_IMAGE_ARRAY_NAME = 'blob_image'
+
+def load_cache_entry(cache_dir, cache_key):
+    cache_path = construct_cache_path(cache_dir, cache_key)
+    try:
+        with np.load(cache_path) as cache_entry:
+            number_of_result_arrays = sum(
+                1 for name in cache_entry.files if name.startswith('arr_')
+            )
+            result_arrays = [cache_entry['arr_{}'.format(k)]
+                             for k in range(number_of_result_arrays)]
+            progress_geometry_array_name = '{}_{}'.format(
+                progress_geometry_functions.PROGRESS_GEOMETRY_DIRECTIONS[0],
+                progress_geometry_functions.PROGRESS_GEOMETRY_ITEM_NAMES[0]
+            )
+            if progress_geometry_array_name in cache_entry.files:
+                progress_geometry = (
+                    progress_geometry_functions
+                    .construct_progress_geometry_from_arrays(cache_entry)
+                )
+            else:
+                progress_geometry = None
+            if BLOB_IMAGE_ARRAY_NAME in cache_entry.files:
+                blob_image = cache_entry[BLOB_IMAGE_ARRAY_NAME]
+            else:
+                blob_image = None
+        # Mark the entry as recently used.
+        os.utime(cache_path)
+    except (OSError, ValueError, KeyError):
+        return None
+    return [result_arrays, progress_geometry, blob_image]
+
+# The following function stores result arrays, and the progress geometry and
+# the blob image if they are not None, in the cache. The entry is first written into a temporary file
+# which is then renamed, so that other processes never see a partially written
+# entry. The return value is the size of the entry in bytes.
+
+def store_cache_entry(cache_dir,
+                      cache_key,
+                      result_arrays,
+                      progress_geometry=None,
+                      blob_image=None):
+    cache_path = construct_cache_path(cache_dir, cache_key)
+    if progress_geometry is not None:
+        progress_geometry_arrays = (
+            progress_geometry_functions
+            .construct_progress_geometry_arrays(progress_geometry)
+        )
+    else:
+        progress_geometry_arrays = {}
+    if blob_image is not None:
+        blob_image_arrays = {BLOB_IMAGE_ARRAY_NAME: blob_image}
+        save_function = np.savez_compressed
+    else:
+        blob_image_arrays = {}
+        save_function = np.savez
+    file_descriptor, temporary_path = tempfile.mkstemp(dir=cache_dir,
+                                                       suffix='.tmp')
+    try:
+        with os.fdopen(file_descriptor, 'wb') as cache_file:
+            save_function(cache_file,
+                          *result_arrays,
+                          **progress_geometry_arrays,
+                          **blob_image_arrays)
+        cache_entry_size = os.path.getsize(temporary_path)
+        os.replace(temporary_path, cache_path)
+    except BaseException:
+        os.remove(temporary_path)
+        raise
+    return cache_entry_size
+
+# The following function lists the cache entries as [modification time, size,
+# path] lists.
+
+def list_cache_entries(cache_dir):
+    cache_entries = []
+    for directory_entry in os.scandir(cache_dir):
+        if not directory_entry.name.endswith(CACHE_FILE_EXTENSION):
+            continue
+        try:
+            entry_stat = directory_entry.stat()
+        except OSError:
+            continue
+        cache_entries.append([entry_stat.st_mtime,
+                              entry_stat.st_size,
+                              directory_entry.path])
+    return cache_entries
+
+def compute_cache_size(cache_dir):
+    cache_size = sum(entry[1] for entry in list_cache_entries(cache_dir))
+    return cache_size
+
+# The function below removes the least recently used entries until the total
+# size of the cache is at most EVICTION_TARGET_FRACTION * max_cache_size
+# bytes. Evicting a little more than necessary means that the cache directory
+# is not listed again after each new entry once the cache is full. The return
+# value is the list [number_of_evictions, cache_size], where cache_size is the
+# total size of the remaining entries.
+
+EVICTION_TARGET_FRACTION = 0.9
+
+def evict_cache_entries(cache_dir, max_cache_size):
+    cache_entries = list_cache_entries(cache_dir)
+    cache_size = sum(entry[1] for entry in cache_entries)
+    target_cache_size = EVICTION_TARGET_FRACTION * max_cache_size
+    number_of_evictions = 0
+    for _, entry_size, entry_path in sorted(cache_entries):
+        if cache_size <= target_cache_size:
+            break
+        try:
+            os.remove(entry_path)
+        except OSError:
+            continue
+        cache_size -= entry_size
+        number_of_evictions += 1
+    return [number_of_evictions, cache_size]
+
+# The following function adds the size of a newly stored entry to the running
+# total cache_size of the cache size, and evicts entries only if the total
+# exceeds max_cache_size. Since other processes may use the same cache, the
+# running total is only an estimate, but it is recomputed from the cache
+# directory whenever entries are evicted. The return value is the list
+# [cache_size, number_of_evictions].
+
+def update_cache_size(cache_dir, cache_size, cache_entry_size, max_cache_size):
+    cache_size += cache_entry_size
+    if cache_size <= max_cache_size:
+        return [cache_size, 0]
+    number_of_evictions, cache_size = evict_cache_entries(cache_dir,
+                                                          max_cache_size)
+    return [cache_size, number_of_evictions]
+
+# The following simple function prints the cache statistics.
+
+def print_cache_statistics(cache_statistics):
+    hits, misses, evictions = cache_statistics
+    number_of_lookups = hits + misses
+    hit_rate = hits / number_of_lookups if number_of_lookups > 0 else 0.0
+    cache_statistics_string = (
+        'Result cache hits: {} \n'.format(hits)
+        + 'Result cache misses: {} \n'.format(misses)
+        + 'Result cache hit rate: {:.2f} \n'.format(hit_rate)
+        + 'Result cache evictions: {} \n'.format(evictions)
+    )
+    print(cache_statistics_string)
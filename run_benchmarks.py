@@ -0,0 +1,73 @@
+import argparse
+import sys
+import os
+
+import benchmark_functions
+
+parser = argparse.ArgumentParser('Arguments for running the benchmarks of the table segmentation functions.')
+
+parser.add_argument('--INPUT_DIR', type=str, default='./sample_logbook_data',
+                    help='Directory path for the input images the benchmark inputs are computed from.')
+parser.add_argument('--RECORDED_INPUTS_DIR', type=str, default=None,
+                    help='Directory path for the recorded benchmark inputs. Missing inputs are computed and recorded. By default, the inputs are computed and not recorded.')
+parser.add_argument('--MAX_PAGES_PER_DOCUMENT', type=int, default=None,
+                    help='Maximum number of pages of each document used in the benchmarks. By default, all pages are used.')
+parser.add_argument('--BENCHMARKS', type=str, nargs='+', default=None,
+                    help='Names (or name prefixes) of the benchmarks to run. By default, all benchmarks are run.')
+parser.add_argument('--REPEATS', type=int, default=5,
+                    help='Number of measured rounds of each benchmark.')
+parser.add_argument('--BASELINE_PATH', type=str, default='./benchmark_baseline.json',
+                    help='File path for the baseline benchmark results.')
+parser.add_argument('--SAVE_BASELINE', action='store_true',
+                    help='Argument defining whether the results are saved as the new baseline instead of being compared with the baseline.')
+parser.add_argument('--REGRESSION_THRESHOLD', type=float, default=0.2,
+                    help='Allowed relative increase of the time per call and the peak memory compared with the baseline.')
+
+args = parser.parse_args()
+
+# The detection arguments used when the benchmark inputs are computed. The
+# values are the default values of run_main_tests.py. The Boolean image
+# arguments are irrelevant for the benchmarks.
+table_structure_detection_arguments = [4, 50, 50, 0.1, 0.1, 150, 300, 750,
+                                       1500, False, False, False, 0, 200, 1,
+                                       'lsd', 'raster', 'pixels']
+table_element_detection_arguments = [20, 20, False]
+
+if __name__ == '__main__':
+    # The baseline is checked before the benchmarks are run, since collecting
+    # the inputs and running the benchmarks may take several minutes.
+    if not args.SAVE_BASELINE and not os.path.isfile(args.BASELINE_PATH):
+        print('Baseline file not found: {} \n'.format(args.BASELINE_PATH)
+              + 'Create it first by running the benchmarks with '
+              + '--SAVE_BASELINE. \n')
+        sys.exit(1)
+    page_inputs = benchmark_functions.collect_page_inputs(
+        args.INPUT_DIR,
+        args.RECORDED_INPUTS_DIR,
+        table_structure_detection_arguments,
+        table_element_detection_arguments,
+        args.MAX_PAGES_PER_DOCUMENT
+    )
+    benchmarks = benchmark_functions.construct_benchmarks(
+        table_structure_detection_arguments
+    )
+    benchmark_results = benchmark_functions.run_benchmarks(benchmarks,
+                                                           page_inputs,
+                                                           args.REPEATS,
+                                                           args.BENCHMARKS)
+    if args.SAVE_BASELINE:
+        benchmark_functions.save_benchmark_results(benchmark_results,
+                                                   args.BASELINE_PATH)
+        print('Baseline saved: {}'.format(args.BASELINE_PATH))
+    else:
+        baseline_results = benchmark_functions.load_benchmark_results(
+            args.BASELINE_PATH
+        )
+        regressed_benchmarks = benchmark_functions.compare_benchmark_results(
+            benchmark_results,
+            baseline_results,
+            args.REGRESSION_THRESHOLD
+        )
+        if regressed_benchmarks:
+            print('Regressed benchmarks: {}'.format(len(regressed_benchmarks)))
+            sys.exit(1)
@@ -0,0 +1,37 @@
+import argparse
+
+import benchmark_functions
+import main_computer_vision_functions
+
+parser = argparse.ArgumentParser('Arguments for comparing the line engines of the table line detection.')
+
+parser.add_argument('--INPUT_DIR', type=str, default='./sample_logbook_data',
+                    help='Directory path for input images.')
+parser.add_argument('--MAX_PAGES_PER_DOCUMENT', type=int, default=None,
+                    help='Maximum number of pages of each document used in the comparison. By default, all pages are used.')
+parser.add_argument('--REPEATS', type=int, default=3,
+                    help='Number of times each detection is run. The median time is reported.')
+parser.add_argument('--LINE_ASSEMBLY', default=None, choices=main_computer_vision_functions.LINE_ASSEMBLY_METHODS,
+                    help='Method used by the compared line engines for assembling the table lines. The reference always uses the default method. By default, the compared line engines use the default method as well.')
+
+parser.add_argument('--LINE_FIT', default=None, choices=main_computer_vision_functions.LINE_FIT_METHODS,
+                    help='Method used by the compared line engines for fitting the table lines. The reference always uses the default method. By default, the compared line engines use the default method as well.')
+
+args = parser.parse_args()
+
+# The detection arguments used when the table lines are computed. The values
+# are the default values of run_main_tests.py, and the line engine (the
+# third last argument) is replaced with each of the line engines in turn.
+table_structure_detection_arguments = [4, 50, 50, 0.1, 0.1, 150, 300, 750,
+                                       1500, False, False, False, 0, 200, 1,
+                                       'lsd', 'raster', 'pixels']
+
+if __name__ == '__main__':
+    benchmark_functions.run_line_engine_comparison(
+        args.INPUT_DIR,
+        table_structure_detection_arguments,
+        args.REPEATS,
+        args.MAX_PAGES_PER_DOCUMENT,
+        args.LINE_ASSEMBLY,
+        args.LINE_FIT
+    )
@@ -0,0 +1,39 @@
+import argparse
+import os
+
+import benchmark_functions
+import main_computer_vision_functions
+
+parser = argparse.ArgumentParser('Arguments for comparing the tiled line segment detection with the detection in the whole page.')
+
+parser.add_argument('--INPUT_DIR', type=str, default='./sample_logbook_data',
+                    help='Directory path for input images.')
+parser.add_argument('--MAX_PAGES_PER_DOCUMENT', type=int, default=None,
+                    help='Maximum number of pages of each document used in the benchmark. By default, all pages are used.')
+parser.add_argument('--LSD_TILE_SIZES', type=int, nargs='+', default=[1024, 2048],
+                    help='Tile sizes compared with the detection in the whole page.')
+parser.add_argument('--LSD_TILE_OVERLAP', type=int, default=200,
+                    help='Number of pixels by which the tiles are extended on each side.')
+parser.add_argument('--NUM_PAGE_THREADS', type=int, default=os.cpu_count(),
+                    help='Number of threads detecting the line segments of the tiles in parallel.')
+parser.add_argument('--REPEATS', type=int, default=3,
+                    help='Number of times each detection is run. The median time is reported.')
+
+args = parser.parse_args()
+
+# The detection arguments used when the table lines are computed. The values
+# are the default values of run_main_tests.py.
+table_structure_detection_arguments = [4, 50, 50, 0.1, 0.1, 150, 300, 750,
+                                       1500, False, False, False, 0, 200, 1,
+                                       'lsd', 'raster', 'pixels']
+
+if __name__ == '__main__':
+    main_computer_vision_functions.set_num_page_threads(args.NUM_PAGE_THREADS)
+    benchmark_functions.run_lsd_tiling_benchmark(
+        args.INPUT_DIR,
+        table_structure_detection_arguments,
+        args.LSD_TILE_SIZES,
+        args.LSD_TILE_OVERLAP,
+        args.REPEATS,
+        args.MAX_PAGES_PER_DOCUMENT
+    )
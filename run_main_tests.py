@@ -4,7 +4,10 @@
 # Modified by Mikko Lipsanen (6.9.2023)
 
 import argparse
+import main_computer_vision_functions
 import main_test_functions
+import segmentation_server_functions
+import spool_daemon_functions
 
 parser = argparse.ArgumentParser('Arguments for running table segmentation functions.')
 
@@ -38,10 +41,24 @@ parser.add_argument('--HORIZONTAL_RECTANGLE_LENGTH_LOWER_BOUND', type=int, defau
                     help='Argument for line detection.')
 parser.add_argument('--VERTICAL_RECTANGLE_LENGTH_LOWER_BOUND', type=int, default=1500,
                     help='Argument for line detection.')
+parser.add_argument('--LSD_TILE_SIZE', type=int, default=0,
+                    help='Maximum size of the tiles in which the line segments are detected in parallel. By default, the line segments are detected in the whole page.')
+parser.add_argument('--LSD_TILE_OVERLAP', type=int, default=200,
+                    help='Number of pixels by which the tiles of the line segment detection are extended on each side.')
+parser.add_argument('--COARSE_TO_FINE_SCALE', type=int, default=1,
+                    help='Factor by which the page is downscaled for finding the table lines, which are then refined at full resolution. By default, the table lines are detected at full resolution.')
+parser.add_argument('--LINE_ENGINE', default='lsd', choices=main_computer_vision_functions.LINE_ENGINES,
+                    help='Method used for finding the line-like structures of the page: one of the line segment detectors or morphological operations. The coarse-to-fine detection is not used with morphological operations, and the tiles are used only with the default line segment detector.')
+parser.add_argument('--LINE_ASSEMBLY', default='raster', choices=main_computer_vision_functions.LINE_ASSEMBLY_METHODS,
+                    help='Method used for assembling the table lines from the line segments: drawing and merging rectangles or chaining the line segments directly. The morphological line engine always uses the former.')
+parser.add_argument('--LINE_FIT', default='pixels', choices=main_computer_vision_functions.LINE_FIT_METHODS,
+                    help='Method used for fitting the table lines: to the pixels of the drawn line segments or directly to the endpoints of the line segments. The morphological line engine always uses the former.')
 parser.add_argument('--CONSTRUCT_PROGRESS_IMAGES', action='store_false',
                     help='Argument defining whether images illustrating the functioning of the table line detection algorithm are created.')
 parser.add_argument('--CONSTRUCT_TABLE_LINE_IMAGE', action='store_false',
                     help='Argument defining whether images showing the detected table lines are created.')
+parser.add_argument('--RECORD_PROGRESS_GEOMETRY', action='store_true',
+                    help='Argument defining whether the geometry needed for drawing the progress images later is saved.')
 parser.add_argument('--REMOVED_LINE_THICKNESS', type=int, default=20,
                     help='Argument for table element detection.')
 parser.add_argument('--CONTOUR_THICKNESS', type=int, default=20,
@@ -50,9 +67,70 @@ parser.add_argument('--CONSTRUCT_TABLE_ELEMENT_IMAGES', action='store_false',
                     help='Argument defining whether images showing the detected table elements are created.')
 parser.add_argument('--CONSTRUCT_TABLE_ELEMENT_CELL_POSITION_IMAGE', action='store_false', 
                     help='Argument defining whether table element cell position analysis image is created.')
+parser.add_argument('--NUM_WORKERS', type=int, default=1,
+                    help='Number of worker processes used for processing the pages in parallel.')
+parser.add_argument('--NUM_PAGE_THREADS', type=int, default=1,
+                    help='Number of threads used for processing the independent parts of a single page in parallel.')
+parser.add_argument('--NUM_LOAD_THREADS', type=int, default=1,
+                    help='Number of threads loading the page images.')
+parser.add_argument('--PREFETCH_COUNT', type=int, default=2,
+                    help='Maximum number of loaded page images waiting to be processed.')
+parser.add_argument('--NUM_RENDER_THREADS', type=int, default=1,
+                    help='Number of threads preparing the result images.')
+parser.add_argument('--RENDER_QUEUE_SIZE', type=int, default=1,
+                    help='Maximum number of processed pages waiting for their result images to be prepared.')
+parser.add_argument('--NUM_WRITER_THREADS', type=int, default=1,
+                    help='Number of threads writing the result files.')
+parser.add_argument('--WRITE_QUEUE_SIZE', type=int, default=1,
+                    help='Maximum number of pages waiting for their result files to be written.')
+parser.add_argument('--RESUME', action='store_true',
+                    help='Argument defining whether the pages completed by an earlier run with the same parameters are skipped.')
+parser.add_argument('--CACHE_DIR', type=str, default=None,
+                    help='Directory path for the result cache. By default, no cache is used.')
+parser.add_argument('--CACHE_SIZE_LIMIT', type=int, default=10240,
+                    help='Maximum size of the result cache in megabytes.')
+parser.add_argument('--SHARD_INDEX', type=int, default=0,
+                    help='Index of the shard processed by this run, between 0 and SHARD_COUNT - 1.')
+parser.add_argument('--SHARD_COUNT', type=int, default=1,
+                    help='Number of shards the input data is divided into.')
+parser.add_argument('--SHARD_BY_PAGES', action='store_true',
+                    help='Argument defining whether the input data is divided into shards by pages instead of documents.')
+parser.add_argument('--TIMING_EVENTS_PATH', type=str, default=None,
+                    help='File path for the JSON Lines file of per-stage timing events. By default, no timing events are recorded.')
+parser.add_argument('--RESOURCE_ACCOUNTING', action='store_true',
+                    help='Argument defining whether memory usage and CPU times are recorded with the timing events.')
+parser.add_argument('--SPOOL_DIR', type=str, default=None,
+                    help='Directory path for the spool directory watched in the daemon mode. By default, the daemon mode is not used.')
+parser.add_argument('--JOB_DATABASE', type=str, default='./spool_jobs.sqlite3',
+                    help='File path for the job queue database of the daemon mode.')
+parser.add_argument('--POLL_INTERVAL', type=float, default=5,
+                    help='Number of seconds between the scans of the spool directory.')
+parser.add_argument('--SETTLE_TIME', type=float, default=10,
+                    help='Number of seconds a file in the spool directory must stay unmodified before it is queued.')
+parser.add_argument('--MAX_ATTEMPTS', type=int, default=3,
+                    help='Number of times the processing of a page is attempted before the job is marked dead.')
+parser.add_argument('--JOB_TIMEOUT', type=float, default=600,
+                    help='Number of seconds, measured from the start of a job in a worker process, after which an unfinished job of the daemon mode is counted as a failed attempt and the worker processes are restarted.')
+parser.add_argument('--EXIT_WHEN_IDLE', action='store_true',
+                    help='Argument defining whether the daemon exits when the job queue is empty.')
+parser.add_argument('--ENQUEUE', type=str, nargs='+', default=None,
+                    help='File paths of page images added to the job queue with the priority PRIORITY. The program exits after adding the jobs.')
+parser.add_argument('--PRIORITY', type=int, default=0,
+                    help='Priority of the jobs added with ENQUEUE. Jobs with higher priorities are processed first.')
+parser.add_argument('--SERVER_PORT', type=int, default=None,
+                    help='Port of the local HTTP segmentation server. By default, the server is not started.')
+parser.add_argument('--SERVER_HOST', type=str, default='127.0.0.1',
+                    help='Host address the HTTP segmentation server listens on.')
+parser.add_argument('--REQUEST_QUEUE_LIMIT', type=int, default=64,
+                    help='Maximum number of requests waiting for a worker process. Further requests are rejected.')
 
 args = parser.parse_args()
 
+if not 0 <= args.SHARD_INDEX < args.SHARD_COUNT:
+    parser.error('SHARD_INDEX must be between 0 and SHARD_COUNT - 1.')
+if args.RESOURCE_ACCOUNTING and args.TIMING_EVENTS_PATH is None:
+    parser.error('RESOURCE_ACCOUNTING requires TIMING_EVENTS_PATH.')
+
 # Result array filename related variables.
 HORIZONTAL_TABLE_LINES_FILE_SUFFIX = 'horizontal_table_lines'
 VERTICAL_TABLE_LINES_FILE_SUFFIX = 'vertical_table_lines'
@@ -84,7 +162,14 @@ table_structure_detection_arguments = [
     args.HORIZONTAL_RECTANGLE_LENGTH_LOWER_BOUND,
     args.VERTICAL_RECTANGLE_LENGTH_LOWER_BOUND,
     args.CONSTRUCT_PROGRESS_IMAGES,
-    args.CONSTRUCT_TABLE_LINE_IMAGE
+    args.CONSTRUCT_TABLE_LINE_IMAGE,
+    args.RECORD_PROGRESS_GEOMETRY,
+    args.LSD_TILE_SIZE,
+    args.LSD_TILE_OVERLAP,
+    args.COARSE_TO_FINE_SCALE,
+    args.LINE_ENGINE,
+    args.LINE_ASSEMBLY,
+    args.LINE_FIT
 ]
 table_element_detection_arguments = [
     args.REMOVED_LINE_THICKNESS,
@@ -116,20 +201,83 @@ result_image_file_suffixes = [
     TABLE_ELEMENT_CELL_POSITION_IMAGE_FILE_SUFFIX
 ]
 
-if args.RUN_RANDOM_SAMPLE_TEST:
-    main_test_functions.random_sample_test(
-        table_structure_detection_arguments,
-        table_element_detection_arguments,
-        args.CONSTRUCT_TABLE_ELEMENT_CELL_POSITION_IMAGE,
-        data_dir
-    )
-else:
-    main_test_functions.multiple_logbooks_test(
-        table_structure_detection_arguments,
-        table_element_detection_arguments,
-        args.CONSTRUCT_TABLE_ELEMENT_CELL_POSITION_IMAGE,
-        data_dir,
-        save_dirs_to_create,
-        result_array_file_suffixes,
-        result_image_file_suffixes
-    )
+# The main test functions are only run when this file is executed as a script.
+# Worker processes which are started (instead of forked) import this file, and
+# they must not start a test run of their own.
+if __name__ == '__main__':
+    if args.ENQUEUE is not None:
+        connection = spool_daemon_functions.open_job_database(args.JOB_DATABASE)
+        for path in args.ENQUEUE:
+            if not spool_daemon_functions.enqueue_job(connection,
+                                                      path,
+                                                      args.PRIORITY):
+                print('Already in the job queue: {}'.format(path))
+        spool_daemon_functions.print_job_counts(
+            spool_daemon_functions.count_jobs(connection)
+        )
+        connection.close()
+    elif args.SERVER_PORT is not None:
+        segmentation_server_functions.run_segmentation_server(
+            table_structure_detection_arguments,
+            table_element_detection_arguments,
+            args.SERVER_HOST,
+            args.SERVER_PORT,
+            args.NUM_WORKERS,
+            args.REQUEST_QUEUE_LIMIT,
+            cache_dir=args.CACHE_DIR,
+            max_cache_size=args.CACHE_SIZE_LIMIT * 1024 ** 2,
+            num_page_threads=args.NUM_PAGE_THREADS
+        )
+    elif args.SPOOL_DIR is not None:
+        spool_daemon_functions.run_spool_daemon(
+            table_structure_detection_arguments,
+            table_element_detection_arguments,
+            args.CONSTRUCT_TABLE_ELEMENT_CELL_POSITION_IMAGE,
+            args.SPOOL_DIR,
+            args.JOB_DATABASE,
+            save_dirs_to_create,
+            result_array_file_suffixes,
+            result_image_file_suffixes,
+            args.NUM_WORKERS,
+            args.POLL_INTERVAL,
+            args.SETTLE_TIME,
+            args.MAX_ATTEMPTS,
+            args.EXIT_WHEN_IDLE,
+            args.CACHE_DIR,
+            args.CACHE_SIZE_LIMIT * 1024 ** 2,
+            args.JOB_TIMEOUT
+        )
+    elif args.RUN_RANDOM_SAMPLE_TEST:
+        main_test_functions.random_sample_test(
+            table_structure_detection_arguments,
+            table_element_detection_arguments,
+            args.CONSTRUCT_TABLE_ELEMENT_CELL_POSITION_IMAGE,
+            data_dir,
+            args.NUM_PAGE_THREADS
+        )
+    else:
+        main_test_functions.multiple_logbooks_test(
+            table_structure_detection_arguments,
+            table_element_detection_arguments,
+            args.CONSTRUCT_TABLE_ELEMENT_CELL_POSITION_IMAGE,
+            data_dir,
+            save_dirs_to_create,
+            result_array_file_suffixes,
+            result_image_file_suffixes,
+            args.NUM_WORKERS,
+            args.PREFETCH_COUNT,
+            args.NUM_WRITER_THREADS,
+            args.WRITE_QUEUE_SIZE,
+            args.RESUME,
+            args.CACHE_DIR,
+            args.CACHE_SIZE_LIMIT * 1024 ** 2,
+            args.SHARD_INDEX,
+            args.SHARD_COUNT,
+            args.SHARD_BY_PAGES,
+            args.TIMING_EVENTS_PATH,
+            args.RESOURCE_ACCOUNTING,
+            args.NUM_LOAD_THREADS,
+            args.NUM_RENDER_THREADS,
+            args.RENDER_QUEUE_SIZE,
+            args.NUM_PAGE_THREADS
+        )
@@ -0,0 +1,22 @@
+import argparse
+import sys
+
+import shard_functions
+
+parser = argparse.ArgumentParser('Arguments for merging the results of sharded table segmentation runs.')
+
+parser.add_argument('--SHARD_RESULTS_DIRS', type=str, nargs='+', required=True,
+                    help='Directory paths for the results directories of the shard runs.')
+parser.add_argument('--RESULTS_DIR', type=str, default='./results',
+                    help='Directory path for the merged results.')
+parser.add_argument('--INPUT_DIR', type=str, default='./sample_logbook_data',
+                    help='Directory path for the input images of the shard runs.')
+
+args = parser.parse_args()
+
+if __name__ == '__main__':
+    problems = shard_functions.merge_shard_results(args.SHARD_RESULTS_DIRS,
+                                                   args.RESULTS_DIR,
+                                                   args.INPUT_DIR)
+    if problems:
+        sys.exit(1)
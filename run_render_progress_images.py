@@ -0,0 +1,34 @@
+import argparse
+
+import main_test_functions
+
+parser = argparse.ArgumentParser('Arguments for drawing progress images from recorded progress geometry.')
+
+parser.add_argument('--INPUT_DIR', type=str, default='./sample_logbook_data',
+                    help='Directory path for the input images of the run that recorded the progress geometry.')
+parser.add_argument('--RESULTS_DIR', type=str, default='./results',
+                    help='Directory path for the results of the run that recorded the progress geometry.')
+parser.add_argument('--PROGRESS_IMAGES_SAVE_SUBDIR', type=str, default='progress_images',
+                    help='Directory path for the progress geometry files and the progress images.')
+parser.add_argument('--DOCUMENTS', type=str, nargs='+', default=None,
+                    help='Names of the documents whose progress images are drawn. By default, all documents in INPUT_DIR are used.')
+parser.add_argument('--IMAGE_NUMBERS', type=int, nargs='+', default=None,
+                    help='Image numbers of the pages whose progress images are drawn. By default, all pages with recorded progress geometry are used.')
+
+args = parser.parse_args()
+
+if __name__ == '__main__':
+    if args.DOCUMENTS is not None:
+        logbook_list = args.DOCUMENTS
+    else:
+        logbook_list = main_test_functions.construct_document_list(
+            args.INPUT_DIR
+        )
+    for logbook in logbook_list:
+        main_test_functions.render_logbook_progress_images(
+            logbook,
+            args.INPUT_DIR,
+            args.RESULTS_DIR,
+            args.PROGRESS_IMAGES_SAVE_SUBDIR,
+            args.IMAGE_NUMBERS
+        )
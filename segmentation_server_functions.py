@@ -0,0 +1,285 @@
+# The functions in this file implement a small local HTTP server which makes
+# the table segmentation available to other programs, e.g. a transcription
+# tool, without paying the cost of starting Python, importing cv2 and creating
+# the LSDDetector instance for every page. The pages are processed by a pool of
+# warm worker processes (see initialize_worker_process in
+# main_test_functions.py).
+
+# A page is segmented by sending the encoded page image (e.g. the contents of a
+# JPEG file) as the body of a POST request to the path /segment. The response
+# contains the table lines, the element rectangles and the element centroids of
+# the page (see prepare_result_arrays in main_test_functions.py), either as a
+# JSON object (the default) or, if the query string contains format=npz, as a
+# NumPy .npz file containing all of the result arrays of the page. A GET
+# request to the path /health returns the state of the request queue.
+
+# The requests are handled as follows. The request handler threads decode the
+# page images and put the requests into a bounded request queue; if the queue
+# is full, the server responds with 503 (Service Unavailable) immediately. A
+# single dispatcher thread takes the requests from the queue and sends them to
+# the worker processes one page at a time, so that at most one page per worker
+# is being processed at any given time. When all of the workers are busy, the
+# requests wait in the queue. Each request is completed as soon as its page has
+# been processed, so a request never waits for the processing of other pages
+# once it has been sent to a worker. (Sending several pages to a worker at once
+# would not save anything worth mentioning, since the processing of every page
+# costs the full detection anyway.)
+
+# If cache_dir is not None, the result arrays are cached (see
+# result_cache_functions.py), and the least recently used cache entries are
+# evicted whenever the size of the cache exceeds max_cache_size bytes, in the
+# same way as in multiple_logbooks_test.
+
+# A request is represented by a list of the following four objects: the page
+# image, a threading.Event which is set when the request has been handled, the
+# result arrays of the page (None until the request has been handled) and the
+# error message (None if the processing succeeded).
+
+import numpy as np
+import cv2 as cv
+import multiprocessing
+import http.server
+import urllib.parse
+import threading
+import queue
+import json
+import io
+import os
+
+import main_test_functions
+import result_cache_functions
+
+RESULT_ARRAY_NAMES = ['horizontal_table_lines',
+                      'vertical_table_lines',
+                      'table_lines',
+                      'compressed_element_label_array',
+                      'element_rectangle_array',
+                      'element_centroid_array']
+
+# The function below is executed by the worker processes. It processes the
+# page image of a request and returns the list [result_arrays,
+# cache_entry_size] (see process_page_image in main_test_functions.py). The
+# result images are not needed, so they are not prepared.
+
+def process_page_request(image,
+                         table_structure_detection_arguments,
+                         table_element_detection_arguments,
+                         cache_dir):
+    page_result = main_test_functions.process_page_image(
+        image,
+        0,
+        table_structure_detection_arguments,
+        table_element_detection_arguments,
+        False,
+        cache_dir,
+        construct_result_images=False
+    )
+    result_arrays = page_result[1]
+    cache_entry_size = page_result[6]
+    return [result_arrays, cache_entry_size]
+
+# The function below decodes a page image sent in a request body. The image is
+# decoded in color and then converted to grayscale in the same way as in
+# utilities.load_image, so that the results are the same as in
+# multiple_logbooks_test. None is returned if the body is not an image.
+
+def decode_page_image(body):
+    image = cv.imdecode(np.frombuffer(body, dtype=np.uint8), cv.IMREAD_COLOR)
+    if image is None:
+        return None
+    image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    return image
+
+# The following two functions construct the response bodies. In the JSON
+# response, the element rectangles and centroids are given without the first
+# rows, which describe the background of the image.
+
+def construct_json_response_body(result_arrays):
+    response = {
+        'horizontal_table_lines': result_arrays[0].tolist(),
+        'vertical_table_lines': result_arrays[1].tolist(),
+        'table_lines': result_arrays[2].tolist(),
+        'element_rectangles': result_arrays[4][1:].tolist(),
+        'element_centroids': result_arrays[5][1:].tolist(),
+        'number_of_table_elements': len(result_arrays[4]) - 1
+    }
+    response_body = json.dumps(response).encode()
+    return response_body
+
+def construct_npz_response_body(result_arrays):
+    npz_file = io.BytesIO()
+    np.savez(npz_file, **dict(zip(RESULT_ARRAY_NAMES, result_arrays)))
+    response_body = npz_file.getvalue()
+    return response_body
+
+# The function below is run by the dispatcher thread. The semaphore free_slots
+# has one slot per worker process, and a slot is released when the page of a
+# request has been processed.
+
+# The callbacks of the requests are run by the result handler thread of the
+# worker pool, one at a time, so the list cache_state of the form [cache_dir,
+# cache_size, max_cache_size] is only updated by a single thread (see
+# update_cache_size in result_cache_functions.py).
+
+def dispatch_requests(request_queue,
+                      worker_pool,
+                      free_slots,
+                      page_arguments,
+                      cache_state):
+    def complete_request(request, page_request_result):
+        result_arrays, cache_entry_size = page_request_result
+        if cache_entry_size > 0:
+            cache_dir, cache_size, max_cache_size = cache_state
+            cache_state[1] = result_cache_functions.update_cache_size(
+                cache_dir,
+                cache_size,
+                cache_entry_size,
+                max_cache_size
+            )[0]
+        request[2] = result_arrays
+        request[1].set()
+        free_slots.release()
+    def fail_request(request, exception):
+        request[3] = '{}: {}'.format(type(exception).__name__, exception)
+        request[1].set()
+        free_slots.release()
+    while True:
+        request = request_queue.get()
+        # Wait for an idle worker.
+        free_slots.acquire()
+        worker_pool.apply_async(
+            process_page_request,
+            [request[0]] + page_arguments,
+            callback=lambda page_request_result, request=request:
+                complete_request(request, page_request_result),
+            error_callback=lambda exception, request=request:
+                fail_request(request, exception)
+        )
+
+# The function below constructs the request handler class of the server. The
+# methods of the class refer to the request queue of the server through the
+# enclosing function.
+
+def construct_request_handler_class(request_queue, request_timeout):
+    class SegmentationRequestHandler(http.server.BaseHTTPRequestHandler):
+
+        def send_response_body(self, status, content_type, body):
+            self.send_response(status)
+            self.send_header('Content-Type', content_type)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def send_error_message(self, status, message):
+            body = json.dumps({'error': message}).encode()
+            self.send_response_body(status, 'application/json', body)
+
+        def do_GET(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path != '/health':
+                self.send_error_message(404, 'Unknown path')
+                return
+            body = json.dumps({'queued_requests': request_queue.qsize(),
+                               'queue_limit': request_queue.maxsize}).encode()
+            self.send_response_body(200, 'application/json', body)
+
+        def do_POST(self):
+            url = urllib.parse.urlparse(self.path)
+            if url.path != '/segment':
+                self.send_error_message(404, 'Unknown path')
+                return
+            query = urllib.parse.parse_qs(url.query)
+            response_format = query.get('format', ['json'])[0]
+            if response_format not in ['json', 'npz']:
+                self.send_error_message(400, 'Unknown format')
+                return
+            content_length = int(self.headers.get('Content-Length', 0))
+            image = decode_page_image(self.rfile.read(content_length))
+            if image is None:
+                self.send_error_message(400, 'The body is not an image')
+                return
+            request = [image, threading.Event(), None, None]
+            try:
+                request_queue.put_nowait(request)
+            except queue.Full:
+                self.send_error_message(503, 'The request queue is full')
+                return
+            if not request[1].wait(request_timeout):
+                self.send_error_message(504, 'The request timed out')
+                return
+            if request[3] is not None:
+                self.send_error_message(500, request[3])
+                return
+            if response_format == 'json':
+                body = construct_json_response_body(request[2])
+                self.send_response_body(200, 'application/json', body)
+            else:
+                body = construct_npz_response_body(request[2])
+                self.send_response_body(200, 'application/octet-stream', body)
+
+    return SegmentationRequestHandler
+
+# The following is the main function of this file. It runs the server until
+# it is interrupted (e.g. with Ctrl+C). No images are constructed by the
+# server, so the Boolean image arguments (and the progress geometry argument)
+# are turned off.
+
+# If num_page_threads is larger than one, each worker process runs the
+# independent parts of the processing of a page in parallel, which reduces the
+# latency of a single request when there are more cores than workers.
+
+def run_segmentation_server(table_structure_detection_arguments,
+                            table_element_detection_arguments,
+                            host,
+                            port,
+                            num_workers=1,
+                            queue_limit=64,
+                            request_timeout=300,
+                            cache_dir=None,
+                            max_cache_size=10 * 1024 ** 3,
+                            num_page_threads=1):
+    table_structure_detection_arguments = list(
+        table_structure_detection_arguments
+    )
+    table_structure_detection_arguments[9] = False
+    table_structure_detection_arguments[10] = False
+    table_structure_detection_arguments[11] = False
+    table_element_detection_arguments = list(table_element_detection_arguments)
+    table_element_detection_arguments[2] = False
+    page_arguments = [table_structure_detection_arguments,
+                      table_element_detection_arguments,
+                      cache_dir]
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_size = result_cache_functions.compute_cache_size(cache_dir)
+    else:
+        cache_size = 0
+    cache_state = [cache_dir, cache_size, max_cache_size]
+    worker_pool = multiprocessing.Pool(
+        num_workers,
+        initializer=main_test_functions.initialize_worker_process,
+        initargs=[False, False, num_page_threads]
+    )
+    request_queue = queue.Queue(queue_limit)
+    free_slots = threading.Semaphore(num_workers)
+    dispatcher_thread = threading.Thread(target=dispatch_requests,
+                                         args=[request_queue,
+                                               worker_pool,
+                                               free_slots,
+                                               page_arguments,
+                                               cache_state],
+                                         daemon=True)
+    dispatcher_thread.start()
+    request_handler_class = construct_request_handler_class(request_queue,
+                                                            request_timeout)
+    server = http.server.ThreadingHTTPServer((host, port),
+                                             request_handler_class)
+    print('Serving on http://{}:{} \n'.format(host, port))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        worker_pool.terminate()
+        worker_pool.join()
@@ -0,0 +1,211 @@
+# The functions in this file make it possible to split the processing of a
+# large dataset between several machines, and to merge the results afterwards.
+
+# The dataset is divided into shard_count shards, and a run of
+# multiple_logbooks_test with a given shard_index processes only the logbooks
+# (or, alternatively, the pages) that belong to that shard. The assignment of a
+# logbook or a page to a shard is based on a hash of its name, so it is stable:
+# it does not depend on the machine, on the order in which the files are
+# listed, or on which other logbooks happen to be in the dataset.
+
+# Each shard run writes its results into a results directory of its own. The
+# function merge_shard_results combines the results of the shard runs into a
+# single results directory of the usual form (see README.md), using the
+# manifests of the logbooks (see manifest_functions.py) to check that every
+# page of the dataset has been processed exactly once and with the same
+# parameters.
+
+import hashlib
+import shutil
+import os
+
+import main_test_functions
+import manifest_functions
+
+# The function below determines the shard of a logbook or a page. The argument
+# name is the name of the logbook, or in the case of a page, the string
+# logbook/image_file.
+
+def compute_shard_index(name, shard_count):
+    name_hash = hashlib.sha256(name.encode()).hexdigest()
+    shard_index = int(name_hash, 16) % shard_count
+    return shard_index
+
+def construct_page_name(logbook, image_file):
+    page_name = '{}/{}'.format(logbook, image_file)
+    return page_name
+
+# The following two functions select the logbooks and the pages belonging to a
+# given shard. The order of the lists is preserved.
+
+def select_shard_logbooks(logbook_list, shard_index, shard_count):
+    shard_logbooks = [logbook for logbook in logbook_list
+                      if compute_shard_index(logbook, shard_count)
+                      == shard_index]
+    return shard_logbooks
+
+def select_shard_pages(logbook, page_file_list, shard_index, shard_count):
+    shard_pages = [
+        image_file for image_file in page_file_list
+        if compute_shard_index(construct_page_name(logbook, image_file),
+                               shard_count)
+        == shard_index
+    ]
+    return shard_pages
+
+# The function below collects the completed pages of all of the shard results
+# directories. The return value is a dictionary whose keys are logbooks and
+# whose values are dictionaries mapping the image files of the logbook to lists
+# of the form [shard_results_dir, image_number, number_of_table_elements].
+
+# The function also returns a list of problems found: pages completed in more
+# than one shard, and logbooks whose manifests have different parameter hashes
+# in different shards.
+
+def collect_shard_pages(shard_results_dirs):
+    logbook_pages = {}
+    logbook_parameter_hashes = {}
+    problems = []
+    for shard_results_dir in shard_results_dirs:
+        for logbook in sorted(os.listdir(shard_results_dir)):
+            logbook_save_dir = os.path.join(shard_results_dir, logbook)
+            if not os.path.isdir(logbook_save_dir):
+                continue
+            manifest = manifest_functions.load_manifest(logbook_save_dir)
+            if manifest is None:
+                continue
+            parameter_hash = manifest['parameter_hash']
+            if logbook not in logbook_parameter_hashes:
+                logbook_parameter_hashes[logbook] = parameter_hash
+            elif logbook_parameter_hashes[logbook] != parameter_hash:
+                problems.append(
+                    'Document {}: different parameters in {}'.format(
+                        logbook,
+                        shard_results_dir
+                    )
+                )
+            pages = logbook_pages.setdefault(logbook, {})
+            completed_pages = manifest['completed_pages'].items()
+            for image_file, (image_number, number_of_elements) in completed_pages:
+                if image_file in pages:
+                    problems.append(
+                        'Document {}: page {} completed in {} and {}'.format(
+                            logbook,
+                            image_file,
+                            pages[image_file][0],
+                            shard_results_dir
+                        )
+                    )
+                    continue
+                pages[image_file] = [shard_results_dir,
+                                     image_number,
+                                     number_of_elements]
+    return logbook_pages, logbook_parameter_hashes, problems
+
+# The function below compares the collected pages with the pages of the input
+# dataset and returns a list of the missing pages (as problem descriptions).
+# It also checks that the image numbers agree with the page lists of the
+# dataset.
+
+def find_missing_pages(logbook_pages, data_dir):
+    problems = []
+    logbook_list = main_test_functions.construct_document_list(data_dir)
+    for logbook in sorted(logbook_list):
+        page_file_list = main_test_functions.construct_page_file_list(logbook,
+                                                                      data_dir)
+        pages = logbook_pages.get(logbook, {})
+        for i, image_file in enumerate(page_file_list):
+            if image_file not in pages:
+                problems.append('Document {}: page {} is missing'.format(
+                    logbook,
+                    image_file
+                ))
+            elif pages[image_file][1] != i + 1:
+                problems.append(
+                    'Document {}: page {} has image number {}'.format(
+                        logbook,
+                        image_file,
+                        pages[image_file][1]
+                    )
+                )
+    return problems
+
+# The function below copies the result files of the given image numbers from
+# a logbook save directory of a shard into the merged logbook save directory.
+# The result files of a page are recognized by the prefix image_{image_number}_
+# of their names (see the save functions in main_test_functions.py). The
+# subdirectory structure is preserved.
+
+def copy_page_result_files(shard_logbook_save_dir,
+                           merged_logbook_save_dir,
+                           image_numbers):
+    filename_prefixes = tuple('image_{}_'.format(image_number)
+                              for image_number in image_numbers)
+    for subdir in sorted(os.listdir(shard_logbook_save_dir)):
+        shard_subdir = os.path.join(shard_logbook_save_dir, subdir)
+        if not os.path.isdir(shard_subdir):
+            continue
+        merged_subdir = os.path.join(merged_logbook_save_dir, subdir)
+        os.makedirs(merged_subdir, exist_ok=True)
+        for filename in os.listdir(shard_subdir):
+            if filename.startswith(filename_prefixes):
+                shutil.copy2(os.path.join(shard_subdir, filename),
+                             os.path.join(merged_subdir, filename))
+
+# The following is the main function of this file. It merges the results of the
+# shard runs in shard_results_dirs into results_dir. The input dataset in
+# data_dir is used to check that no page is missing.
+
+# If problems are found, they are printed and nothing is merged. Otherwise, the
+# result files are copied, and a merged manifest and the result array
+# numbers_of_table_elements are saved for each logbook. The return value is the
+# list of problems found.
+
+def merge_shard_results(shard_results_dirs, results_dir, data_dir):
+    logbook_pages, logbook_parameter_hashes, problems = (
+        collect_shard_pages(shard_results_dirs)
+    )
+    problems.extend(find_missing_pages(logbook_pages, data_dir))
+    if problems:
+        for problem in problems:
+            print('{} \n'.format(problem))
+        print('Found {} problems, nothing was merged. \n'.format(
+            len(problems)
+        ))
+        return problems
+    os.makedirs(results_dir, exist_ok=True)
+    for logbook, pages in sorted(logbook_pages.items()):
+        merged_logbook_save_dir = os.path.join(results_dir, logbook)
+        os.makedirs(merged_logbook_save_dir, exist_ok=True)
+        manifest = manifest_functions.construct_empty_manifest(
+            logbook,
+            logbook_parameter_hashes[logbook]
+        )
+        # Group the pages by shard, so that each shard directory is listed
+        # only once.
+        shard_image_numbers = {}
+        for image_file, page in pages.items():
+            shard_results_dir, image_number, number_of_table_elements = page
+            shard_image_numbers.setdefault(shard_results_dir, []).append(
+                image_number
+            )
+            manifest_functions.record_completed_page(manifest,
+                                                     image_file,
+                                                     image_number,
+                                                     number_of_table_elements)
+        for shard_results_dir, image_numbers in shard_image_numbers.items():
+            copy_page_result_files(
+                os.path.join(shard_results_dir, logbook),
+                merged_logbook_save_dir,
+                image_numbers
+            )
+        manifest_functions.save_manifest(manifest, merged_logbook_save_dir)
+        numbers_of_table_elements = (
+            manifest_functions.construct_numbers_of_table_elements(manifest)
+        )
+        main_test_functions.study_and_save_numbers_of_table_elements(
+            numbers_of_table_elements,
+            logbook,
+            [merged_logbook_save_dir]
+        )
+    return problems
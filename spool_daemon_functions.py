@@ -0,0 +1,536 @@
+# The functions in this file implement a daemon mode for processing new scans
+# continuously. Instead of processing a fixed folder tree once, the daemon
+# watches a so-called spool directory, records every new page image in a job
+# queue and lets a pool of warm worker processes process the queued pages as
+# they arrive. The worker processes are started only once (see
+# initialize_worker_process in main_test_functions.py), so the cost of starting
+# the interpreter, importing cv2 and creating the LSDDetector instance is not
+# paid for each new batch of scans.
+
+# The spool directory is expected to have the same structure as the input
+# directory of multiple_logbooks_test, i.e., the page images of each logbook
+# are in a subdirectory of the spool directory. The results are saved in the
+# usual results/<logbook>/ structure. Since the pages of a logbook may arrive
+# in any order, the results of a page are named after the name of its image
+# file instead of its position in the logbook (e.g., the result arrays of the
+# page 2_11.jpg are saved as image_2_11_<suffix>.npy). Only files with the
+# extensions in IMAGE_FILE_EXTENSIONS are considered page images. Since the
+# extension is not a part of the result file names, a page image whose name
+# differs from an earlier page image of the same logbook only by the extension
+# (e.g. 2_11.png after 2_11.jpg) would overwrite the results of the earlier
+# page, so such a page is not processed (see enqueue_job).
+
+# The job queue is stored in an SQLite database, so it survives restarts of the
+# daemon. A job is in one of the following states:
+# queued: the job is waiting to be processed,
+# running: the job has been given to a worker process,
+# done: the job has been processed successfully,
+# dead: the processing of the job has failed max_attempts times, and the job
+#       will not be retried.
+# Queued jobs are processed in the order of decreasing priority, and jobs with
+# the same priority in the order of arrival. A failed job is queued again with
+# a delay that grows with the number of attempts. A job which has not finished
+# within job_timeout seconds of being started by a worker process (e.g. because
+# its worker process was killed) is counted as a failed attempt as well (see
+# run_spool_daemon).
+
+import multiprocessing
+import queue
+import sqlite3
+import time
+import os
+
+import main_test_functions
+import result_cache_functions
+import utilities
+
+JOB_TABLE_DEFINITION = '''
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    path TEXT NOT NULL UNIQUE,
+    logbook TEXT NOT NULL,
+    image_file TEXT NOT NULL,
+    priority INTEGER NOT NULL DEFAULT 0,
+    status TEXT NOT NULL DEFAULT 'queued',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    not_before REAL NOT NULL DEFAULT 0,
+    last_error TEXT,
+    number_of_table_elements INTEGER,
+    created_time REAL NOT NULL,
+    updated_time REAL NOT NULL
+)
+'''
+
+JOB_INDEX_DEFINITION = '''
+CREATE INDEX IF NOT EXISTS jobs_by_status_and_priority
+ON jobs (status, priority DESC, id)
+'''
+
+# A failed job is retried after RETRY_DELAY * attempts seconds.
+
+RETRY_DELAY = 30
+
+# The file name extensions of the page images (compared in lower case). Other
+# files in the spool directory, e.g. partially copied files or thumbnail
+# databases, are ignored.
+
+IMAGE_FILE_EXTENSIONS = ['.jpg', '.jpeg', '.png', '.tif', '.tiff', '.bmp',
+                         '.jp2', '.webp']
+
+# The function below opens the job database and creates the job table if
+# needed.
+
+# Jobs that are in the running state when the database is opened were being
+# processed when the previous daemon was stopped, so they are queued again.
+
+def open_job_database(job_database_path):
+    connection = sqlite3.connect(job_database_path)
+    connection.execute(JOB_TABLE_DEFINITION)
+    connection.execute(JOB_INDEX_DEFINITION)
+    connection.execute(
+        "UPDATE jobs SET status = 'queued', updated_time = ? "
+        "WHERE status = 'running'",
+        [time.time()]
+    )
+    connection.commit()
+    return connection
+
+# The function below adds a job for the given page image to the queue. A page
+# image that already has a job (in any state) is not added again. The return
+# value tells whether a new job was added.
+
+# If another page image of the same logbook with the same name apart from the
+# extension already has a job, the results of the two pages would be saved
+# under the same file names. In this case, the new job is added in the dead
+# state with an error message, so that it is not processed but still shows up
+# in the job counts and in the database.
+
+def enqueue_job(connection, path, priority=0):
+    path = os.path.abspath(path)
+    logbook = os.path.basename(os.path.dirname(path))
+    image_file = os.path.basename(path)
+    existing_job = connection.execute('SELECT id FROM jobs WHERE path = ?',
+                                      [path]).fetchone()
+    if existing_job is not None:
+        return False
+    page_name = os.path.splitext(image_file)[0]
+    # The LIKE pattern finds the candidates, which are then compared exactly,
+    # since the pattern is case-insensitive and _ matches any character.
+    candidate_image_files = connection.execute(
+        'SELECT image_file FROM jobs WHERE logbook = ? AND image_file LIKE ?',
+        [logbook, page_name + '.%']
+    ).fetchall()
+    colliding_image_files = [
+        candidate_image_file
+        for (candidate_image_file,) in candidate_image_files
+        if os.path.splitext(candidate_image_file)[0] == page_name
+    ]
+    if colliding_image_files:
+        status = 'dead'
+        error = 'The results would overwrite the results of {}'.format(
+            colliding_image_files[0]
+        )
+        print('Not processing {}: {} \n'.format(path, error))
+    else:
+        status = 'queued'
+        error = None
+    current_time = time.time()
+    cursor = connection.execute(
+        'INSERT OR IGNORE INTO jobs '
+        '(path, logbook, image_file, priority, status, last_error, '
+        'created_time, updated_time) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+        [path,
+         logbook,
+         image_file,
+         priority,
+         status,
+         error,
+         current_time,
+         current_time]
+    )
+    connection.commit()
+    job_added = cursor.rowcount > 0 and status == 'queued'
+    return job_added
+
+# The following function scans the spool directory and adds a job for every
+# new page image. A file is considered only if it has not been modified during
+# the last settle_time seconds, so that files which are still being copied into
+# the spool directory are not processed prematurely.
+
+# Files directly in the spool directory (i.e., not in a logbook subdirectory)
+# and files which are not page images (see IMAGE_FILE_EXTENSIONS) are ignored.
+# The return value is the number of jobs added.
+
+def scan_spool_directory(connection, spool_dir, settle_time, priority=0):
+    number_of_added_jobs = 0
+    current_time = time.time()
+    for logbook_entry in os.scandir(spool_dir):
+        if not logbook_entry.is_dir():
+            continue
+        for page_entry in os.scandir(logbook_entry.path):
+            if not page_entry.is_file():
+                continue
+            extension = os.path.splitext(page_entry.name)[1].lower()
+            if extension not in IMAGE_FILE_EXTENSIONS:
+                continue
+            try:
+                modification_time = page_entry.stat().st_mtime
+            except OSError:
+                continue
+            if current_time - modification_time < settle_time:
+                continue
+            if enqueue_job(connection, page_entry.path, priority):
+                number_of_added_jobs += 1
+    return number_of_added_jobs
+
+# The function below moves at most max_jobs queued jobs into the running state
+# and returns them as a list of [job_id, path, logbook, image_file] lists.
+
+def claim_jobs(connection, max_jobs):
+    if max_jobs <= 0:
+        return []
+    current_time = time.time()
+    jobs = connection.execute(
+        'SELECT id, path, logbook, image_file FROM jobs '
+        "WHERE status = 'queued' AND not_before <= ? "
+        'ORDER BY priority DESC, id LIMIT ?',
+        [current_time, max_jobs]
+    ).fetchall()
+    for job in jobs:
+        connection.execute(
+            "UPDATE jobs SET status = 'running', attempts = attempts + 1, "
+            'updated_time = ? WHERE id = ?',
+            [current_time, job[0]]
+        )
+    connection.commit()
+    jobs = [list(job) for job in jobs]
+    return jobs
+
+def mark_job_done(connection, job_id, number_of_table_elements):
+    connection.execute(
+        "UPDATE jobs SET status = 'done', last_error = NULL, "
+        'number_of_table_elements = ?, updated_time = ? WHERE id = ?',
+        [number_of_table_elements, time.time(), job_id]
+    )
+    connection.commit()
+
+# The function below queues a running job again without counting the attempt,
+# e.g. when the job was interrupted by a restart of the worker processes.
+
+def requeue_job(connection, job_id):
+    connection.execute(
+        "UPDATE jobs SET status = 'queued', attempts = attempts - 1, "
+        'updated_time = ? WHERE id = ?',
+        [time.time(), job_id]
+    )
+    connection.commit()
+
+# The function below records a failed attempt. The job is queued again, unless
+# the maximum number of attempts has been reached, in which case the job is
+# moved into the dead state. The return value is the new state of the job.
+
+def mark_job_failed(connection, job_id, error, max_attempts):
+    attempts = connection.execute('SELECT attempts FROM jobs WHERE id = ?',
+                                  [job_id]).fetchone()[0]
+    current_time = time.time()
+    status = 'dead' if attempts >= max_attempts else 'queued'
+    connection.execute(
+        'UPDATE jobs SET status = ?, last_error = ?, not_before = ?, '
+        'updated_time = ? WHERE id = ?',
+        [status,
+         error,
+         current_time + RETRY_DELAY * attempts,
+         current_time,
+         job_id]
+    )
+    connection.commit()
+    return status
+
+# The following function returns a dictionary giving the number of jobs in
+# each state.
+
+def count_jobs(connection):
+    rows = connection.execute(
+        'SELECT status, COUNT(*) FROM jobs GROUP BY status'
+    ).fetchall()
+    job_counts = {'queued': 0, 'running': 0, 'done': 0, 'dead': 0}
+    job_counts.update(dict(rows))
+    return job_counts
+
+def print_job_counts(job_counts):
+    job_counts_string = ' '.join('{}: {}'.format(status, count)
+                                 for status, count in job_counts.items())
+    print('Jobs: {} \n'.format(job_counts_string))
+
+# The queue below is set in each worker process by
+# initialize_spool_worker_process. A worker puts the list [claim_number,
+# start_time] into it when it starts a job, so that the daemon can measure the
+# processing time of a job from its actual start rather than from the time the
+# job was given to the worker pool (see run_spool_daemon).
+
+JOB_START_QUEUE = None
+
+def initialize_spool_worker_process(job_start_queue):
+    global JOB_START_QUEUE
+    JOB_START_QUEUE = job_start_queue
+    main_test_functions.initialize_worker_process()
+
+# The function below is executed by the worker processes. It loads a page
+# image, processes it (see process_page_image in main_test_functions.py) and
+# saves the results. The save directories have already been created by the
+# daemon. The argument claim_number identifies the attempt in the messages of
+# JOB_START_QUEUE. The return value is the list [number_of_table_elements,
+# cache_entry_size] (see process_page_image in main_test_functions.py).
+
+def process_spool_job(claim_number,
+                      path,
+                      page_name,
+                      save_dirs,
+                      table_structure_detection_arguments,
+                      table_element_detection_arguments,
+                      construct_table_element_cell_position_image,
+                      result_array_file_suffixes,
+                      result_image_file_suffixes,
+                      cache_dir):
+    JOB_START_QUEUE.put([claim_number, time.time()])
+    image = utilities.load_image(path, grayscale=True)
+    page_result = main_test_functions.process_page_image(
+        image,
+        page_name,
+        table_structure_detection_arguments,
+        table_element_detection_arguments,
+        construct_table_element_cell_position_image,
+        cache_dir
+    )
+    table_structure_and_elements_description = page_result[0]
+    result_arrays = page_result[1]
+    result_images = page_result[2]
+    number_of_table_elements = int(page_result[3][1])
+    cache_entry_size = page_result[6]
+    main_test_functions.save_result_arrays(result_arrays,
+                                           page_name,
+                                           save_dirs,
+                                           result_array_file_suffixes)
+    main_test_functions.save_result_images(
+        result_images,
+        page_name,
+        save_dirs,
+        table_structure_detection_arguments,
+        table_element_detection_arguments,
+        construct_table_element_cell_position_image,
+        result_image_file_suffixes
+    )
+    main_test_functions.save_progress_images(
+        page_name,
+        table_structure_and_elements_description,
+        table_structure_detection_arguments,
+        save_dirs
+    )
+    main_test_functions.save_progress_geometry(
+        page_name,
+        table_structure_and_elements_description,
+        table_structure_detection_arguments,
+        save_dirs
+    )
+    return [number_of_table_elements, cache_entry_size]
+
+# The following simple function creates the pool of worker processes of the
+# daemon together with the queue of job start messages (see JOB_START_QUEUE)
+# and returns the list [worker_pool, job_start_queue].
+
+def create_worker_pool(num_workers):
+    job_start_queue = multiprocessing.Queue()
+    worker_pool = multiprocessing.Pool(
+        num_workers,
+        initializer=initialize_spool_worker_process,
+        initargs=[job_start_queue]
+    )
+    return [worker_pool, job_start_queue]
+
+# The following is the main function of this file. It runs the daemon until it
+# is interrupted (e.g. with Ctrl+C), or if exit_when_idle is True, until the
+# job queue is empty.
+
+# The spool directory is scanned every poll_interval seconds. Each of the
+# num_workers worker processes is given at most two jobs at a time, so that a
+# worker does not become idle while the daemon is handling the results of its
+# previous job.
+
+# If a worker process dies (e.g. because it runs out of memory), the worker
+# pool replaces it, but the job it was processing never finishes. The same
+# happens if the processing of a page gets stuck. Therefore, a job which has
+# not finished within job_timeout seconds from being started by a worker is
+# counted as a failed attempt, and since the worker of the job may still be
+# stuck, the worker pool is replaced by a new one. The other running jobs are
+# queued again without counting the interrupted attempts. A job that is still
+# waiting for a free worker is not timed out, since up to two jobs per worker
+# are given to the worker pool at a time.
+
+# If cache_dir is not None, the result arrays are cached (see
+# result_cache_functions.py), and the least recently used cache entries are
+# evicted whenever the size of the cache exceeds max_cache_size bytes, in the
+# same way as in multiple_logbooks_test.
+
+def run_spool_daemon(table_structure_detection_arguments,
+                     table_element_detection_arguments,
+                     construct_table_element_cell_position_image,
+                     spool_dir,
+                     job_database_path,
+                     save_dirs_to_create,
+                     result_array_file_suffixes,
+                     result_image_file_suffixes,
+                     num_workers=1,
+                     poll_interval=5,
+                     settle_time=10,
+                     max_attempts=3,
+                     exit_when_idle=False,
+                     cache_dir=None,
+                     max_cache_size=10 * 1024 ** 3,
+                     job_timeout=600):
+    connection = open_job_database(job_database_path)
+    if cache_dir is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        cache_size = result_cache_functions.compute_cache_size(cache_dir)
+    worker_pool, job_start_queue = create_worker_pool(num_workers)
+    max_running_jobs = 2 * num_workers
+    # The dictionary running_jobs maps job ids to lists of the form
+    # [path, async_result, claim_number, start_time], where start_time is None
+    # until the job has been started by a worker. Each claimed job gets a new
+    # claim number, so that a late start message of an earlier attempt of the
+    # same job is not mistaken for the start of the current attempt.
+    running_jobs = {}
+    number_of_claims = 0
+    # The save directories of each logbook are created only once.
+    logbook_save_dirs = {}
+    last_scan_time = None
+    try:
+        while True:
+            # Scan the spool directory for new page images.
+            current_time = time.time()
+            if (last_scan_time is None
+                    or current_time - last_scan_time >= poll_interval):
+                number_of_added_jobs = scan_spool_directory(connection,
+                                                            spool_dir,
+                                                            settle_time)
+                last_scan_time = current_time
+                if number_of_added_jobs > 0:
+                    print('Added {} jobs. \n'.format(number_of_added_jobs))
+                    print_job_counts(count_jobs(connection))
+            # Record the start times of the jobs started by the workers.
+            while True:
+                try:
+                    claim_number, start_time = job_start_queue.get_nowait()
+                except queue.Empty:
+                    break
+                for running_job in running_jobs.values():
+                    if running_job[2] == claim_number:
+                        running_job[3] = start_time
+            # Handle the finished jobs.
+            for job_id in list(running_jobs.keys()):
+                path, async_result, _, _ = running_jobs[job_id]
+                if not async_result.ready():
+                    continue
+                del running_jobs[job_id]
+                try:
+                    number_of_table_elements, cache_entry_size = (
+                        async_result.get()
+                    )
+                except Exception as exception:
+                    error = '{}: {}'.format(type(exception).__name__,
+                                            exception)
+                    status = mark_job_failed(connection,
+                                             job_id,
+                                             error,
+                                             max_attempts)
+                    print('Job {} ({}) failed, {}: {} \n'.format(job_id,
+                                                                 path,
+                                                                 status,
+                                                                 error))
+                    continue
+                mark_job_done(connection, job_id, number_of_table_elements)
+                print('Job {} ({}) done, number of elements: {} \n'.format(
+                    job_id,
+                    path,
+                    number_of_table_elements
+                ))
+                # A new cache entry may require evicting old ones.
+                if cache_entry_size > 0:
+                    cache_size = result_cache_functions.update_cache_size(
+                        cache_dir,
+                        cache_size,
+                        cache_entry_size,
+                        max_cache_size
+                    )[0]
+            # Handle the jobs which have not finished in time.
+            current_time = time.time()
+            timed_out_job_ids = [
+                job_id
+                for job_id, (_, _, _, start_time) in running_jobs.items()
+                if (start_time is not None
+                    and current_time - start_time > job_timeout)
+            ]
+            if timed_out_job_ids:
+                for job_id in timed_out_job_ids:
+                    path = running_jobs.pop(job_id)[0]
+                    error = 'Timeout: not finished in {} seconds'.format(
+                        job_timeout
+                    )
+                    status = mark_job_failed(connection,
+                                             job_id,
+                                             error,
+                                             max_attempts)
+                    print('Job {} ({}) failed, {}: {} \n'.format(job_id,
+                                                                 path,
+                                                                 status,
+                                                                 error))
+                worker_pool.terminate()
+                worker_pool.join()
+                for job_id in running_jobs:
+                    requeue_job(connection, job_id)
+                running_jobs = {}
+                worker_pool, job_start_queue = create_worker_pool(num_workers)
+                print('Restarted the worker processes. \n')
+            # Give new jobs to the workers.
+            jobs = claim_jobs(connection, max_running_jobs - len(running_jobs))
+            for job_id, path, logbook, image_file in jobs:
+                if logbook not in logbook_save_dirs:
+                    logbook_save_dirs[logbook] = (
+                        main_test_functions.create_save_directories(
+                            logbook,
+                            save_dirs_to_create,
+                            table_structure_detection_arguments
+                        )
+                    )
+                page_name = os.path.splitext(image_file)[0]
+                async_result = worker_pool.apply_async(
+                    process_spool_job,
+                    [number_of_claims,
+                     path,
+                     page_name,
+                     logbook_save_dirs[logbook],
+                     table_structure_detection_arguments,
+                     table_element_detection_arguments,
+                     construct_table_element_cell_position_image,
+                     result_array_file_suffixes,
+                     result_image_file_suffixes,
+                     cache_dir]
+                )
+                running_jobs[job_id] = [path,
+                                        async_result,
+                                        number_of_claims,
+                                        None]
+                number_of_claims += 1
+            # Stop if there is nothing left to do.
+            if exit_when_idle and not running_jobs:
+                job_counts = count_jobs(connection)
+                if job_counts['queued'] == 0:
+                    print_job_counts(job_counts)
+                    break
+            time.sleep(0.1)
+    finally:
+        # Jobs that are still running are queued again when the daemon is
+        # started the next time (see open_job_database).
+        worker_pool.terminate()
+        worker_pool.join()
+        connection.close()
@@ -6,6 +6,8 @@ import numpy as np
 import cv2 as cv
 import os
 
+import geometric_array_operations
+
 # The function below is used to load images in the current version of the code.
 
 # A whole directory of images is loaded when this function is called. It is
@@ -23,13 +25,39 @@ def load_images(image_dir, grayscale):
         images = [cv.cvtColor(image, cv.COLOR_BGR2GRAY) for image in images]
     return images
 
+# The function below loads a single image. The grayscale argument has the same
+# meaning as in load_images. A file which cannot be read as an image raises a
+# ValueError.
+
+def load_image(path, grayscale):
+    image = cv.imread(path)
+    if image is None:
+        raise ValueError('Unable to read image file {}'.format(path))
+    if grayscale:
+        image = cv.cvtColor(image, cv.COLOR_BGR2GRAY)
+    return image
+
 # The following three functions are simple drawing functions.
 
 # The meaning of the argument cv.LINE_AA is that antialiasing is enabled. The
 # argument -1 used in draw_contours makes the function draw all of the contours
 # in the argument collection contours.
 
+# The lines and rectangles can also be given as point pair arrays (see
+# geometric_array_operations.py), in which case they are drawn by a single call
+# of the function polylines of cv2. This gives exactly the same pixels as
+# drawing them one by one.
+
 def draw_lines(image, lines, color, thickness):
+    if isinstance(lines, np.ndarray):
+        if len(lines) > 0:
+            cv.polylines(image,
+                         list(lines),
+                         False,
+                         color,
+                         thickness,
+                         cv.LINE_AA)
+        return
     for line in lines:
         start_point, end_point = line
         cv.line(image,
@@ -40,6 +68,18 @@ def draw_lines(image, lines, color, thickness):
                 cv.LINE_AA)
 
 def draw_rectangles(image, rectangles, color, thickness):
+    if isinstance(rectangles, np.ndarray):
+        if len(rectangles) > 0:
+            cv.polylines(
+                image,
+                list(geometric_array_operations
+                     .compute_rectangle_array_corners(rectangles)),
+                True,
+                color,
+                thickness,
+                cv.LINE_AA
+            )
+        return
     for rectangle in rectangles:
         top_left_point, bottom_right_point = rectangle
         cv.rectangle(image,